@@ -2,6 +2,8 @@ import argparse
 import pandas as pd
 import numpy as np
 import json, os
+import stage_cache
+from table_io import read_table
 
 """
 Compute driver credit profiles per city based on earning potential and history:
@@ -16,6 +18,9 @@ Outputs:
 - artifacts/credit_profiles.json (grouped by city)
 """
 
+# the only input columns this script reads
+COLUMNS = ['city','store','cee_id','cee_name','final_with_gst','total_orders','attendance','active_days']
+
 
 def _safe(series: pd.Series) -> pd.Series:
     s = pd.to_numeric(series, errors='coerce')
@@ -95,8 +100,13 @@ def compute(df: pd.DataFrame):
     return out
 
 
-def main(input_csv: str, out_csv: str, out_json: str):
-    df = pd.read_csv(input_csv)
+def main(input_csv: str, out_csv: str, out_json: str, force: bool = False):
+    outputs = [out_csv, out_json]
+    key = stage_cache.cache_key(__file__, [input_csv], {})
+    if not force and stage_cache.restore(key, outputs):
+        print(f"[compute_credit_profiles] reused cached {out_csv} and {out_json}")
+        return
+    df = read_table(input_csv, columns=COLUMNS)
     needed = {'city','store','cee_id','cee_name','final_with_gst'}
     missing = needed - set(df.columns)
     if missing:
@@ -111,15 +121,17 @@ def main(input_csv: str, out_csv: str, out_json: str):
         grouped[city] = sub[['cee_id','cee_name','store','credit_score','band','earning_median','orders_per_day','attendance_per_week']].to_dict(orient='records')
     with open(out_json, 'w') as f:
         json.dump(grouped, f, indent=2)
+    stage_cache.store(key, outputs)
     print(f"[compute_credit_profiles] wrote {out_csv} and {out_json}")
 
 
 if __name__ == '__main__':
     ap = argparse.ArgumentParser()
-    ap.add_argument('-i','--input', default='data/rider_week_clean.csv')
+    ap.add_argument('-i','--input', default='data/rider_week_clean.parquet')
     ap.add_argument('-o','--out_csv', default='artifacts/credit_profiles.csv')
     ap.add_argument('-j','--out_json', default='artifacts/credit_profiles.json')
+    ap.add_argument('--force', action='store_true', help='recompute even if cached outputs match')
     args = ap.parse_args()
-    main(args.input, args.out_csv, args.out_json)
+    main(args.input, args.out_csv, args.out_json, force=args.force)
 
 
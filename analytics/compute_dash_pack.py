@@ -2,14 +2,25 @@ import argparse
 import pandas as pd
 import numpy as np
 import json, os
+import stage_cache
+from table_io import read_table
 
 """
 Builds a consolidated analytics pack JSON for multiple dashboard tabs.
 
-Input: data/rider_week_clean.csv (from preprocess_xls)
+Input: data/rider_week_clean.parquet (from preprocess_xls)
 Output: artifacts/dash_pack.json (grouped by city)
 """
 
+# the only input columns this script reads
+COLUMNS = [
+    'city','store','cee_category',
+    'final_with_gst','total_with_arrears_and_deductions','base_pay','incentive_total',
+    'surge_payout','peak_hour_payout','minimum_guarantee','management_fee','deductions_amount',
+    'total_cash_adjustment','total_orders','attendance','online_hours','weekday_orders','weekend_orders',
+    'distance_km'
+]
+
 
 def _nan_to_none(o):
     if isinstance(o, dict):
@@ -131,22 +142,29 @@ def build_pack(df: pd.DataFrame) -> dict:
     return _nan_to_none(pack)
 
 
-def main(input_csv: str, out_json: str):
-    df = pd.read_csv(input_csv)
+def main(input_csv: str, out_json: str, force: bool = False):
+    outputs = [out_json]
+    key = stage_cache.cache_key(__file__, [input_csv], {})
+    if not force and stage_cache.restore(key, outputs):
+        print(f"[compute_dash_pack] reused cached {out_json}")
+        return
+    df = read_table(input_csv, columns=COLUMNS)
     if 'city' not in df.columns or 'store' not in df.columns:
         raise ValueError('city/store columns required')
     pack = build_pack(df)
     os.makedirs(os.path.dirname(out_json), exist_ok=True)
     with open(out_json, 'w') as f:
         json.dump(pack, f, indent=2)
+    stage_cache.store(key, outputs)
     print(f"[compute_dash_pack] wrote {out_json}")
 
 
 if __name__ == '__main__':
     ap = argparse.ArgumentParser()
-    ap.add_argument('-i','--input', default='data/rider_week_clean.csv')
+    ap.add_argument('-i','--input', default='data/rider_week_clean.parquet')
     ap.add_argument('-j','--out_json', default='artifacts/dash_pack.json')
+    ap.add_argument('--force', action='store_true', help='recompute even if cached outputs match')
     args = ap.parse_args()
-    main(args.input, args.out_json)
+    main(args.input, args.out_json, force=args.force)
 
 
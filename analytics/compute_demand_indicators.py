@@ -3,6 +3,8 @@ import pandas as pd
 import numpy as np
 import json
 import os
+import stage_cache
+from table_io import read_table
 
 # This computes:
 # 1) Store_Earning_Index  = median(final_with_gst) per store
@@ -11,6 +13,10 @@ import os
 # Then normalizes each 0–100 and creates Demand_Score = 0.5*Earning + 0.3*Stability + 0.2*Ramp
 # Also derives a 'Best Shift' heuristic by store using cee_category mix.
 
+# the only input columns this script reads
+COLUMNS = ['city','store','cee_category','final_with_gst']
+
+
 def _safe_minmax(series: pd.Series) -> pd.Series:
     s = series.fillna(series.median())
     mn, mx = s.min(), s.max()
@@ -92,8 +98,13 @@ def compute(df: pd.DataFrame):
     out = out.sort_values(['city','demand_score'], ascending=[True, False])
     return out
 
-def main(input_csv: str, out_csv: str, out_json: str):
-    df = pd.read_csv(input_csv)
+def main(input_csv: str, out_csv: str, out_json: str, force: bool = False):
+    outputs = [out_csv, out_json]
+    key = stage_cache.cache_key(__file__, [input_csv], {})
+    if not force and stage_cache.restore(key, outputs):
+        print(f"[compute_demand_indicators] reused cached {out_csv} and {out_json}")
+        return
+    df = read_table(input_csv, columns=COLUMNS)
     # sanity: ensure required columns
     needed = {'city','store','cee_category','final_with_gst'}
     missing = needed - set(df.columns)
@@ -113,14 +124,16 @@ def main(input_csv: str, out_csv: str, out_json: str):
         grouped[city] = sub[['store','demand_score','stars','color','best_shift','p25','p75','store_earning_index','new_rider_ramp_score']].to_dict(orient='records')
     with open(out_json, "w") as f:
         json.dump(grouped, f, indent=2)
+    stage_cache.store(key, outputs)
     print(f"[compute_demand_indicators] wrote {out_csv} and {out_json}")
 
 if __name__ == "__main__":
     ap = argparse.ArgumentParser()
-    ap.add_argument("-i","--input", default="data/rider_week_clean.csv")
+    ap.add_argument("-i","--input", default="data/rider_week_clean.parquet")
     ap.add_argument("-o","--out_csv", default="artifacts/demand_store.csv")
     ap.add_argument("-j","--out_json", default="artifacts/demand_store.json")
+    ap.add_argument("--force", action="store_true", help="recompute even if cached outputs match")
     args = ap.parse_args()
-    main(args.input, args.out_csv, args.out_json)
+    main(args.input, args.out_csv, args.out_json, force=args.force)
 
 
@@ -2,6 +2,8 @@ import argparse
 import pandas as pd
 import numpy as np
 import json, os
+import stage_cache
+from table_io import read_table
 
 """
 Computes richer rider-facing insights per city/store:
@@ -24,6 +26,10 @@ Outputs:
 - artifacts/demand_store_extended.json
 """
 
+# the only input columns this script reads
+COLUMNS = ['city','store','cee_category','cee_id','final_with_gst','total_orders']
+
+
 def _safe_minmax(series: pd.Series) -> pd.Series:
     s = series.copy()
     if s.isna().all():
@@ -144,8 +150,13 @@ def compute(df: pd.DataFrame, target_orders_per_rider_day: int = 22, avg_payout_
     out = out.sort_values(['city','demand_score'], ascending=[True, False])
     return out
 
-def main(input_csv: str, out_csv: str, out_json: str, target_orders_per_rider_day: int = 22, avg_payout_per_order: float | None = None):
-    df = pd.read_csv(input_csv)
+def main(input_csv: str, out_csv: str, out_json: str, target_orders_per_rider_day: int = 22, avg_payout_per_order: float | None = None, force: bool = False):
+    outputs = [out_csv, out_json]
+    key = stage_cache.cache_key(__file__, [input_csv], {'target_orders_per_rider_day': target_orders_per_rider_day, 'avg_payout_per_order': avg_payout_per_order})
+    if not force and stage_cache.restore(key, outputs):
+        print(f"[compute_extended_insights] reused cached {out_csv} and {out_json}")
+        return
+    df = read_table(input_csv, columns=COLUMNS)
     needed = {'city','store','cee_category','final_with_gst'}
     missing = needed - set(df.columns)
     if missing:
@@ -167,16 +178,18 @@ def main(input_csv: str, out_csv: str, out_json: str, target_orders_per_rider_da
     with open(out_json, "w") as f:
         json.dump(grouped, f, indent=2)
 
+    stage_cache.store(key, outputs)
     print(f"[compute_extended_insights] wrote {out_csv} and {out_json}")
 
 if __name__ == "__main__":
     ap = argparse.ArgumentParser()
-    ap.add_argument("-i","--input", default="data/rider_week_clean.csv")
+    ap.add_argument("-i","--input", default="data/rider_week_clean.parquet")
     ap.add_argument("-o","--out_csv", default="artifacts/demand_store_extended.csv")
     ap.add_argument("-j","--out_json", default="artifacts/demand_store_extended.json")
     ap.add_argument("--target_orders_per_rider_day", type=int, default=22)
     ap.add_argument("--avg_payout_per_order", type=float, default=None, help="If orders not available, estimate by payout/order")
+    ap.add_argument("--force", action="store_true", help="recompute even if cached outputs match")
     args = ap.parse_args()
-    main(args.input, args.out_csv, args.out_json, args.target_orders_per_rider_day, args.avg_payout_per_order)
+    main(args.input, args.out_csv, args.out_json, args.target_orders_per_rider_day, args.avg_payout_per_order, force=args.force)
 
 
@@ -4,6 +4,8 @@ import math
 import os
 import pandas as pd
 import numpy as np
+import stage_cache
+from table_io import read_table
 
 """
 Compute Minimum Guarantee (MG) guidance per driver:
@@ -18,6 +20,9 @@ Outputs:
 - artifacts/mg_guidance.json (grouped by city)
 """
 
+# the only input columns this script reads
+COLUMNS = ['city','store','cee_id','cee_name','final_with_gst','minimum_guarantee','mg_eligible_days']
+
 
 def load_per_ride_map(per_ride_json_path: str) -> dict:
     if not os.path.exists(per_ride_json_path):
@@ -71,8 +76,13 @@ def compute(df: pd.DataFrame, per_ride_map: dict, target_orders_per_shift: int =
     return out
 
 
-def main(input_csv: str, per_ride_json: str, out_csv: str, out_json: str, target_orders_per_shift: int = 10):
-    df = pd.read_csv(input_csv)
+def main(input_csv: str, per_ride_json: str, out_csv: str, out_json: str, target_orders_per_shift: int = 10, force: bool = False):
+    outputs = [out_csv, out_json]
+    key = stage_cache.cache_key(__file__, [input_csv, per_ride_json], {'target_orders_per_shift': target_orders_per_shift})
+    if not force and stage_cache.restore(key, outputs):
+        print(f"[compute_mg_guidance] reused cached {out_csv} and {out_json}")
+        return
+    df = read_table(input_csv, columns=COLUMNS)
     needed = {'city','store','cee_id','cee_name','final_with_gst'}
     missing = needed - set(df.columns)
     if missing:
@@ -87,17 +97,19 @@ def main(input_csv: str, per_ride_json: str, out_csv: str, out_json: str, target
         grouped[city] = sub[['cee_id','cee_name','store','mg_target_per_day','current_per_day','mg_gap','per_ride_median','extra_orders','extra_shifts','recommendation']].to_dict(orient='records')
     with open(out_json, 'w') as f:
         json.dump(grouped, f, indent=2)
+    stage_cache.store(key, outputs)
     print(f"[compute_mg_guidance] wrote {out_csv} and {out_json}")
 
 
 if __name__ == '__main__':
     ap = argparse.ArgumentParser()
-    ap.add_argument('-i','--input', default='data/rider_week_clean.csv')
+    ap.add_argument('-i','--input', default='data/rider_week_clean.parquet')
     ap.add_argument('-e','--per_ride_json', default='artifacts/earnings_per_ride.json')
     ap.add_argument('-o','--out_csv', default='artifacts/mg_guidance.csv')
     ap.add_argument('-j','--out_json', default='artifacts/mg_guidance.json')
     ap.add_argument('--orders_per_shift', type=int, default=10)
+    ap.add_argument('--force', action='store_true', help='recompute even if cached outputs match')
     args = ap.parse_args()
-    main(args.input, args.per_ride_json, args.out_csv, args.out_json, target_orders_per_shift=args.orders_per_shift)
+    main(args.input, args.per_ride_json, args.out_csv, args.out_json, target_orders_per_shift=args.orders_per_shift, force=args.force)
 
 
@@ -2,11 +2,13 @@ import argparse
 import pandas as pd
 import numpy as np
 import json, os
+import stage_cache
+from table_io import read_table
 
 """
 Compute per-ride earning potential per city/store.
 
-Inputs: data/rider_week_clean.csv (from preprocess_xls)
+Inputs: data/rider_week_clean.parquet (from preprocess_xls)
 Uses columns: city, store, final_with_gst, total_orders (optional)
 
 Outputs:
@@ -14,6 +16,9 @@ Outputs:
 - artifacts/earnings_per_ride.json (grouped by city)
 """
 
+# the only input columns this script reads
+COLUMNS = ['city','store','final_with_gst','total_orders']
+
 
 def compute(df: pd.DataFrame, fallback_avg_payout_per_order: float | None = None):
     # Only rows with final_with_gst
@@ -60,8 +65,13 @@ def compute(df: pd.DataFrame, fallback_avg_payout_per_order: float | None = None
     return out
 
 
-def main(input_csv: str, out_csv: str, out_json: str, fallback_avg_payout_per_order: float | None = None):
-    df = pd.read_csv(input_csv)
+def main(input_csv: str, out_csv: str, out_json: str, fallback_avg_payout_per_order: float | None = None, force: bool = False):
+    outputs = [out_csv, out_json]
+    key = stage_cache.cache_key(__file__, [input_csv], {'fallback_avg_payout_per_order': fallback_avg_payout_per_order})
+    if not force and stage_cache.restore(key, outputs):
+        print(f"[compute_per_ride_earnings] reused cached {out_csv} and {out_json}")
+        return
+    df = read_table(input_csv, columns=COLUMNS)
     needed = {'city','store','final_with_gst'}
     missing = needed - set(df.columns)
     if missing:
@@ -78,16 +88,18 @@ def main(input_csv: str, out_csv: str, out_json: str, fallback_avg_payout_per_or
         grouped[city] = sub[['store','per_ride_avg','per_ride_median','p25','p75','per_ride_std','num_samples']].to_dict(orient='records')
     with open(out_json, 'w') as f:
         json.dump(grouped, f, indent=2)
+    stage_cache.store(key, outputs)
     print(f"[compute_per_ride_earnings] wrote {out_csv} and {out_json}")
 
 
 if __name__ == "__main__":
     ap = argparse.ArgumentParser()
-    ap.add_argument('-i','--input', default='data/rider_week_clean.csv')
+    ap.add_argument('-i','--input', default='data/rider_week_clean.parquet')
     ap.add_argument('-o','--out_csv', default='artifacts/earnings_per_ride.csv')
     ap.add_argument('-j','--out_json', default='artifacts/earnings_per_ride.json')
     ap.add_argument('--fallback_avg_payout_per_order', type=float, default=None)
+    ap.add_argument('--force', action='store_true', help='recompute even if cached outputs match')
     args = ap.parse_args()
-    main(args.input, args.out_csv, args.out_json, args.fallback_avg_payout_per_order)
+    main(args.input, args.out_csv, args.out_json, args.fallback_avg_payout_per_order, force=args.force)
 
 
@@ -4,6 +4,7 @@ import numpy as np
 from datetime import datetime
 import os
 import re
+from table_io import write_table
 
 # Minimal preprocessing for weekly rider payout XLS:
 # - Reads first sheet
@@ -61,7 +62,7 @@ def load_first_sheet(path: str) -> pd.DataFrame:
         return x.parse(x.sheet_names[0])
     return pd.read_csv(path)
 
-def run(input_path: str, output_csv: str):
+def run(input_path: str, output_path: str, csv: bool = False):
     df = load_first_sheet(input_path)
     df = canonicalize(df)
 
@@ -114,15 +115,15 @@ def run(input_path: str, output_csv: str):
         keep.append('location_query')
 
     out = df[[c for c in keep if c in df.columns]].copy()
-    os.makedirs(os.path.dirname(output_csv), exist_ok=True)
-    out.to_csv(output_csv, index=False)
-    print(f"[preprocess_xls] wrote {output_csv} with {len(out)} rows and {len(out.columns)} columns")
+    written = write_table(out, output_path, csv=csv)
+    print(f"[preprocess_xls] wrote {', '.join(written)} with {len(out)} rows and {len(out.columns)} columns")
 
 if __name__ == "__main__":
     ap = argparse.ArgumentParser()
     ap.add_argument("-i","--input", required=True, help="Path to XLS/XLSX/CSV file")
-    ap.add_argument("-o","--output", default="data/rider_week_clean.csv", help="Output CSV")
+    ap.add_argument("-o","--output", default="data/rider_week_clean.parquet", help="Output table (.parquet, or .csv for CSV only)")
+    ap.add_argument("--csv", action="store_true", help="Also write a CSV copy next to the Parquet output")
     args = ap.parse_args()
-    run(args.input, args.output)
+    run(args.input, args.output, csv=args.csv)
 
 
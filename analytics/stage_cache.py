@@ -0,0 +1,117 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+import uuid
+
+import table_io
+from table_io import resolve_table
+
+# Shared by the compute_* scripts: outputs are cached under a key that hashes the
+# script's own source, the content of its input tables and its parameters. A rerun
+# with the same key copies the cached outputs back instead of recomputing them;
+# --force skips the lookup. Entries are evicted least recently used first once the
+# cache outgrows ANALYTICS_CACHE_MAX_MB.
+
+CACHE_DIR = os.environ.get('ANALYTICS_CACHE_DIR', 'artifacts/.cache')
+CACHE_MAX_MB = float(os.environ.get('ANALYTICS_CACHE_MAX_MB', '512'))
+
+
+def _digest(path: str) -> str:
+    src = resolve_table(path) if os.path.splitext(path)[1] in ('.csv', '.parquet') else path
+    if not src or not os.path.exists(src):
+        return 'absent'
+    h = hashlib.blake2b(digest_size=20)
+    with open(src, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def cache_key(script: str, inputs, params: dict) -> str:
+    """Hash of the script's source and inputs (paths of files or tables) and its parameters."""
+    h = hashlib.blake2b(digest_size=20)
+    # table_io decides what the script reads, so it counts as the script's code too
+    for path in [script, table_io.__file__, *inputs]:
+        h.update(_digest(path).encode())
+    h.update(json.dumps(params, sort_keys=True, default=str).encode())
+    return h.hexdigest()
+
+
+def _copy(src: str, dst: str) -> None:
+    # copy then rename: a failure mid-copy must not leave a truncated dst that the
+    # next run takes for a finished output
+    os.makedirs(os.path.dirname(dst) or '.', exist_ok=True)
+    tmp = f'{dst}.{uuid.uuid4().hex[:8]}.tmp'
+    try:
+        shutil.copyfile(src, tmp)
+        os.replace(tmp, dst)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def restore(key: str, outputs) -> bool:
+    """Copy the cached outputs for `key` into place; False when there are none (or they are unusable)."""
+    entry = os.path.join(CACHE_DIR, key)
+    meta = os.path.join(entry, 'meta.json')
+    try:
+        with open(meta) as f:
+            if len(json.load(f)['outputs']) != len(outputs):
+                return False
+        for i, dst in enumerate(outputs):
+            _copy(os.path.join(entry, str(i)), dst)
+        os.utime(meta)
+    except FileNotFoundError:
+        return False
+    except (OSError, ValueError, KeyError) as e:
+        print(f"[stage_cache] unusable cache entry {key[:12]}, recomputing: {e}")
+        return False
+    return True
+
+
+def store(key: str, outputs) -> None:
+    """Keep copies of `outputs` under `key`, then evict down to CACHE_MAX_MB.
+
+    A cache that can't be written is reported and skipped; the outputs themselves are already in place.
+    """
+    entry = os.path.join(CACHE_DIR, key)
+    tmp = f'{entry}.{uuid.uuid4().hex[:8]}.tmp'
+    try:
+        os.makedirs(tmp)
+        size = 0
+        for i, src in enumerate(outputs):
+            shutil.copyfile(src, os.path.join(tmp, str(i)))
+            size += os.path.getsize(src)
+        with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+            json.dump({'outputs': [os.path.basename(p) for p in outputs], 'bytes': size, 'created_at': time.time()}, f)
+        shutil.rmtree(entry, ignore_errors=True)
+        os.replace(tmp, entry)
+    except OSError as e:
+        print(f"[stage_cache] could not cache outputs under {key[:12]}: {e}")
+        shutil.rmtree(tmp, ignore_errors=True)
+        return
+    _evict()
+
+
+def _evict() -> None:
+    entries = []
+    try:
+        names = os.listdir(CACHE_DIR)
+    except OSError:
+        return
+    for name in names:
+        meta = os.path.join(CACHE_DIR, name, 'meta.json')
+        try:
+            with open(meta) as f:
+                entries.append((os.path.getmtime(meta), json.load(f)['bytes'], name))
+        except (OSError, ValueError, KeyError):
+            continue
+    total = sum(size for _, size, _ in entries)
+    for _, size, name in sorted(entries):
+        if total <= CACHE_MAX_MB * 2**20:
+            break
+        shutil.rmtree(os.path.join(CACHE_DIR, name), ignore_errors=True)
+        total -= size
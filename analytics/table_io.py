@@ -0,0 +1,54 @@
+import os
+from pathlib import Path
+
+import pandas as pd
+
+# Shared by the analytics scripts: tables are exchanged as typed Parquet, with CSV
+# still accepted on input and available as an export.
+#
+# A path names a table rather than a file: data/rider_week_clean.csv and
+# data/rider_week_clean.parquet are the same table, and readers take whichever file
+# was written last.
+
+
+def resolve_table(path: str):
+    found = []
+    for suffix in ('.parquet', '.csv'):
+        p = str(Path(path).with_suffix(suffix))
+        if os.path.exists(p):
+            found.append((os.path.getmtime(p), suffix == '.parquet', p))
+    return max(found)[2] if found else None
+
+
+def read_table(path: str, columns=None) -> pd.DataFrame:
+    """Load a table, only `columns` if given (columns the file lacks are skipped)."""
+    src = resolve_table(path)
+    if src is None:
+        raise FileNotFoundError(path)
+    if src.endswith('.parquet'):
+        if columns is not None:
+            import pyarrow.parquet as pq
+            names = set(pq.read_schema(src).names)
+            columns = [c for c in columns if c in names]
+        return pd.read_parquet(src, columns=columns)
+    return pd.read_csv(src, usecols=(lambda c: c in set(columns)) if columns is not None else None)
+
+
+def write_table(df: pd.DataFrame, path: str, csv: bool = False) -> list:
+    """Write `df` as Parquet, or as CSV when `path` ends in .csv; `csv` adds a CSV copy."""
+    out = []
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    if not path.lower().endswith('.csv'):
+        pq_path = str(Path(path).with_suffix('.parquet'))
+        typed = df.copy()
+        for c in typed.columns:
+            # Excel ids arrive as a mix of ints and strings; Parquet needs one type per column
+            if typed[c].dtype == object:
+                typed[c] = typed[c].where(typed[c].isna(), typed[c].astype(str))
+        typed.to_parquet(pq_path, index=False)
+        out.append(pq_path)
+    if csv or path.lower().endswith('.csv'):
+        csv_path = str(Path(path).with_suffix('.csv'))
+        df.to_csv(csv_path, index=False)
+        out.append(csv_path)
+    return out
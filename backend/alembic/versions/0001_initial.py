@@ -0,0 +1,42 @@
+"""jobs table as originally created by Base.metadata.create_all
+
+Revision ID: 0001_initial
+Revises:
+Create Date: 2026-10-19
+
+Migrations use IF NOT EXISTS so they also apply cleanly to databases whose tables
+were created at app startup before Alembic was introduced.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = "0001_initial"
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "jobs",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("external_job_id", sa.String(64), nullable=False),
+        sa.Column("timestamp", sa.DateTime(), nullable=False),
+        sa.Column("pickup_lat", sa.Float(), nullable=False),
+        sa.Column("pickup_lng", sa.Float(), nullable=False),
+        sa.Column("dropoff_lat", sa.Float(), nullable=False),
+        sa.Column("dropoff_lng", sa.Float(), nullable=False),
+        sa.Column("energy_kwh", sa.Float(), nullable=False),
+        sa.Column("price_usd", sa.Float(), nullable=True),
+        sa.Column("zone", sa.String(64), nullable=True),
+        if_not_exists=True,
+    )
+    op.create_index("ix_jobs_id", "jobs", ["id"], if_not_exists=True)
+    op.create_index("ix_jobs_external_job_id", "jobs", ["external_job_id"], unique=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    op.drop_table("jobs")
@@ -0,0 +1,41 @@
+"""beckn_orders table for the order store write-behind
+
+Revision ID: 0002_beckn_orders
+Revises: 0001_initial
+Create Date: 2026-10-19
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = "0002_beckn_orders"
+down_revision: Union[str, None] = "0001_initial"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "beckn_orders",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("transaction_id", sa.String(64), nullable=False),
+        sa.Column("order_id", sa.String(64), nullable=False, unique=True),
+        sa.Column("bap_id", sa.String(255), nullable=True),
+        sa.Column("bap_uri", sa.String(512), nullable=True),
+        sa.Column("provider_id", sa.String(255), nullable=True),
+        sa.Column("items", sa.JSON(), nullable=True),
+        sa.Column("status", sa.String(32), nullable=False),
+        sa.Column("version", sa.Integer(), nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("updated_at", sa.DateTime(timezone=True), nullable=False),
+        if_not_exists=True,
+    )
+    op.create_index(
+        "ix_beckn_orders_transaction_id", "beckn_orders", ["transaction_id"], unique=True, if_not_exists=True
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("beckn_orders")
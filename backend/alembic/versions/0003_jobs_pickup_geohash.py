@@ -0,0 +1,60 @@
+"""jobs.pickup_geohash with a prefix-searchable index, backfilled
+
+Revision ID: 0003_jobs_pickup_geohash
+Revises: 0002_beckn_orders
+Create Date: 2026-10-19
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = "0003_jobs_pickup_geohash"
+down_revision: Union[str, None] = "0002_beckn_orders"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BATCH_ROWS = 10_000
+
+# Frozen copy of app.services.geo.geohash_encode_many at precision 9, in SQL, so the
+# migration keeps working whatever the app code becomes: 22 latitude and 23 longitude
+# bits, interleaved longitude first, read out as 9 base32 characters. NaN coordinates
+# get '' like the app's backfill gave them.
+BACKFILL_SQL = """
+UPDATE jobs AS j SET pickup_geohash = CASE
+    WHEN j.pickup_lat = 'NaN' OR j.pickup_lng = 'NaN' THEN ''
+    ELSE (
+        SELECT string_agg(substr('0123456789bcdefghjkmnpqrstuvwxyz', ((q.code >> (5 * (8 - c))) & 31)::int + 1, 1), '' ORDER BY c)
+        FROM (
+            SELECT sum(CASE WHEN i % 2 = 0 THEN (g.lng_q >> (22 - i / 2)) & 1
+                            ELSE (g.lat_q >> (21 - i / 2)) & 1 END << (44 - i))::bigint AS code
+            FROM (
+                SELECT least(greatest(floor((j.pickup_lat + 90.0) / 180.0 * 4194304)::bigint, 0), 4194303) AS lat_q,
+                       least(greatest(floor((j.pickup_lng + 180.0) / 360.0 * 8388608)::bigint, 0), 8388607) AS lng_q
+            ) AS g, generate_series(0, 44) AS i
+            GROUP BY g.lat_q, g.lng_q
+        ) AS q, generate_series(0, 8) AS c
+    )
+END
+WHERE j.id IN (SELECT id FROM jobs WHERE pickup_geohash IS NULL LIMIT :batch)
+"""
+
+
+def upgrade() -> None:
+    op.execute("ALTER TABLE jobs ADD COLUMN IF NOT EXISTS pickup_geohash VARCHAR(12)")
+    op.create_index(
+        "ix_jobs_pickup_geohash",
+        "jobs",
+        ["pickup_geohash"],
+        postgresql_ops={"pickup_geohash": "text_pattern_ops"},
+        if_not_exists=True,
+    )
+    bind = op.get_bind()
+    while bind.execute(sa.text(BACKFILL_SQL), {"batch": BATCH_ROWS}).rowcount:
+        pass
+
+
+def downgrade() -> None:
+    op.drop_index("ix_jobs_pickup_geohash", table_name="jobs")
+    op.drop_column("jobs", "pickup_geohash")
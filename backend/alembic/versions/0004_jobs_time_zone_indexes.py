@@ -0,0 +1,29 @@
+"""indexes for time-range and zone-filtered job listings
+
+Revision ID: 0004_jobs_time_zone_indexes
+Revises: 0003_jobs_pickup_geohash
+Create Date: 2026-10-19
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+revision: str = "0004_jobs_time_zone_indexes"
+down_revision: Union[str, None] = "0003_jobs_pickup_geohash"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # keyset pagination order, and the same order within one zone
+    op.create_index("ix_jobs_timestamp_id", "jobs", ["timestamp", "id"], if_not_exists=True)
+    op.create_index("ix_jobs_zone_timestamp_id", "jobs", ["zone", "timestamp", "id"], if_not_exists=True)
+    # tiny index for wide "last N hours" range scans over the append-mostly table
+    op.create_index("ix_jobs_timestamp_brin", "jobs", ["timestamp"], postgresql_using="brin", if_not_exists=True)
+
+
+def downgrade() -> None:
+    op.drop_index("ix_jobs_timestamp_brin", table_name="jobs")
+    op.drop_index("ix_jobs_zone_timestamp_id", table_name="jobs")
+    op.drop_index("ix_jobs_timestamp_id", table_name="jobs")
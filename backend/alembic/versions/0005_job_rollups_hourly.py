@@ -0,0 +1,41 @@
+"""hourly job rollups per zone and store
+
+Revision ID: 0005_job_rollups_hourly
+Revises: 0004_jobs_time_zone_indexes
+Create Date: 2026-10-19
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = "0005_job_rollups_hourly"
+down_revision: Union[str, None] = "0004_jobs_time_zone_indexes"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Left empty on purpose: store and payout-breakdown columns are not kept on the jobs
+    # table, so the first ETL ingest seeds it (see 0006_job_rollups_seeded).
+    op.create_table(
+        "job_rollups_hourly",
+        sa.Column("dim", sa.String(16), nullable=False),
+        sa.Column("key", sa.String(128), nullable=False),
+        sa.Column("hour", sa.DateTime(), nullable=False),
+        sa.Column("jobs_count", sa.BigInteger(), nullable=False),
+        sa.Column("base_sum", sa.Float(), nullable=False),
+        sa.Column("base_count", sa.BigInteger(), nullable=False),
+        sa.Column("final_sum", sa.Float(), nullable=False),
+        sa.Column("final_count", sa.BigInteger(), nullable=False),
+        sa.Column("incentive_sum", sa.Float(), nullable=False),
+        sa.Column("incentive_count", sa.BigInteger(), nullable=False),
+        sa.Column("energy_kwh_sum", sa.Float(), nullable=False),
+        sa.PrimaryKeyConstraint("dim", "key", "hour"),
+        if_not_exists=True,
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("job_rollups_hourly")
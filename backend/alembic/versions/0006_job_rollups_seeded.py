@@ -0,0 +1,34 @@
+"""marker for rollups seeded from every job
+
+Revision ID: 0006_job_rollups_seeded
+Revises: 0005_job_rollups_hourly
+Create Date: 2026-10-19
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = "0006_job_rollups_seeded"
+down_revision: Union[str, None] = "0005_job_rollups_hourly"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # API-created jobs add rollup rows before any ETL ingest has run, so whether the
+    # rollups cover jobs loaded earlier can't be told from job_rollups_hourly being
+    # empty. The first ETL ingest rebuilds them from its cleaned frame and the jobs
+    # table, then writes the one row here.
+    op.create_table(
+        "job_rollups_seeded",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("seeded_at", sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+        if_not_exists=True,
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("job_rollups_seeded")
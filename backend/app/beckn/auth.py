@@ -0,0 +1,233 @@
+"""
+auth.py
+-- Beckn HTTP signatures: Ed25519 over a BLAKE2b-512 body digest
+"""
+from __future__ import annotations
+
+import asyncio
+import base64
+import hashlib
+import logging
+import re
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+import httpx
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey, Ed25519PublicKey
+from fastapi import HTTPException, Request
+
+from ..config import settings
+
+logger = logging.getLogger("beckn.auth")
+
+_PARAM_RE = re.compile(r'(\w+)="([^"]*)"')
+
+
+def body_digest(body: bytes) -> str:
+    return base64.b64encode(hashlib.blake2b(body, digest_size=64).digest()).decode()
+
+
+def signing_string(created: int, expires: int, digest: str) -> bytes:
+    return f"(created): {created}\n(expires): {expires}\ndigest: BLAKE-512={digest}".encode()
+
+
+def parse_authorization(header: str) -> Dict[str, str]:
+    header = header.strip()
+    if header.lower().startswith("signature "):
+        header = header[len("signature "):]
+    return dict(_PARAM_RE.findall(header))
+
+
+class Signer:
+    """Signs outgoing bodies for `subscriber_id|unique_key_id`."""
+
+    def __init__(self, subscriber_id: str, unique_key_id: str, private_key_b64: str, ttl_s: int = 300):
+        raw = base64.b64decode(private_key_b64)
+        # accept a 32-byte seed or a 64-byte libsodium secret key (seed || public key)
+        self._key = Ed25519PrivateKey.from_private_bytes(raw[:32])
+        self.key_id = f"{subscriber_id}|{unique_key_id}|ed25519"
+        self.ttl_s = ttl_s
+
+    def sign(self, body: bytes, digest: Optional[str] = None) -> Dict[str, str]:
+        created = int(time.time())
+        expires = created + self.ttl_s
+        digest = digest or body_digest(body)
+        signature = base64.b64encode(self._key.sign(signing_string(created, expires, digest))).decode()
+        header = (
+            f'Signature keyId="{self.key_id}",algorithm="ed25519",created="{created}",'
+            f'expires="{expires}",headers="(created) (expires) digest",signature="{signature}"'
+        )
+        return {"Authorization": header}
+
+    async def asign(self, body: bytes, digest: Optional[str] = None) -> Dict[str, str]:
+        return await asyncio.to_thread(self.sign, body, digest)
+
+
+class PublicKeyCache:
+    """Parsed Ed25519 public keys from registry lookups, cached with a TTL.
+
+    Concurrent misses for the same key share one in-flight lookup.
+    """
+
+    def __init__(self, registry_url: str, ttl_s: float = 3600.0, client: Optional[httpx.AsyncClient] = None):
+        self.registry_url = registry_url.rstrip("/")
+        self.ttl_s = ttl_s
+        self.client = client or httpx.AsyncClient(timeout=5.0)
+        self._entries: Dict[Tuple[str, str], Tuple[float, Optional[Ed25519PublicKey]]] = {}
+        self._pending: Dict[Tuple[str, str], asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, subscriber_id: str, unique_key_id: str) -> Optional[Ed25519PublicKey]:
+        key = (subscriber_id, unique_key_id)
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            self.hits += 1
+            return entry[1]
+        pending = self._pending.get(key)
+        if pending is not None:
+            return await asyncio.shield(pending)
+        self.misses += 1
+        fut = asyncio.get_running_loop().create_future()
+        self._pending[key] = fut
+        try:
+            public_key = await self._lookup(subscriber_id, unique_key_id)
+            # unknown subscribers are cached briefly so bad traffic can't hammer the registry
+            ttl = self.ttl_s if public_key is not None else min(self.ttl_s, 60.0)
+            self._entries[key] = (time.monotonic() + ttl, public_key)
+            fut.set_result(public_key)
+            return public_key
+        except Exception as e:
+            fut.set_exception(e)
+            raise
+        finally:
+            self._pending.pop(key, None)
+            if not fut.done():
+                fut.cancel()
+            elif not fut.cancelled():
+                fut.exception()  # mark retrieved so asyncio doesn't log it
+
+    async def _lookup(self, subscriber_id: str, unique_key_id: str) -> Optional[Ed25519PublicKey]:
+        """The subscriber's signing key; PermissionError when the registry refuses or garbles the answer.
+
+        Transport errors and registry 5xx still raise httpx errors: the sender may be
+        fine, we just can't tell right now.
+        """
+        resp = await self.client.post(
+            f"{self.registry_url}/lookup",
+            json={"subscriber_id": subscriber_id, "ukId": unique_key_id},
+        )
+        if resp.is_client_error:
+            raise PermissionError(f"registry refused lookup of {subscriber_id}|{unique_key_id} (HTTP {resp.status_code})")
+        resp.raise_for_status()
+        try:
+            return self._parse(resp.json(), subscriber_id, unique_key_id)
+        except (KeyError, ValueError, TypeError, AttributeError) as e:
+            # ValueError covers bad JSON, bad base64 (binascii.Error) and keys of the wrong length
+            raise PermissionError(f"unusable registry record for {subscriber_id}|{unique_key_id}: {e!r}")
+
+    @staticmethod
+    def _parse(data, subscriber_id: str, unique_key_id: str) -> Optional[Ed25519PublicKey]:
+        records = data if isinstance(data, list) else data.get("message", data).get("subscribers", [])
+        for rec in records:
+            if rec.get("subscriber_id") != subscriber_id:
+                continue
+            if rec.get("ukId", rec.get("unique_key_id", unique_key_id)) != unique_key_id:
+                continue
+            pub = rec.get("signing_public_key")
+            if pub:
+                return Ed25519PublicKey.from_public_bytes(base64.b64decode(pub, validate=True))
+        return None
+
+
+@dataclass
+class VerifiedSender:
+    subscriber_id: str
+    unique_key_id: str
+    digest: str
+
+
+class Verifier:
+    def __init__(self, keys: PublicKeyCache, clock_skew_s: int = 30):
+        self.keys = keys
+        self.clock_skew_s = clock_skew_s
+
+    async def verify(self, authorization: Optional[str], body: bytes, digest: Optional[str] = None) -> VerifiedSender:
+        if not authorization:
+            raise PermissionError("missing Authorization header")
+        params = parse_authorization(authorization)
+        try:
+            subscriber_id, unique_key_id, algorithm = params["keyId"].split("|")
+            created = int(params["created"])
+            expires = int(params["expires"])
+            signature = base64.b64decode(params["signature"])
+        except (KeyError, ValueError) as e:
+            raise PermissionError(f"malformed Authorization header: {e}")
+        if algorithm != "ed25519":
+            raise PermissionError(f"unsupported algorithm {algorithm}")
+        now = int(time.time())
+        if created > now + self.clock_skew_s or expires < now - self.clock_skew_s:
+            raise PermissionError("signature expired or not yet valid")
+        public_key = await self.keys.get(subscriber_id, unique_key_id)
+        if public_key is None:
+            raise PermissionError(f"unknown subscriber {subscriber_id}|{unique_key_id}")
+        digest = await asyncio.to_thread(self._check, public_key, signature, created, expires, body, digest)
+        return VerifiedSender(subscriber_id=subscriber_id, unique_key_id=unique_key_id, digest=digest)
+
+    @staticmethod
+    def _check(public_key: Ed25519PublicKey, signature: bytes, created: int, expires: int, body: bytes, digest: Optional[str]) -> str:
+        digest = digest or body_digest(body)
+        try:
+            public_key.verify(signature, signing_string(created, expires, digest))
+        except InvalidSignature:
+            raise PermissionError("signature mismatch")
+        return digest
+
+
+_signer: Optional[Signer] = None
+_verifier: Optional[Verifier] = None
+
+
+def get_signer() -> Optional[Signer]:
+    global _signer
+    if _signer is None and settings.beckn_signing_private_key:
+        _signer = Signer(
+            settings.beckn_subscriber_id,
+            settings.beckn_unique_key_id,
+            settings.beckn_signing_private_key,
+            ttl_s=settings.beckn_signature_ttl_s,
+        )
+    return _signer
+
+
+def get_verifier() -> Optional[Verifier]:
+    global _verifier
+    if _verifier is None and settings.beckn_registry_url:
+        _verifier = Verifier(PublicKeyCache(settings.beckn_registry_url, ttl_s=settings.beckn_key_cache_ttl_s))
+    return _verifier
+
+
+async def verify_beckn_request(request: Request) -> Optional[VerifiedSender]:
+    """Dependency: authenticate the caller when request verification is enabled."""
+    if not settings.beckn_verify_requests:
+        return None
+    body = await request.body()
+    verifier = get_verifier()
+    if verifier is None:
+        raise HTTPException(status_code=500, detail="beckn_registry_url is not configured")
+    try:
+        sender = await verifier.verify(request.headers.get("Authorization"), body)
+    except PermissionError as e:
+        raise HTTPException(
+            status_code=401,
+            detail=str(e),
+            headers={
+                "WWW-Authenticate": f'Signature realm="{settings.beckn_subscriber_id}",headers="(created) (expires) digest"'
+            },
+        )
+    except httpx.HTTPError as e:
+        logger.warning("Registry lookup failed: %s", e)
+        raise HTTPException(status_code=503, detail="registry lookup failed")
+    return sender
@@ -0,0 +1,222 @@
+"""
+dispatcher.py
+-- Asynchronous delivery of Beckn callbacks (on_search, on_confirm, ...) to the BAP
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import random
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Optional, Union
+from urllib.parse import urlparse
+
+import httpx
+
+from ..config import settings
+from .auth import get_signer
+
+logger = logging.getLogger("beckn.dispatcher")
+
+Payload = Dict[str, Any]
+PayloadSource = Union[Payload, Callable[[], Awaitable[Payload]]]
+
+RETRYABLE_STATUS = {408, 425, 429, 500, 502, 503, 504}
+
+
+@dataclass
+class Callback:
+    bap_uri: str
+    action: str
+    payload: PayloadSource
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+    @property
+    def url(self) -> str:
+        return f"{self.bap_uri.rstrip('/')}/{self.action}"
+
+    @property
+    def bap_key(self) -> str:
+        return urlparse(self.bap_uri).netloc or self.bap_uri
+
+
+class CallbackDispatcher:
+    """Bounded queue of callbacks drained by worker tasks over one pooled AsyncClient.
+
+    `payload` may be a ready dict or an async factory, so slow catalog builds run after
+    the request has been acknowledged. Deliveries to a single BAP are capped by a
+    semaphore; transport errors and retryable statuses back off exponentially.
+    """
+
+    def __init__(
+        self,
+        *,
+        queue_size: int = 1000,
+        workers: int = 8,
+        per_bap_concurrency: int = 4,
+        max_retries: int = 3,
+        backoff_base_s: float = 0.5,
+        timeout_s: float = 10.0,
+        client: Optional[httpx.AsyncClient] = None,
+        sign: Optional[Callable[[bytes], Awaitable[Dict[str, str]]]] = None,
+    ):
+        self.queue: asyncio.Queue[Callback] = asyncio.Queue(maxsize=queue_size)
+        self.workers = workers
+        self.per_bap_concurrency = per_bap_concurrency
+        self.max_retries = max_retries
+        self.backoff_base_s = backoff_base_s
+        self._owns_client = client is None
+        self.client = client or httpx.AsyncClient(
+            timeout=timeout_s,
+            limits=httpx.Limits(max_connections=workers * 2, max_keepalive_connections=workers),
+        )
+        self.sign = sign
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._tasks: list[asyncio.Task] = []
+        self._counters: Dict[str, int] = defaultdict(int)
+        self._per_bap: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        self._latency_sum = 0.0
+        self._latency_max = 0.0
+        self._in_flight = 0
+
+    # -- lifecycle -----------------------------------------------------------
+    def start(self) -> None:
+        if self._tasks:
+            return
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+
+    async def close(self, drain_timeout_s: float = 5.0) -> None:
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout=drain_timeout_s)
+        except asyncio.TimeoutError:
+            logger.warning("Dropping %d undelivered callbacks on shutdown", self.queue.qsize())
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._owns_client:
+            await self.client.aclose()
+
+    # -- producer ------------------------------------------------------------
+    def submit(self, bap_uri: str, action: str, payload: PayloadSource) -> bool:
+        """Queue a callback; returns False (and counts a drop) when the queue is full."""
+        cb = Callback(bap_uri=bap_uri, action=action, payload=payload)
+        try:
+            self.queue.put_nowait(cb)
+        except asyncio.QueueFull:
+            self._counters["dropped"] += 1
+            self._per_bap[cb.bap_key]["dropped"] += 1
+            return False
+        self._counters["enqueued"] += 1
+        return True
+
+    # -- consumer ------------------------------------------------------------
+    async def _worker(self, idx: int) -> None:
+        while True:
+            cb = await self.queue.get()
+            try:
+                await self._deliver(cb)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                self._counters["failed"] += 1
+                self._per_bap[cb.bap_key]["failed"] += 1
+                logger.exception("Callback %s to %s failed", cb.action, cb.bap_uri)
+            finally:
+                self.queue.task_done()
+
+    def _semaphore(self, key: str) -> asyncio.Semaphore:
+        sem = self._semaphores.get(key)
+        if sem is None:
+            sem = self._semaphores[key] = asyncio.Semaphore(self.per_bap_concurrency)
+        return sem
+
+    async def _deliver(self, cb: Callback) -> None:
+        payload = cb.payload if isinstance(cb.payload, dict) else await cb.payload()
+        body = json.dumps(payload, separators=(",", ":"), default=str).encode()
+        headers = {"Content-Type": "application/json"}
+        if self.sign is not None:
+            # signed once per message; retries resend the same body and signature
+            headers.update(await self.sign(body))
+        async with self._semaphore(cb.bap_key):
+            self._in_flight += 1
+            try:
+                for attempt in range(self.max_retries + 1):
+                    try:
+                        resp = await self.client.post(cb.url, content=body, headers=headers)
+                        if resp.status_code < 400:
+                            self._record_delivery(cb)
+                            return
+                        if resp.status_code not in RETRYABLE_STATUS:
+                            raise httpx.HTTPStatusError(
+                                f"BAP returned {resp.status_code}", request=resp.request, response=resp
+                            )
+                    except (httpx.TransportError, httpx.TimeoutException):
+                        if attempt >= self.max_retries:
+                            raise
+                    if attempt >= self.max_retries:
+                        raise RuntimeError(f"gave up on {cb.url} after {attempt + 1} attempts")
+                    self._counters["retried"] += 1
+                    self._per_bap[cb.bap_key]["retried"] += 1
+                    delay = self.backoff_base_s * (2 ** attempt)
+                    await asyncio.sleep(delay + random.uniform(0, delay / 2))
+            finally:
+                self._in_flight -= 1
+
+    def _record_delivery(self, cb: Callback) -> None:
+        latency = time.monotonic() - cb.enqueued_at
+        self._counters["delivered"] += 1
+        self._per_bap[cb.bap_key]["delivered"] += 1
+        self._latency_sum += latency
+        self._latency_max = max(self._latency_max, latency)
+
+    def metrics(self) -> Dict[str, Any]:
+        delivered = self._counters["delivered"]
+        return {
+            "queue_depth": self.queue.qsize(),
+            "queue_capacity": self.queue.maxsize,
+            "in_flight": self._in_flight,
+            "enqueued": self._counters["enqueued"],
+            "delivered": delivered,
+            "retried": self._counters["retried"],
+            "failed": self._counters["failed"],
+            "dropped": self._counters["dropped"],
+            "latency_avg_s": round(self._latency_sum / delivered, 4) if delivered else 0.0,
+            "latency_max_s": round(self._latency_max, 4),
+            "per_bap": {k: dict(v) for k, v in self._per_bap.items()},
+        }
+
+
+_global_dispatcher: Optional[CallbackDispatcher] = None
+
+
+def get_dispatcher() -> CallbackDispatcher:
+    """Create (and start) the dispatcher lazily inside the running event loop."""
+    global _global_dispatcher
+    if _global_dispatcher is None:
+        signer = get_signer()
+        _global_dispatcher = CallbackDispatcher(
+            queue_size=settings.beckn_callback_queue_size,
+            workers=settings.beckn_callback_workers,
+            per_bap_concurrency=settings.beckn_callback_per_bap_concurrency,
+            max_retries=settings.beckn_callback_max_retries,
+            backoff_base_s=settings.beckn_callback_backoff_s,
+            timeout_s=settings.beckn_callback_timeout_s,
+            sign=signer.asign if signer is not None else None,
+        )
+        _global_dispatcher.start()
+    return _global_dispatcher
+
+
+def dispatcher_metrics() -> Optional[Dict[str, Any]]:
+    return _global_dispatcher.metrics() if _global_dispatcher is not None else None
+
+
+async def shutdown_dispatcher() -> None:
+    global _global_dispatcher
+    if _global_dispatcher is not None:
+        await _global_dispatcher.close()
+        _global_dispatcher = None
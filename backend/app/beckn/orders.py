@@ -0,0 +1,265 @@
+"""
+orders.py
+-- In-memory Beckn order state machine with batched write-behind to Postgres
+"""
+from __future__ import annotations
+
+import copy
+import logging
+import threading
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from ..config import settings
+from ..db import SessionLocal
+from .. import models
+
+logger = logging.getLogger("beckn.orders")
+
+PENDING = "PENDING"
+CONFIRMED = "CONFIRMED"
+IN_PROGRESS = "IN_PROGRESS"
+COMPLETED = "COMPLETED"
+CANCELLED = "CANCELLED"
+
+# allowed transitions: current status -> set of next statuses (None = order not seen yet)
+TRANSITIONS: Dict[Optional[str], set[str]] = {
+    None: {PENDING, CONFIRMED},
+    PENDING: {PENDING, CONFIRMED, CANCELLED},
+    CONFIRMED: {IN_PROGRESS, CANCELLED},
+    IN_PROGRESS: {COMPLETED, CANCELLED},
+    COMPLETED: set(),
+    CANCELLED: set(),
+}
+
+
+class InvalidTransition(Exception):
+    def __init__(self, transaction_id: str, current: Optional[str], target: str):
+        super().__init__(f"cannot move order {transaction_id} from {current} to {target}")
+        self.transaction_id = transaction_id
+        self.current = current
+        self.target = target
+
+
+def new_id() -> str:
+    """Collision-free identifier for transaction/message/order ids."""
+    return str(uuid.uuid4())
+
+
+def _now() -> datetime:
+    return datetime.now(tz=timezone.utc)
+
+
+class OrderStore:
+    """Orders indexed by transaction_id in memory; dirty orders are flushed in batches.
+
+    Transitions only touch the in-memory index under a lock, so select/confirm/status
+    never wait on a database round trip. A background thread upserts dirty orders every
+    `flush_interval_s` seconds, or sooner once `batch_size` orders are pending. Once
+    flushed, the least recently used orders beyond `max_cached` are dropped from memory.
+    """
+
+    def __init__(
+        self,
+        session_factory=SessionLocal,
+        flush_interval_s: float = 0.5,
+        batch_size: int = 500,
+        max_cached: int = 100_000,
+    ):
+        self._session_factory = session_factory
+        self.flush_interval_s = flush_interval_s
+        self.batch_size = batch_size
+        self.max_cached = max_cached
+        self._orders: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._dirty: set[str] = set()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.flushed = 0
+        self.flush_errors = 0
+
+    # -- lifecycle -----------------------------------------------------------
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="beckn-order-flusher", daemon=True)
+        self._thread.start()
+
+    def close(self) -> None:
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+            self._thread = None
+        self.flush()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_interval_s)
+            self._wake.clear()
+            self.flush()
+
+    # -- state machine -------------------------------------------------------
+    def is_cached(self, transaction_id: str) -> bool:
+        return transaction_id in self._orders
+
+    def get(self, transaction_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            order = self._orders.get(transaction_id)
+            if order is not None:
+                self._orders.move_to_end(transaction_id)
+                return copy.deepcopy(order)
+        # Miss: the order may have been created by another worker
+        order = self._load(transaction_id)
+        if order is None:
+            return None
+        with self._lock:
+            order = self._orders.setdefault(transaction_id, order)
+            return copy.deepcopy(order)
+
+    def transition(self, transaction_id: str, target: str, **fields: Any) -> Dict[str, Any]:
+        """Apply a transition in memory only; call get() first to warm a miss from Postgres."""
+        with self._lock:
+            order = self._orders.get(transaction_id)
+            status = order["status"] if order else None
+            if target not in TRANSITIONS.get(status, set()):
+                raise InvalidTransition(transaction_id, status, target)
+            now = _now()
+            if order is None:
+                order = {
+                    "transaction_id": transaction_id,
+                    "order_id": new_id(),
+                    "bap_id": None,
+                    "bap_uri": None,
+                    "provider_id": None,
+                    "items": [],
+                    "version": 0,
+                    "created_at": now,
+                }
+                self._orders[transaction_id] = order
+            else:
+                self._orders.move_to_end(transaction_id)
+            for k, v in fields.items():
+                if v is not None:
+                    order[k] = v
+            order["status"] = target
+            order["version"] += 1
+            order["updated_at"] = now
+            self._dirty.add(transaction_id)
+            pending = len(self._dirty)
+            snapshot = copy.deepcopy(order)
+        if pending >= self.batch_size:
+            self._wake.set()
+        return snapshot
+
+    # -- persistence ---------------------------------------------------------
+    def _load(self, transaction_id: str) -> Optional[Dict[str, Any]]:
+        try:
+            with self._session_factory() as db:
+                row = db.scalar(select(models.BecknOrder).where(models.BecknOrder.transaction_id == transaction_id))
+                if row is None:
+                    return None
+                return {
+                    "transaction_id": row.transaction_id,
+                    "order_id": row.order_id,
+                    "bap_id": row.bap_id,
+                    "bap_uri": row.bap_uri,
+                    "provider_id": row.provider_id,
+                    "items": row.items or [],
+                    "status": row.status,
+                    "version": row.version,
+                    "created_at": row.created_at,
+                    "updated_at": row.updated_at,
+                }
+        except Exception:
+            logger.exception("Failed to load beckn order %s", transaction_id)
+            return None
+
+    def flush(self) -> int:
+        with self._lock:
+            if not self._dirty:
+                return 0
+            batch = [copy.deepcopy(self._orders[t]) for t in self._dirty]
+            self._dirty.clear()
+        written = 0
+        try:
+            with self._session_factory() as db:
+                for i in range(0, len(batch), self.batch_size):
+                    chunk = batch[i:i + self.batch_size]
+                    stmt = pg_insert(models.BecknOrder).values(chunk)
+                    # by key: attribute access would give excluded.items the collection's items() method
+                    stmt = stmt.on_conflict_do_update(
+                        index_elements=[models.BecknOrder.transaction_id],
+                        set_={
+                            c: stmt.excluded[c]
+                            for c in ("bap_id", "bap_uri", "provider_id", "items", "status", "version", "updated_at")
+                        },
+                        where=models.BecknOrder.version < stmt.excluded.version,
+                    )
+                    db.execute(stmt)
+                    written += len(chunk)
+                db.commit()
+        except Exception:
+            self.flush_errors += 1
+            logger.exception("Beckn order flush failed; %d orders will be retried", len(batch))
+            with self._lock:
+                self._dirty.update(o["transaction_id"] for o in batch)
+            return 0
+        self.flushed += written
+        self._evict()
+        return written
+
+    def _evict(self) -> None:
+        with self._lock:
+            excess = len(self._orders) - self.max_cached
+            if excess <= 0:
+                return
+            for transaction_id in list(self._orders.keys()):
+                if excess <= 0:
+                    break
+                if transaction_id in self._dirty:
+                    continue
+                del self._orders[transaction_id]
+                excess -= 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "orders": len(self._orders),
+                "dirty": len(self._dirty),
+                "flushed": self.flushed,
+                "flush_errors": self.flush_errors,
+            }
+
+
+_global_store: Optional[OrderStore] = None
+_global_lock = threading.Lock()
+
+
+def get_order_store() -> OrderStore:
+    global _global_store
+    if _global_store is None:
+        with _global_lock:
+            if _global_store is None:
+                store = OrderStore(
+                    flush_interval_s=settings.beckn_order_flush_interval_s,
+                    batch_size=settings.beckn_order_flush_batch_size,
+                    max_cached=settings.beckn_order_cache_size,
+                )
+                store.start()
+                _global_store = store
+    return _global_store
+
+
+def shutdown_order_store() -> None:
+    global _global_store
+    if _global_store is not None:
+        _global_store.close()
+        _global_store = None
@@ -1,8 +1,15 @@
-from fastapi import APIRouter, Request
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import Response
 from pydantic import BaseModel
-from typing import Any, Dict
+from typing import Any, Awaitable, Callable, Dict
+import json
 import time
+from ..config import settings
 from ..routes.launch import list_launch_stores, launch_plan
+from .orders import get_order_store, new_id, InvalidTransition, PENDING, CONFIRMED
+from . import dispatcher
+from .auth import get_signer, verify_beckn_request
 
 
 router = APIRouter(prefix="/beckn", tags=["beckn"])
@@ -22,23 +29,84 @@ class BecknContext(BaseModel):
     timestamp: str | None = None
 
 
-def _ctx(action: str) -> Dict[str, Any]:
-    return {
+def _ctx(action: str, req_ctx: Dict[str, Any] | None = None) -> Dict[str, Any]:
+    req_ctx = req_ctx or {}
+    ctx = {
         "domain": "nic2004:60232",
         "country": "IND",
         "city": "*",
         "action": action,
         "bpp_id": "eleride-bpp",
         "bpp_uri": "http://localhost:8000/beckn",
-        "transaction_id": str(int(time.time()*1000)),
-        "message_id": str(int(time.time()*1000)+1),
+        # Reuse the caller's transaction so callbacks correlate; mint fresh ids otherwise
+        "transaction_id": req_ctx.get("transaction_id") or new_id(),
+        "message_id": req_ctx.get("message_id") or new_id(),
         "timestamp": time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
     }
-
-
-@router.post("/bpp/search")
-async def bpp_search(req: Request):
-    body = await req.json()
+    if req_ctx.get("bap_id"):
+        ctx["bap_id"] = req_ctx["bap_id"]
+    if req_ctx.get("bap_uri"):
+        ctx["bap_uri"] = req_ctx["bap_uri"]
+    return ctx
+
+
+def _order_payload(order: Dict[str, Any]) -> Dict[str, Any]:
+    out: Dict[str, Any] = {"id": order["order_id"], "status": order["status"], "items": order.get("items") or []}
+    if order.get("provider_id"):
+        out["provider"] = {"id": order["provider_id"]}
+    return out
+
+
+async def _reply(content: Dict[str, Any], status_code: int = 200) -> Response:
+    body = json.dumps(content, ensure_ascii=False, separators=(",", ":"), default=str).encode()
+    signer = get_signer()
+    headers = await signer.asign(body) if signer is not None else None
+    return Response(content=body, status_code=status_code, media_type="application/json", headers=headers)
+
+
+async def _respond(ctx: Dict[str, Any], payload: Dict[str, Any] | Callable[[], Awaitable[Dict[str, Any]]]):
+    """ACK now and deliver the payload to bap_uri later; inline reply when there is no bap_uri."""
+    bap_uri = ctx.get("bap_uri")
+    if not (settings.beckn_async_callbacks and bap_uri):
+        return await _reply(payload if isinstance(payload, dict) else await payload())
+    ack_ctx = {**ctx, "action": ctx["action"].removeprefix("on_")}
+    if not dispatcher.get_dispatcher().submit(bap_uri, ctx["action"], payload):
+        return await _reply(
+            {
+                "context": ack_ctx,
+                "message": {"ack": {"status": "NACK"}},
+                "error": {"type": "CORE-ERROR", "code": "30000", "message": "callback queue full"},
+            },
+            status_code=503,
+        )
+    return await _reply({"context": ack_ctx, "message": {"ack": {"status": "ACK"}}})
+
+
+async def _transition(body: Dict[str, Any], action: str, target: str):
+    req_ctx = body.get("context") or {}
+    ctx = _ctx(action, req_ctx)
+    order_in = (body.get("message") or {}).get("order") or {}
+    provider = order_in.get("provider") or {}
+    store = get_order_store()
+    if not store.is_cached(ctx["transaction_id"]):
+        # the transaction may have been seen by another worker, select included: warm it
+        # from Postgres so a repeat select keeps its order_id instead of minting a new one
+        await run_in_threadpool(store.get, ctx["transaction_id"])
+    try:
+        order = store.transition(
+            ctx["transaction_id"],
+            target,
+            bap_id=req_ctx.get("bap_id"),
+            bap_uri=req_ctx.get("bap_uri"),
+            provider_id=provider.get("id") if isinstance(provider, dict) else None,
+            items=order_in.get("items") or None,
+        )
+    except InvalidTransition as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return await _respond(ctx, {"context": ctx, "message": {"order": _order_payload(order)}})
+
+
+def _build_catalog() -> Dict[str, Any]:
     # Build a minimal Beckn catalog from launch-ready stores
     providers: list[dict[str, Any]] = []
     try:
@@ -61,24 +129,52 @@ async def bpp_search(req: Request):
                 continue
     except Exception:
         providers = []
-    return {"context": _ctx("on_search"), "message": {"catalog": {"providers": providers}}}
+    return {"providers": providers}
+
 
+@router.post("/bpp/search", dependencies=[Depends(verify_beckn_request)])
+async def bpp_search(req: Request):
+    body = await req.json()
+    ctx = _ctx("on_search", body.get("context"))
 
-@router.post("/bpp/select")
+    async def build() -> Dict[str, Any]:
+        catalog = await run_in_threadpool(_build_catalog)
+        return {"context": ctx, "message": {"catalog": catalog}}
+
+    return await _respond(ctx, build)
+
+
+@router.post("/bpp/select", dependencies=[Depends(verify_beckn_request)])
 async def bpp_select(req: Request):
-    _ = await req.json()
-    return {"context": _ctx("on_select"), "message": {"order": {"status": "PENDING"}}}
+    body = await req.json()
+    return await _transition(body, "on_select", PENDING)
 
 
-@router.post("/bpp/confirm")
+@router.post("/bpp/confirm", dependencies=[Depends(verify_beckn_request)])
 async def bpp_confirm(req: Request):
-    _ = await req.json()
-    return {"context": _ctx("on_confirm"), "message": {"order": {"status": "CONFIRMED"}}}
+    body = await req.json()
+    return await _transition(body, "on_confirm", CONFIRMED)
 
 
-@router.post("/bpp/status")
+@router.post("/bpp/status", dependencies=[Depends(verify_beckn_request)])
 async def bpp_status(req: Request):
-    _ = await req.json()
-    return {"context": _ctx("on_status"), "message": {"order": {"status": "IN_PROGRESS"}}}
+    body = await req.json()
+    req_ctx = body.get("context") or {}
+    transaction_id = req_ctx.get("transaction_id")
+    if not transaction_id:
+        raise HTTPException(status_code=400, detail="context.transaction_id is required")
+    order = await run_in_threadpool(get_order_store().get, transaction_id)
+    if order is None:
+        raise HTTPException(status_code=404, detail="Order not found")
+    ctx = _ctx("on_status", req_ctx)
+    return await _respond(ctx, {"context": ctx, "message": {"order": _order_payload(order)}})
+
+
+@router.get("/metrics")
+def beckn_metrics():
+    return {
+        "dispatcher": dispatcher.dispatcher_metrics(),
+        "orders": get_order_store().stats(),
+    }
 
 
@@ -12,11 +12,87 @@ class Settings(BaseSettings):
 
     database_url: str = "postgresql+psycopg://ev:evpass@db:5432/evdb"
 
+    # Connection pools (applied to both the sync and the async engine)
+    db_pool_size: int = 10
+    db_max_overflow: int = 20
+    db_pool_timeout_s: float = 30.0
+    db_pool_recycle_s: int = 1800
+    db_statement_timeout_ms: int = 30_000  # 0 disables
+
+    # Optional read replicas for read-only endpoints (comma-separated URLs)
+    database_replica_urls: str = ""
+    replica_check_interval_s: float = 5.0
+    replica_max_lag_s: float = 30.0  # 0 disables the lag check
+
     cors_origins: List[AnyHttpUrl] | List[str] = ["http://localhost:5173"]
     cors_origin_regex: Optional[str] = None
 
     model_dir: str = "/models"
     etl_input_path: str = "/data/sample_jobs.csv"
+    etl_chunk_rows: int = 0  # >0 streams the preprocess in chunks of this many rows
+    etl_stage_workers: int = 2  # ETL stages run at once once their inputs are ready (train || ingest)
+    # Only rows created since the last run's watermark are processed unless a full run is asked for
+    etl_incremental: bool = True
+    etl_watermark_path: str = "/data/etl_watermark.json"
+    # Outputs of preprocess/zones/train are reused when code, inputs and parameters match
+    etl_cache: bool = True
+    etl_cache_dir: str = "/data/etl_cache"
+    etl_cache_max_mb: int = 2048
+    # Interchange between ETL stages: "parquet" (typed) or "csv"; CSV copies can be exported alongside
+    etl_format: str = "parquet"
+    etl_export_csv: bool = False
+    # Zone clustering: "incremental" updates the existing zones in place, "full" re-clusters
+    zones_mode: str = "incremental"
+    zones_batch_rows: int = 500_000
+    # Nearest-zone lookups for POST /jobs and estimates; the zones file is re-checked this often
+    zones_path: str = "/data/zones.parquet"
+    zone_index_check_s: float = 5.0
+    # POST /estimate/batch: trips priced per request
+    estimate_batch_max_trips: int = 10_000
+    # Micro-batching of concurrent POST /estimate calls into one model call (off by default)
+    estimate_microbatch: bool = False
+    estimate_microbatch_max_size: int = 64
+    estimate_microbatch_max_wait_ms: float = 1.0
+
+    # Uploaded ETL runs (POST /jobs/admin/upload-and-run-etl)
+    etl_upload_dir: str = "/tmp"
+    etl_max_upload_mb: int = 512
+    etl_workers: int = 1
+
+    # Bloom filter of external_job_ids in front of the POST /jobs duplicate lookup
+    job_id_filter: bool = True
+    job_id_filter_capacity: int = 1_000_000
+    job_id_filter_fpr: float = 0.01
+
+    # POST /jobs write-behind: ack once in the local log, insert in batches
+    jobs_write_behind: bool = False
+    jobs_write_behind_dir: str = "/tmp/eleride-jobs-log"
+    jobs_write_behind_fsync: bool = True
+    jobs_flush_interval_s: float = 0.2
+    jobs_flush_batch_size: int = 1000
+
+    # Beckn order store write-behind
+    beckn_order_flush_interval_s: float = 0.5
+    beckn_order_flush_batch_size: int = 500
+    beckn_order_cache_size: int = 100_000
+
+    # Beckn async callbacks to bap_uri
+    beckn_async_callbacks: bool = True
+    beckn_callback_queue_size: int = 1000
+    beckn_callback_workers: int = 8
+    beckn_callback_per_bap_concurrency: int = 4
+    beckn_callback_max_retries: int = 3
+    beckn_callback_backoff_s: float = 0.5
+    beckn_callback_timeout_s: float = 10.0
+
+    # Beckn message signing (Ed25519) and request verification
+    beckn_subscriber_id: str = "eleride-bpp"
+    beckn_unique_key_id: str = "k1"
+    beckn_signing_private_key: Optional[str] = None
+    beckn_signature_ttl_s: int = 300
+    beckn_verify_requests: bool = False
+    beckn_registry_url: Optional[str] = None
+    beckn_key_cache_ttl_s: float = 3600.0
 
     # Pydantic v2 settings
     model_config = SettingsConfigDict(
@@ -65,6 +141,10 @@ class Settings(BaseSettings):
         ))
         return rebuilt
 
+    @property
+    def replica_urls(self) -> List[str]:
+        return [self.ensure_ssl(u.strip()) for u in self.database_replica_urls.split(",") if u.strip()]
+
 
 settings = Settings()
 
@@ -1,23 +1,322 @@
+import math
+from datetime import datetime, timezone
+from typing import AsyncIterator, Callable, Iterable, Iterator
 from sqlalchemy.orm import Session
-from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, tuple_, or_, bindparam, func
 from . import models, schemas
+from .services.geo import (
+    EARTH_RADIUS_KM, geohash_encode, geohash_encode_many, cells_for_radius, cells_for_bbox, bounding_box,
+)
+from .services import rollups
+from .services.id_filter import get_job_id_filter, note_inserted
+
+
+def _new_job(job_in: schemas.JobCreate) -> models.Job:
+    return models.Job(**job_in.model_dump(), pickup_geohash=geohash_encode(job_in.pickup_lat, job_in.pickup_lng))
 
 
 def create_job(db: Session, job_in: schemas.JobCreate) -> models.Job:
-    job = models.Job(**job_in.model_dump())
+    job = _new_job(job_in)
     db.add(job)
+    rollups.apply_increments(db, rollups.job_increments([job_in]))
     db.commit()
+    note_inserted([job_in.external_job_id])
     db.refresh(job)
     return job
 
 
+async def acreate_job(db: AsyncSession, job_in: schemas.JobCreate) -> models.Job:
+    job = _new_job(job_in)
+    db.add(job)
+    await rollups.aapply_increments(db, rollups.job_increments([job_in]))
+    await db.commit()
+    note_inserted([job_in.external_job_id])
+    await db.refresh(job)
+    return job
+
+
 def get_job_by_external_id(db: Session, external_job_id: str) -> models.Job | None:
     stmt = select(models.Job).where(models.Job.external_job_id == external_job_id)
     return db.scalar(stmt)
 
 
-def list_jobs(db: Session, skip: int = 0, limit: int = 100) -> list[models.Job]:
-    stmt = select(models.Job).offset(skip).limit(limit)
-    return list(db.scalars(stmt).all())
+async def aget_job_by_external_id(db: AsyncSession, external_job_id: str) -> models.Job | None:
+    stmt = select(models.Job).where(models.Job.external_job_id == external_job_id)
+    return await db.scalar(stmt)
+
+
+async def aexternal_id_exists(db: AsyncSession, external_job_id: str) -> bool:
+    """Duplicate check for inserts; skips the query when the id filter rules the id out.
+
+    Ids inserted by other processes may be unknown to the filter, so the insert
+    itself must still handle the unique violation.
+    """
+    id_filter = get_job_id_filter()
+    if id_filter is not None and not id_filter.might_contain(external_job_id):
+        return False
+    stmt = select(models.Job.id).where(models.Job.external_job_id == external_job_id)
+    found = await db.scalar(stmt) is not None
+    if not found and id_filter is not None and id_filter.ready:
+        id_filter.record_false_positive()
+    return found
+
+
+def _job_filters(stmt, since: datetime | None, until: datetime | None, zone: str | None, table=None):
+    cols = table.c if table is not None else models.Job
+    if since is not None:
+        stmt = stmt.where(cols.timestamp >= since)
+    if until is not None:
+        stmt = stmt.where(cols.timestamp < until)
+    if zone is not None:
+        stmt = stmt.where(cols.zone == zone)
+    return stmt
+
+
+def _list_jobs_stmt(skip, limit, after, since, until, zone):
+    stmt = select(models.Job).order_by(models.Job.timestamp, models.Job.id)
+    stmt = _job_filters(stmt, since, until, zone)
+    if after is not None:
+        stmt = stmt.where(tuple_(models.Job.timestamp, models.Job.id) > tuple_(*after))
+    elif skip:
+        stmt = stmt.offset(skip)
+    return stmt.limit(limit)
+
+
+def list_jobs(
+    db: Session,
+    skip: int = 0,
+    limit: int = 100,
+    after: tuple[datetime, int] | None = None,
+    since: datetime | None = None,
+    until: datetime | None = None,
+    zone: str | None = None,
+) -> list[models.Job]:
+    """Jobs ordered by (timestamp, id); `after` seeks past a keyset position instead of OFFSET.
+
+    `since` is inclusive and `until` exclusive; both are naive UTC like jobs.timestamp.
+    """
+    return list(db.scalars(_list_jobs_stmt(skip, limit, after, since, until, zone)).all())
+
+
+async def alist_jobs(
+    db: AsyncSession,
+    skip: int = 0,
+    limit: int = 100,
+    after: tuple[datetime, int] | None = None,
+    since: datetime | None = None,
+    until: datetime | None = None,
+    zone: str | None = None,
+) -> list[models.Job]:
+    return list((await db.scalars(_list_jobs_stmt(skip, limit, after, since, until, zone))).all())
+
+
+def _iter_jobs_stmt(after, since, until, zone, yield_per):
+    table = models.Job.__table__
+    stmt = select(*table.c).order_by(table.c.timestamp, table.c.id)
+    stmt = _job_filters(stmt, since, until, zone, table=table)
+    if after is not None:
+        stmt = stmt.where(tuple_(table.c.timestamp, table.c.id) > tuple_(*after))
+    return stmt.execution_options(yield_per=yield_per)
+
+
+def iter_jobs(
+    db: Session,
+    after: tuple[datetime, int] | None = None,
+    since: datetime | None = None,
+    until: datetime | None = None,
+    zone: str | None = None,
+    yield_per: int = 1000,
+) -> Iterator[dict]:
+    """Stream every matching job as a plain dict through a server-side cursor."""
+    result = db.execute(_iter_jobs_stmt(after, since, until, zone, yield_per))
+    for row in result.mappings():
+        yield dict(row)
+
+
+async def aiter_jobs(
+    db: AsyncSession,
+    after: tuple[datetime, int] | None = None,
+    since: datetime | None = None,
+    until: datetime | None = None,
+    zone: str | None = None,
+    yield_per: int = 1000,
+) -> AsyncIterator[dict]:
+    result = await db.stream(_iter_jobs_stmt(after, since, until, zone, yield_per))
+    async for row in result.mappings():
+        yield dict(row)
+
+
+# Column order for row tuples passed to bulk_insert_jobs
+JOB_COLUMNS = (
+    "external_job_id", "timestamp", "pickup_lat", "pickup_lng",
+    "dropoff_lat", "dropoff_lng", "energy_kwh", "price_usd", "zone", "pickup_geohash",
+)
+
+
+def job_row(job_in: schemas.JobCreate) -> tuple:
+    """JobCreate as a bulk_insert_jobs tuple; aware timestamps are stored as naive UTC."""
+    data = job_in.model_dump()
+    ts = data["timestamp"]
+    if ts.tzinfo is not None:
+        data["timestamp"] = ts.astimezone(timezone.utc).replace(tzinfo=None)
+    data["pickup_geohash"] = geohash_encode(data["pickup_lat"], data["pickup_lng"])
+    return tuple(data[c] for c in JOB_COLUMNS)
+
+
+def bulk_insert_jobs(
+    db: Session,
+    rows: Iterable[tuple],
+    batch_size: int = 100_000,
+    on_batch: Callable[[Session, list[str]], None] | None = None,
+) -> list[str]:
+    """Insert job tuples (ordered as JOB_COLUMNS), skipping existing external_job_ids.
+
+    Each batch is COPYed into a temp staging table and merged with
+    INSERT ... SELECT ... ON CONFLICT (external_job_id) DO NOTHING, then committed.
+    `on_batch(db, inserted_ids)` runs inside each batch's transaction, before the commit.
+    Returns the external_job_ids that were actually inserted.
+    """
+    cols = ", ".join(f'"{c}"' for c in JOB_COLUMNS)
+    inserted: list[str] = []
+    batch: list[tuple] = []
+
+    def _flush():
+        if not batch:
+            return
+        raw = db.connection().connection.driver_connection
+        with raw.cursor() as cur:
+            cur.execute(
+                f"CREATE TEMP TABLE IF NOT EXISTS jobs_stage ON COMMIT DELETE ROWS AS "
+                f"SELECT {cols} FROM jobs WITH NO DATA"
+            )
+            with cur.copy(f"COPY jobs_stage ({cols}) FROM STDIN") as copy:
+                for row in batch:
+                    copy.write_row(row)
+            cur.execute(
+                f"INSERT INTO jobs ({cols}) SELECT {cols} FROM jobs_stage "
+                f"ON CONFLICT (external_job_id) DO NOTHING RETURNING external_job_id"
+            )
+            ids = [r[0] for r in cur.fetchall()]
+        if on_batch is not None and ids:
+            on_batch(db, ids)
+        inserted.extend(ids)
+        db.commit()
+        note_inserted(ids)
+        batch.clear()
+
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            _flush()
+    _flush()
+    return inserted
+
+
+def job_zones(db: Session, external_job_ids: list[str]) -> dict[str, str | None]:
+    """Stored zone per external_job_id, for the ids that are in the jobs table."""
+    t = models.Job.__table__
+    rows = db.execute(select(t.c.external_job_id, t.c.zone).where(t.c.external_job_id.in_(external_job_ids)))
+    return dict(rows.all())
+
+
+def set_job_zones(db: Session, external_job_ids: list[str], zones: list[str | None]) -> None:
+    """Point already-stored jobs at new zones (after a re-cluster), within the caller's transaction."""
+    t = models.Job.__table__
+    db.execute(
+        t.update().where(t.c.external_job_id == bindparam("_id")).values(zone=bindparam("_zone")),
+        [{"_id": i, "_zone": z} for i, z in zip(external_job_ids, zones)],
+    )
+
+
+def _prefix_filter(cells: list[str]):
+    return or_(*[models.Job.pickup_geohash.like(f"{c}%") for c in cells])
+
+
+def _distance_km(lat: float, lng: float):
+    """Haversine distance from (lat, lng) to each job's pickup, as a SQL expression (geo.haversine_np's formula)."""
+    j = models.Job
+    a = (
+        func.power(func.sin(func.radians(j.pickup_lat - lat) / 2), 2)
+        + math.cos(math.radians(lat)) * func.cos(func.radians(j.pickup_lat))
+        * func.power(func.sin(func.radians(j.pickup_lng - lng) / 2), 2)
+    )
+    # rounding can push `a` a hair past 1, outside asin's domain
+    return 2 * EARTH_RADIUS_KM * func.asin(func.sqrt(func.least(a, 1.0)))
+
+
+def _near_stmt(lat: float, lng: float, radius_km: float, limit: int):
+    min_lat, min_lng, max_lat, max_lng = bounding_box(lat, lng, radius_km)
+    dist = _distance_km(lat, lng)
+    return (
+        select(models.Job, dist.label("distance_km"))
+        .where(
+            _prefix_filter(cells_for_radius(lat, lng, radius_km)),
+            models.Job.pickup_lat.between(min_lat, max_lat),
+            models.Job.pickup_lng.between(min_lng, max_lng),
+            dist <= radius_km,
+        )
+        .order_by(dist, models.Job.id)
+        .limit(limit)
+    )
+
+
+def jobs_near(db: Session, lat: float, lng: float, radius_km: float, limit: int = 100) -> list[tuple[models.Job, float]]:
+    """Jobs whose pickup lies within radius_km, nearest first, with their distance.
+
+    Candidates are pruned by geohash prefix and bounding box; the exact haversine
+    filter, the ordering and the limit run in SQL too, so only `limit` rows come back.
+    """
+    return [(j, float(d)) for j, d in db.execute(_near_stmt(lat, lng, radius_km, limit)).all()]
+
+
+async def ajobs_near(
+    db: AsyncSession, lat: float, lng: float, radius_km: float, limit: int = 100
+) -> list[tuple[models.Job, float]]:
+    return [(j, float(d)) for j, d in (await db.execute(_near_stmt(lat, lng, radius_km, limit))).all()]
+
+
+def _bbox_stmt(min_lat: float, min_lng: float, max_lat: float, max_lng: float, limit: int):
+    return (
+        select(models.Job)
+        .where(
+            _prefix_filter(cells_for_bbox(min_lat, min_lng, max_lat, max_lng)),
+            models.Job.pickup_lat.between(min_lat, max_lat),
+            models.Job.pickup_lng.between(min_lng, max_lng),
+        )
+        .order_by(models.Job.timestamp, models.Job.id)
+        .limit(limit)
+    )
+
+
+def jobs_in_bbox(
+    db: Session, min_lat: float, min_lng: float, max_lat: float, max_lng: float, limit: int = 1000
+) -> list[models.Job]:
+    return list(db.scalars(_bbox_stmt(min_lat, min_lng, max_lat, max_lng, limit)).all())
+
+
+async def ajobs_in_bbox(
+    db: AsyncSession, min_lat: float, min_lng: float, max_lat: float, max_lng: float, limit: int = 1000
+) -> list[models.Job]:
+    return list((await db.scalars(_bbox_stmt(min_lat, min_lng, max_lat, max_lng, limit))).all())
 
 
+def backfill_pickup_geohash(db: Session, batch_size: int = 10_000) -> int:
+    """Populate pickup_geohash for rows inserted before the column existed."""
+    updated = 0
+    while True:
+        rows = db.execute(
+            select(models.Job.id, models.Job.pickup_lat, models.Job.pickup_lng)
+            .where(models.Job.pickup_geohash.is_(None))
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            return updated
+        ids, lats, lngs = zip(*rows)
+        cells = geohash_encode_many(lats, lngs)
+        db.execute(
+            models.Job.__table__.update().where(models.Job.id == bindparam("_id")).values(pickup_geohash=bindparam("_gh")),
+            [{"_id": i, "_gh": c or ""} for i, c in zip(ids, cells)],
+        )
+        db.commit()
+        updated += len(rows)
@@ -1,15 +1,124 @@
-from sqlalchemy import create_engine
+import bisect
+import itertools
+import logging
+import threading
+import time
+
+from sqlalchemy import create_engine, exc, text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, DeclarativeBase
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 from .config import settings
 
+logger = logging.getLogger("db")
+
 
 class Base(DeclarativeBase):
     pass
 
 
-engine = create_engine(settings.database_url, pool_pre_ping=True)
+class PoolStats:
+    """Checkout wait times and saturation for one connection pool."""
+
+    BUCKETS_MS = (1, 5, 10, 50, 100, 500, 1000, 5000)
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total_s = 0.0
+        self.wait_max_s = 0.0
+        self.peak_checked_out = 0
+        self._histogram = [0] * (len(self.BUCKETS_MS) + 1)
+
+    def record(self, wait_s: float, checked_out: int) -> None:
+        with self._lock:
+            self.checkouts += 1
+            self.wait_total_s += wait_s
+            self.wait_max_s = max(self.wait_max_s, wait_s)
+            self.peak_checked_out = max(self.peak_checked_out, checked_out)
+            self._histogram[bisect.bisect_left(self.BUCKETS_MS, wait_s * 1000)] += 1
+
+    def record_timeout(self) -> None:
+        with self._lock:
+            self.timeouts += 1
+
+    def snapshot(self, pool: QueuePool) -> dict:
+        capacity = pool.size() + max(pool._max_overflow, 0)
+        checked_out = pool.checkedout()
+        with self._lock:
+            labels = [f"le_{b}ms" for b in self.BUCKETS_MS] + ["gt_%dms" % self.BUCKETS_MS[-1]]
+            return {
+                "pool_size": pool.size(),
+                "max_overflow": pool._max_overflow,
+                "checked_out": checked_out,
+                "checked_in": pool.checkedin(),
+                "overflow": max(pool.overflow(), 0),
+                "saturation": round(checked_out / capacity, 3) if capacity else None,
+                "peak_checked_out": self.peak_checked_out,
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "wait_avg_ms": round(self.wait_total_s / self.checkouts * 1000, 3) if self.checkouts else 0.0,
+                "wait_max_ms": round(self.wait_max_s * 1000, 3),
+                "wait_histogram": dict(zip(labels, self._histogram)),
+            }
+
+
+class _TimedPoolMixin:
+    """Times every checkout, including the wait for a free connection."""
+
+    stats: PoolStats
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            conn = super()._do_get()
+        except exc.TimeoutError:
+            self.stats.record_timeout()
+            logger.warning("%s pool exhausted: no connection within %ss", self.stats.name, self._timeout)
+            raise
+        self.stats.record(time.perf_counter() - start, self.checkedout())
+        return conn
+
+    def recreate(self):
+        # engine.dispose() swaps in a fresh pool; keep counting into the same stats
+        pool = super().recreate()
+        pool.stats = self.stats
+        return pool
+
+
+class TimedQueuePool(_TimedPoolMixin, QueuePool):
+    pass
+
+
+class TimedAsyncQueuePool(_TimedPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+def _engine_kwargs(poolclass) -> dict:
+    kwargs = dict(
+        poolclass=poolclass,
+        pool_pre_ping=True,
+        pool_size=settings.db_pool_size,
+        max_overflow=settings.db_max_overflow,
+        pool_timeout=settings.db_pool_timeout_s,
+        pool_recycle=settings.db_pool_recycle_s,
+    )
+    if settings.db_statement_timeout_ms:
+        kwargs["connect_args"] = {"options": f"-c statement_timeout={settings.db_statement_timeout_ms}"}
+    return kwargs
+
+
+# Both engines draw on the same pool settings; each process holds one pool of each kind
+engine = create_engine(settings.database_url, **_engine_kwargs(TimedQueuePool))
+engine.pool.stats = PoolStats("sync")
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
 
+async_engine = create_async_engine(settings.database_url, **_engine_kwargs(TimedAsyncQueuePool))
+async_engine.sync_engine.pool.stats = PoolStats("async")
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+
 
 def get_db():
     db = SessionLocal()
@@ -19,3 +128,182 @@ def get_db():
         db.close()
 
 
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+# Lag is only meaningful while the replica still has WAL to replay; an idle
+# primary would otherwise make a caught-up replica look stale.
+_LAG_SQL = text(
+    "SELECT CASE WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() "
+    "THEN 0 ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+)
+
+
+class Replica:
+    def __init__(self, url: str, name: str):
+        self.name = name
+        self.engine = create_engine(url, **_engine_kwargs(TimedQueuePool))
+        self.engine.pool.stats = PoolStats(name)
+        self.async_engine = create_async_engine(url, **_engine_kwargs(TimedAsyncQueuePool))
+        self.async_engine.sync_engine.pool.stats = PoolStats(f"{name}-async")
+        self.sessionmaker = sessionmaker(bind=self.engine, autoflush=False, autocommit=False)
+        self.async_sessionmaker = async_sessionmaker(bind=self.async_engine, autoflush=False, expire_on_commit=False)
+        self.healthy = True
+        self.lag_s = 0.0
+        self.last_error: str | None = None
+
+    def status(self) -> dict:
+        return {"healthy": self.healthy, "lag_s": round(self.lag_s, 3), "last_error": self.last_error}
+
+
+class ReplicaSet:
+    """Round-robin over healthy replicas, probed in the background.
+
+    A replica is taken out of rotation when a probe fails, its replay lag exceeds
+    `max_lag_s`, or a request cannot connect to it; the next successful probe puts
+    it back. With no healthy replica, reads go to the primary.
+    """
+
+    def __init__(self, urls: list[str], check_interval_s: float = 5.0, max_lag_s: float = 30.0):
+        self.replicas = [Replica(url, f"replica{i}") for i, url in enumerate(urls)]
+        self.check_interval_s = check_interval_s
+        self.max_lag_s = max_lag_s
+        self._next = itertools.count()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> None:
+        if not self.replicas or (self._thread is not None and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="replica-health", daemon=True)
+        self._thread.start()
+
+    def close(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        for r in self.replicas:
+            r.engine.dispose()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.check_interval_s):
+            self.check()
+
+    def check(self) -> None:
+        for r in self.replicas:
+            try:
+                with r.engine.connect() as conn:
+                    r.lag_s = float(conn.execute(_LAG_SQL).scalar() or 0.0)
+            except Exception as e:
+                self.mark_down(r, e)
+                continue
+            if self.max_lag_s and r.lag_s > self.max_lag_s:
+                self.mark_down(r, f"replication lag {r.lag_s:.1f}s")
+            elif not r.healthy:
+                logger.info("%s back in rotation", r.name)
+                r.healthy = True
+                r.last_error = None
+
+    def mark_down(self, replica: Replica, reason) -> None:
+        if replica.healthy:
+            logger.warning("%s out of rotation: %s", replica.name, reason)
+        replica.healthy = False
+        replica.last_error = str(reason)
+
+    def in_turn(self) -> list[Replica]:
+        """Healthy replicas, starting from the next one in round-robin order."""
+        healthy = [r for r in self.replicas if r.healthy]
+        if not healthy:
+            return []
+        start = next(self._next) % len(healthy)
+        return healthy[start:] + healthy[:start]
+
+    def status(self) -> dict:
+        return {r.name: r.status() for r in self.replicas}
+
+
+_replicas: ReplicaSet | None = None
+_replicas_lock = threading.Lock()
+
+
+def get_replicas() -> ReplicaSet:
+    global _replicas
+    if _replicas is None:
+        with _replicas_lock:
+            if _replicas is None:
+                replicas = ReplicaSet(
+                    settings.replica_urls,
+                    check_interval_s=settings.replica_check_interval_s,
+                    max_lag_s=settings.replica_max_lag_s,
+                )
+                replicas.start()
+                _replicas = replicas
+    return _replicas
+
+
+async def shutdown_replicas() -> None:
+    global _replicas
+    if _replicas is not None:
+        _replicas.close()
+        for r in _replicas.replicas:
+            await r.async_engine.dispose()
+        _replicas = None
+
+
+def get_read_db():
+    """Session for read-only endpoints: a healthy replica if any, else the primary."""
+    replicas = get_replicas()
+    for replica in replicas.in_turn():
+        db = replica.sessionmaker()
+        try:
+            db.connection()
+        except exc.DBAPIError as e:
+            db.close()
+            replicas.mark_down(replica, e)
+            continue
+        try:
+            yield db
+        finally:
+            db.close()
+        return
+    yield from get_db()
+
+
+async def get_async_read_db():
+    replicas = get_replicas()
+    for replica in replicas.in_turn():
+        db = replica.async_sessionmaker()
+        try:
+            await db.connection()
+        except exc.DBAPIError as e:
+            await db.close()
+            replicas.mark_down(replica, e)
+            continue
+        try:
+            yield db
+        finally:
+            await db.close()
+        return
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+def read_async_sessionmaker() -> async_sessionmaker:
+    """Session factory for long reads (streamed exports) that outlive the request scope."""
+    replicas = get_replicas().in_turn()
+    return replicas[0].async_sessionmaker if replicas else AsyncSessionLocal
+
+
+def pool_stats() -> dict:
+    pools = {"sync": engine.pool, "async": async_engine.sync_engine.pool}
+    for r in get_replicas().replicas:
+        pools[r.name] = r.engine.pool
+        pools[f"{r.name}-async"] = r.async_engine.sync_engine.pool
+    stats = {name: pool.stats.snapshot(pool) for name, pool in pools.items()}
+    for name, status in get_replicas().status().items():
+        stats[name].update(status)
+    return stats
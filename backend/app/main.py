@@ -1,7 +1,9 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from sqlalchemy import exc as sa_exc
 from fastapi.middleware.cors import CORSMiddleware
 from .config import settings
-from .db import Base, engine
+from .db import Base, engine, async_engine, pool_stats, shutdown_replicas
 from .routes import jobs as jobs_routes
 from .routes import estimate as estimate_routes
 from .routes import match as match_routes
@@ -23,6 +25,13 @@ from .routes import cashflow as cf_routes
 from .routes import expansion as exp_routes
 from .routes import retention as ret_routes
 from .beckn import routers as beckn_routes
+from .beckn.orders import shutdown_order_store
+from .beckn.dispatcher import shutdown_dispatcher
+from .services.etl_jobs import shutdown_etl_jobs
+from .services.job_buffer import job_buffer_stats, start_job_buffer, shutdown_job_buffer
+from .services.id_filter import job_id_filter_stats, start_job_id_filter
+from .services.zone_index import get_zone_index, zone_index_stats
+from .services.payout_model import estimate_batcher_stats, shutdown_payout_service
 from .routes import launch as launch_routes
 
 
@@ -56,7 +65,37 @@ def create_app() -> FastAPI:
             return {"status": "ok"}
         except Exception as e:
             return {"status": "db_error", "detail": str(e)}
-    
+
+    @app.exception_handler(sa_exc.TimeoutError)
+    async def pool_timeout_handler(request: Request, e: sa_exc.TimeoutError):
+        # Pool exhausted for db_pool_timeout_s: shed load instead of a 500
+        return JSONResponse(status_code=503, content={"detail": "database busy"}, headers={"Retry-After": "1"})
+
+    @app.get("/healthz/pool")
+    def healthz_pool():
+        """Connection pool checkout waits, timeouts and saturation per engine, plus replica health."""
+        return pool_stats()
+
+    @app.get("/healthz/job-id-filter")
+    def healthz_job_id_filter():
+        """external_job_id Bloom filter: size, memory, expected and observed false-positive rate."""
+        return job_id_filter_stats()
+
+    @app.get("/healthz/zone-index")
+    def healthz_zone_index():
+        """Nearest-zone index: zones file version, zone count and last build time."""
+        return zone_index_stats()
+
+    @app.get("/healthz/estimate-batcher")
+    def healthz_estimate_batcher():
+        """/estimate micro-batching: batch-size and queue-wait histograms (null when disabled)."""
+        return estimate_batcher_stats()
+
+    @app.get("/healthz/job-buffer")
+    def healthz_job_buffer():
+        """Write-behind POST /jobs buffer: backlog and flush counters (null when disabled)."""
+        return job_buffer_stats()
+
     # Routers
     app.include_router(jobs_routes.router)
     app.include_router(estimate_routes.router)
@@ -81,6 +120,22 @@ def create_app() -> FastAPI:
     app.include_router(beckn_routes.router)
     app.include_router(launch_routes.router)
 
+    # Load known external_job_ids in the background; lookups hit the DB until it is ready
+    app.add_event_handler("startup", start_job_id_filter)
+    # Build the nearest-zone index before the first job or estimate needs it
+    app.add_event_handler("startup", get_zone_index)
+    # Replay jobs a previous process acknowledged but never flushed
+    app.add_event_handler("startup", start_job_buffer)
+
+    # Drain pending write-behind state before the worker exits
+    app.add_event_handler("shutdown", shutdown_dispatcher)
+    app.add_event_handler("shutdown", shutdown_order_store)
+    app.add_event_handler("shutdown", shutdown_job_buffer)
+    app.add_event_handler("shutdown", shutdown_payout_service)
+    app.add_event_handler("shutdown", async_engine.dispose)
+    app.add_event_handler("shutdown", shutdown_replicas)
+    app.add_event_handler("shutdown", shutdown_etl_jobs)
+
     # Avoid 307 redirects by serving both slash and no-slash at root
     @app.get("/")
     def root():
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime
+from sqlalchemy import Column, Integer, BigInteger, String, Float, DateTime, JSON, Index
 from sqlalchemy.orm import relationship
 from .db import Base
 
@@ -16,5 +16,57 @@ class Job(Base):
     energy_kwh = Column(Float, nullable=False)
     price_usd = Column(Float, nullable=True)
     zone = Column(String(64), nullable=True)
+    # geohash of the pickup point, used to prune spatial queries by cell prefix
+    pickup_geohash = Column(String(12), nullable=True)
 
+    __table_args__ = (
+        Index("ix_jobs_pickup_geohash", "pickup_geohash", postgresql_ops={"pickup_geohash": "text_pattern_ops"}),
+        Index("ix_jobs_timestamp_id", "timestamp", "id"),
+        Index("ix_jobs_zone_timestamp_id", "zone", "timestamp", "id"),
+        Index("ix_jobs_timestamp_brin", "timestamp", postgresql_using="brin"),
+    )
 
+
+class JobRollup(Base):
+    """Per-hour job totals for one zone or store, incremented as jobs are ingested."""
+
+    __tablename__ = "job_rollups_hourly"
+
+    dim = Column(String(16), primary_key=True)  # "zone" | "store"
+    key = Column(String(128), primary_key=True)
+    hour = Column(DateTime, primary_key=True)  # naive UTC, truncated to the hour
+    jobs_count = Column(BigInteger, nullable=False, default=0)
+    base_sum = Column(Float, nullable=False, default=0.0)
+    base_count = Column(BigInteger, nullable=False, default=0)
+    final_sum = Column(Float, nullable=False, default=0.0)
+    final_count = Column(BigInteger, nullable=False, default=0)
+    incentive_sum = Column(Float, nullable=False, default=0.0)
+    incentive_count = Column(BigInteger, nullable=False, default=0)
+    energy_kwh_sum = Column(Float, nullable=False, default=0.0)
+
+
+class JobRollupSeed(Base):
+    """One row once job_rollups_hourly was rebuilt from every job, not just ones ingested since."""
+
+    __tablename__ = "job_rollups_seeded"
+
+    id = Column(Integer, primary_key=True)
+    seeded_at = Column(DateTime, nullable=False)  # naive UTC
+
+
+
+
+class BecknOrder(Base):
+    __tablename__ = "beckn_orders"
+
+    id = Column(Integer, primary_key=True)
+    transaction_id = Column(String(64), unique=True, index=True, nullable=False)
+    order_id = Column(String(64), unique=True, nullable=False)
+    bap_id = Column(String(255), nullable=True)
+    bap_uri = Column(String(512), nullable=True)
+    provider_id = Column(String(255), nullable=True)
+    items = Column(JSON, nullable=True)
+    status = Column(String(32), nullable=False)
+    version = Column(Integer, nullable=False, default=1)
+    created_at = Column(DateTime(timezone=True), nullable=False)
+    updated_at = Column(DateTime(timezone=True), nullable=False)
@@ -1,13 +1,15 @@
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 from typing import Dict, Any, List
-import os, json, math, csv
+import os, json, math
+from ..services.datasets import dataset_exists, read_dataset
 
 
 router = APIRouter(prefix="/cashflow", tags=["cashflow"])
 
 PACK_PATH = "/artifacts/dash_pack.json"
-DATA_PATH = "/data/rider_week_clean.csv"
+DATA_PATH = "/data/rider_week_clean.parquet"
+TOTAL_COLUMNS = ("final_with_gst_minus_settlement", "final_with_gst", "final_payout", "base_payout", "base_pay")
 
 
 class CFSeries(BaseModel):
@@ -24,35 +26,34 @@ def _load_pack() -> Any:
 
 
 def _aggregate_from_csv(city: str | None) -> Dict[str, List[float]]:
-    # Try to aggregate 4-week totals per store from rider_week_clean.csv if it has week-like fields
-    if not os.path.exists(DATA_PATH):
+    # Try to aggregate 4-week totals per store from rider_week_clean if it has week-like fields
+    if not dataset_exists(DATA_PATH):
         return {}
     stores: Dict[str, List[float]] = {}
     try:
-        with open(DATA_PATH, newline="") as f:
-            rdr = csv.DictReader(f)
-            for row in rdr:
-                if city and str(row.get("city") or "").upper() != city.upper():
-                    continue
-                store = str(row.get("store") or "").strip()
-                if not store:
-                    continue
-                total = 0.0
-                for k in ("final_with_gst_minus_settlement","final_with_gst","final_payout","base_payout","base_pay"):
-                    v = row.get(k)
-                    if v is not None and v != "":
-                        try:
-                            total = float(v)
-                            break
-                        except Exception:
-                            pass
-                if store not in stores:
-                    stores[store] = [0.0,0.0,0.0,0.0]
-                # naive: distribute single row across recent weeks (proxy if no week col)
-                stores[store][0] += total * 0.4
-                stores[store][1] += total * 0.3
-                stores[store][2] += total * 0.2
-                stores[store][3] += total * 0.1
+        df = read_dataset(DATA_PATH, columns=["city", "store", *TOTAL_COLUMNS])
+        for row in df.astype(object).where(df.notna(), None).to_dict("records"):
+            if city and str(row.get("city") or "").upper() != city.upper():
+                continue
+            store = str(row.get("store") or "").strip()
+            if not store:
+                continue
+            total = 0.0
+            for k in TOTAL_COLUMNS:
+                v = row.get(k)
+                if v is not None and v != "":
+                    try:
+                        total = float(v)
+                        break
+                    except Exception:
+                        pass
+            if store not in stores:
+                stores[store] = [0.0,0.0,0.0,0.0]
+            # naive: distribute single row across recent weeks (proxy if no week col)
+            stores[store][0] += total * 0.4
+            stores[store][1] += total * 0.3
+            stores[store][2] += total * 0.2
+            stores[store][3] += total * 0.1
     except Exception:
         return {}
     return stores
@@ -1,5 +1,8 @@
-from fastapi import APIRouter, Depends
+from typing import List
+
+from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel
+from ..config import settings
 from ..services.payout_model import PayoutModelService, get_payout_service
 
 
@@ -15,12 +18,16 @@ class EstimateResponse(BaseModel):
     estimated_price_usd: float
 
 
+class EstimateBatchResponse(BaseModel):
+    estimated_prices_usd: List[float]
+
+
 router = APIRouter(prefix="/estimate", tags=["estimate"])
 
 
 @router.post("/", response_model=EstimateResponse)
-def estimate(req: EstimateRequest, svc: PayoutModelService = Depends(get_payout_service)):
-    price = svc.estimate_price(
+async def estimate(req: EstimateRequest, svc: PayoutModelService = Depends(get_payout_service)):
+    price = await svc.estimate_price_async(
         energy_kwh=req.energy_kwh,
         pickup_lat=req.pickup_lat,
         pickup_lng=req.pickup_lng,
@@ -30,3 +37,16 @@ def estimate(req: EstimateRequest, svc: PayoutModelService = Depends(get_payout_
     return EstimateResponse(estimated_price_usd=price)
 
 
+@router.post("/batch", response_model=EstimateBatchResponse)
+def estimate_batch(reqs: List[EstimateRequest], svc: PayoutModelService = Depends(get_payout_service)):
+    """Price a JSON array of trips with one model call; prices come back in input order."""
+    if len(reqs) > settings.estimate_batch_max_trips:
+        raise HTTPException(status_code=413, detail=f"at most {settings.estimate_batch_max_trips} trips per batch")
+    prices = svc.estimate_prices(
+        energy_kwh=[r.energy_kwh for r in reqs],
+        pickup_lat=[r.pickup_lat for r in reqs],
+        pickup_lng=[r.pickup_lng for r in reqs],
+        dropoff_lat=[r.dropoff_lat for r in reqs],
+        dropoff_lng=[r.dropoff_lng for r in reqs],
+    )
+    return EstimateBatchResponse(estimated_prices_usd=prices.tolist())
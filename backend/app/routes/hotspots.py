@@ -3,21 +3,22 @@ from pathlib import Path
 import pandas as pd
 import requests
 import os
+from ..services.datasets import dataset_exists, read_dataset
 
 router = APIRouter(prefix="/hotspots", tags=["hotspots"])
 
-ZONES_CSV = Path("/data/zones.csv")
-JOBS_ZONED_CSV = Path("/data/jobs_zoned.csv")
-RIDER_CLEAN_CSV = Path("/data/rider_week_clean.csv")
+ZONES_DATA = Path("/data/zones.parquet")
+JOBS_ZONED_DATA = Path("/data/jobs_zoned.parquet")
+RIDER_CLEAN_DATA = Path("/data/rider_week_clean.parquet")
 GEOCODE_URL = "https://nominatim.openstreetmap.org/search"
 
 
 @router.get("/")
 def list_hotspots():
     # If clustered zones exist, use them
-    if ZONES_CSV.exists() and JOBS_ZONED_CSV.exists():
-        zones = pd.read_csv(ZONES_CSV)
-        jobs = pd.read_csv(JOBS_ZONED_CSV)
+    if dataset_exists(ZONES_DATA) and dataset_exists(JOBS_ZONED_DATA):
+        zones = read_dataset(ZONES_DATA, columns=['zone_id', 'centroid_lat', 'centroid_lng'])
+        jobs = read_dataset(JOBS_ZONED_DATA, columns=['zone_id'])
         counts = jobs['zone_id'].value_counts(dropna=False).to_dict() if 'zone_id' in jobs.columns else {}
         features = []
         for _, r in zones.iterrows():
@@ -32,9 +33,9 @@ def list_hotspots():
             return {'features': features}
 
     # Fallback: geocode store-based location_query to lat/lng
-    if not RIDER_CLEAN_CSV.exists():
+    if not dataset_exists(RIDER_CLEAN_DATA):
         raise HTTPException(status_code=404, detail="No data to derive hotspots")
-    df = pd.read_csv(RIDER_CLEAN_CSV)
+    df = read_dataset(RIDER_CLEAN_DATA, columns=['location_query'])
     if 'location_query' not in df.columns:
         raise HTTPException(status_code=400, detail="location_query not present; re-run preprocess")
     # frequency by location
@@ -1,56 +1,367 @@
-from fastapi import APIRouter, Depends, HTTPException, File, UploadFile
+from fastapi import APIRouter, Depends, HTTPException, File, UploadFile, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import ValidationError
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from ..db import get_db
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Literal
+from datetime import datetime, timezone
+from ..db import get_db, get_async_db, get_async_read_db, read_async_sessionmaker
 from .. import schemas, crud
+from ..utils import encode_cursor, decode_cursor
+import csv
+import io
+import json
 import os
-from ..services.etl import run_full_etl
+import tempfile
+from ..config import settings
+from ..services.etl_jobs import get_etl_jobs
+from ..services.job_buffer import get_job_buffer
+from ..services.zone_index import fill_zones
+from ..services import rollups
 
 
 router = APIRouter(prefix="/jobs", tags=["jobs"])
 
+EXPORT_FIELDS = list(schemas.Job.model_fields.keys())
+
+
+def _naive_utc(ts: datetime | None) -> datetime | None:
+    if ts is None or ts.tzinfo is None:
+        return ts
+    return ts.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+async def _export_rows(after, fmt: str, filters: dict):
+    # The request-scoped session is closed before the body streams, so use our own
+    async with read_async_sessionmaker()() as db:
+        if fmt == "csv":
+            buf = io.StringIO()
+            writer = csv.DictWriter(buf, fieldnames=EXPORT_FIELDS, extrasaction="ignore")
+            writer.writeheader()
+            i = 0
+            async for row in crud.aiter_jobs(db, after=after, **filters):
+                row["timestamp"] = row["timestamp"].isoformat()
+                writer.writerow(row)
+                i += 1
+                if i % 1000 == 0:
+                    yield buf.getvalue()
+                    buf.seek(0)
+                    buf.truncate()
+            yield buf.getvalue()
+        else:
+            lines = []
+            async for row in crud.aiter_jobs(db, after=after, **filters):
+                row["timestamp"] = row["timestamp"].isoformat()
+                lines.append(json.dumps({k: row[k] for k in EXPORT_FIELDS}))
+                if len(lines) >= 1000:
+                    yield "\n".join(lines) + "\n"
+                    lines = []
+            if lines:
+                yield "\n".join(lines) + "\n"
+
+
+async def _list_jobs(
+    response: Response,
+    db: AsyncSession,
+    skip: int,
+    limit: int,
+    cursor: str | None,
+    format: str | None,
+    since: datetime | None,
+    until: datetime | None,
+    zone: str | None,
+):
+    after = decode_cursor(cursor) if cursor else None
+    filters = {"since": _naive_utc(since), "until": _naive_utc(until), "zone": zone}
+    if format == "ndjson":
+        return StreamingResponse(_export_rows(after, "ndjson", filters), media_type="application/x-ndjson")
+    if format == "csv":
+        return StreamingResponse(
+            _export_rows(after, "csv", filters),
+            media_type="text/csv",
+            headers={"Content-Disposition": "attachment; filename=jobs.csv"},
+        )
+    jobs = await crud.alist_jobs(db, skip=skip, limit=limit, after=after, **filters)
+    if len(jobs) == limit and jobs:
+        response.headers["X-Next-Cursor"] = encode_cursor(jobs[-1].timestamp, jobs[-1].id)
+    return jobs
+
 
 @router.get("/", response_model=list[schemas.Job])
-def list_jobs(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    return crud.list_jobs(db, skip=skip, limit=limit)
+async def list_jobs(
+    response: Response,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: str | None = None,
+    format: Literal["json", "ndjson", "csv"] | None = None,
+    since: datetime | None = None,
+    until: datetime | None = None,
+    zone: str | None = None,
+    db: AsyncSession = Depends(get_async_read_db),
+):
+    """Jobs ordered by (timestamp, id), optionally within [since, until) and one zone.
+    Pass the X-Next-Cursor header back as `cursor` for the next page;
+    `format=ndjson|csv` streams every matching job instead."""
+    return await _list_jobs(response, db, skip, limit, cursor, format, since, until, zone)
 
 # Serve non-trailing-slash variant to avoid 307
 @router.get("", response_model=list[schemas.Job])
-def list_jobs_noslash(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    return crud.list_jobs(db, skip=skip, limit=limit)
+async def list_jobs_noslash(
+    response: Response,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: str | None = None,
+    format: Literal["json", "ndjson", "csv"] | None = None,
+    since: datetime | None = None,
+    until: datetime | None = None,
+    zone: str | None = None,
+    db: AsyncSession = Depends(get_async_read_db),
+):
+    return await _list_jobs(response, db, skip, limit, cursor, format, since, until, zone)
 
 
-@router.post("/", response_model=schemas.Job, status_code=201)
-def create_job(job_in: schemas.JobCreate, db: Session = Depends(get_db)):
-    existing = crud.get_job_by_external_id(db, job_in.external_job_id)
-    if existing:
+async def _buffer_job(job_in: schemas.JobCreate) -> JSONResponse:
+    job_in = fill_zones([job_in])[0]
+    # Write-behind: acknowledged once durable in the local log; an external_job_id that
+    # already exists in Postgres is dropped by the flusher rather than rejected here
+    if not await get_job_buffer().append(job_in):
         raise HTTPException(status_code=409, detail="Job with external_job_id already exists")
-    return crud.create_job(db, job_in)
+    accepted = schemas.JobAccepted(external_job_id=job_in.external_job_id, status="accepted")
+    return JSONResponse(status_code=202, content=accepted.model_dump())
+
+
+_WRITE_BEHIND_RESPONSES = {202: {"model": schemas.JobAccepted, "description": "Buffered (JOBS_WRITE_BEHIND)"}}
 
-@router.post("", response_model=schemas.Job, status_code=201)
-def create_job_noslash(job_in: schemas.JobCreate, db: Session = Depends(get_db)):
-    existing = crud.get_job_by_external_id(db, job_in.external_job_id)
-    if existing:
+
+async def _create_job(db: AsyncSession, job_in: schemas.JobCreate):
+    job_in = fill_zones([job_in])[0]
+    if await crud.aexternal_id_exists(db, job_in.external_job_id):
+        raise HTTPException(status_code=409, detail="Job with external_job_id already exists")
+    try:
+        return await crud.acreate_job(db, job_in)
+    except IntegrityError:
+        # inserted elsewhere since the check (or unknown to this worker's id filter)
+        await db.rollback()
         raise HTTPException(status_code=409, detail="Job with external_job_id already exists")
-    return crud.create_job(db, job_in)
+
+
+@router.post("/", response_model=schemas.Job, status_code=201, responses=_WRITE_BEHIND_RESPONSES)
+async def create_job(job_in: schemas.JobCreate, db: AsyncSession = Depends(get_async_db)):
+    if settings.jobs_write_behind:
+        return await _buffer_job(job_in)
+    return await _create_job(db, job_in)
+
+@router.post("", response_model=schemas.Job, status_code=201, responses=_WRITE_BEHIND_RESPONSES)
+async def create_job_noslash(job_in: schemas.JobCreate, db: AsyncSession = Depends(get_async_db)):
+    if settings.jobs_write_behind:
+        return await _buffer_job(job_in)
+    return await _create_job(db, job_in)
+
+
+BULK_BATCH_SIZE = 5000
+
+
+class _BulkLoader:
+    """Validates rows as they arrive and upserts them in batches, tracking per-row outcomes."""
+
+    def __init__(self, db: Session):
+        self.db = db
+        self.results: list[schemas.BulkJobResult] = []
+        self.pending: list[tuple[int, schemas.JobCreate]] = []
+        self.seen: set[str] = set()
+
+    def invalid(self, index: int, error: str, external_job_id: str | None = None):
+        self.results.append(schemas.BulkJobResult(index=index, external_job_id=external_job_id, status="invalid", error=error))
+
+    def add(self, index: int, raw) -> None:
+        try:
+            job = schemas.JobCreate.model_validate(raw)
+        except ValidationError as e:
+            ext = raw.get("external_job_id") if isinstance(raw, dict) else None
+            msg = "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors())
+            self.invalid(index, msg, str(ext) if ext is not None else None)
+            return
+        if job.external_job_id in self.seen:
+            self.results.append(schemas.BulkJobResult(index=index, external_job_id=job.external_job_id, status="duplicate"))
+            return
+        self.seen.add(job.external_job_id)
+        self.pending.append((index, job))
+
+    def flush(self) -> None:
+        if not self.pending:
+            return
+        # jobs without a zone get the nearest one to their pickup, in one batched lookup
+        jobs = fill_zones(j for _, j in self.pending)
+        self.pending = [(index, job) for (index, _), job in zip(self.pending, jobs)]
+        by_id = {j.external_job_id: j for _, j in self.pending}
+
+        def _roll(db, ids):
+            rollups.apply_increments(db, rollups.job_increments(by_id[i] for i in ids))
+
+        created = set(crud.bulk_insert_jobs(self.db, (crud.job_row(j) for j in by_id.values()), on_batch=_roll))
+        for index, job in self.pending:
+            status = "created" if job.external_job_id in created else "duplicate"
+            self.results.append(schemas.BulkJobResult(index=index, external_job_id=job.external_job_id, status=status))
+        self.pending = []
+
+    def response(self) -> schemas.BulkJobResponse:
+        results = sorted(self.results, key=lambda r: r.index)
+        counts = {"created": 0, "duplicate": 0, "invalid": 0}
+        for r in results:
+            counts[r.status] += 1
+        return schemas.BulkJobResponse(total=len(results), results=results, **counts)
+
+
+# COPY needs the raw psycopg connection, so bulk loads stay on the sync engine (in the threadpool)
+@router.post("/bulk", response_model=schemas.BulkJobResponse)
+async def create_jobs_bulk(request: Request, db: Session = Depends(get_db)):
+    """Create many jobs from a JSON array or a streamed NDJSON body (application/x-ndjson).
+
+    Existing or repeated external_job_ids are reported as duplicates, rows that fail
+    validation as invalid; nothing is rejected wholesale.
+    """
+    loader = _BulkLoader(db)
+    content_type = request.headers.get("content-type", "")
+    if "ndjson" in content_type or "jsonl" in content_type:
+        index = 0
+        line_no = 0
+        buf = b""
+
+        def _add(line: bytes) -> None:
+            try:
+                loader.add(index, json.loads(line))
+            except json.JSONDecodeError as e:
+                loader.invalid(index, f"line {line_no}: invalid JSON: {e}")
+            except UnicodeDecodeError as e:
+                loader.invalid(index, f"line {line_no}: invalid UTF-8: {e}")
+
+        async for chunk in request.stream():
+            buf += chunk
+            *lines, buf = buf.split(b"\n")
+            for line in lines:
+                line_no += 1
+                if not line.strip():
+                    continue
+                _add(line)
+                index += 1
+            if len(loader.pending) >= BULK_BATCH_SIZE:
+                await run_in_threadpool(loader.flush)
+        if buf.strip():
+            line_no += 1
+            _add(buf)
+    else:
+        try:
+            rows = json.loads(await request.body())
+        except json.JSONDecodeError as e:
+            raise HTTPException(status_code=400, detail=f"invalid JSON: {e}")
+        except UnicodeDecodeError as e:
+            raise HTTPException(status_code=400, detail=f"invalid UTF-8: {e}")
+        if not isinstance(rows, list):
+            raise HTTPException(status_code=422, detail="expected a JSON array of jobs")
+        for index, raw in enumerate(rows):
+            loader.add(index, raw)
+            if len(loader.pending) >= BULK_BATCH_SIZE:
+                await run_in_threadpool(loader.flush)
+    await run_in_threadpool(loader.flush)
+    return loader.response()
+
+
+# Spatial routes must be registered before /{external_job_id}
+@router.get("/near", response_model=list[schemas.JobNear])
+async def jobs_near(
+    lat: float = Query(..., ge=-90, le=90),
+    lng: float = Query(..., ge=-180, le=180),
+    radius_km: float = Query(1.0, gt=0, le=100),
+    limit: int = Query(100, gt=0, le=5000),
+    db: AsyncSession = Depends(get_async_read_db),
+):
+    """Jobs with a pickup within radius_km of (lat, lng), nearest first."""
+    return [
+        schemas.JobNear(**schemas.Job.model_validate(job).model_dump(), distance_km=round(dist, 4))
+        for job, dist in await crud.ajobs_near(db, lat, lng, radius_km, limit=limit)
+    ]
+
+
+@router.get("/bbox", response_model=list[schemas.Job])
+async def jobs_in_bbox(
+    min_lat: float = Query(..., ge=-90, le=90),
+    min_lng: float = Query(..., ge=-180, le=180),
+    max_lat: float = Query(..., ge=-90, le=90),
+    max_lng: float = Query(..., ge=-180, le=180),
+    limit: int = Query(1000, gt=0, le=10000),
+    db: AsyncSession = Depends(get_async_read_db),
+):
+    """Jobs with a pickup inside the viewport."""
+    if min_lat > max_lat or min_lng > max_lng:
+        raise HTTPException(status_code=400, detail="min bounds must not exceed max bounds")
+    return await crud.ajobs_in_bbox(db, min_lat, min_lng, max_lat, max_lng, limit=limit)
 
 
 @router.get("/{external_job_id}", response_model=schemas.Job)
-def get_job(external_job_id: str, db: Session = Depends(get_db)):
-    job = crud.get_job_by_external_id(db, external_job_id)
+async def get_job(external_job_id: str, db: AsyncSession = Depends(get_async_read_db)):
+    job = await crud.aget_job_by_external_id(db, external_job_id)
     if not job:
         raise HTTPException(status_code=404, detail="Job not found")
     return job
 
-@router.post("/admin/upload-and-run-etl")
-def upload_and_run_etl(file: UploadFile = File(...), k: int = 12):
-    tmp_path = f"/tmp/{file.filename}"
-    with open(tmp_path, "wb") as f:
-        f.write(file.file.read())
+UPLOAD_CHUNK_SIZE = 1 << 20
+
+
+@router.post("/admin/upload-and-run-etl", response_model=schemas.EtlJobAccepted, status_code=202)
+async def upload_and_run_etl(
+    file: UploadFile = File(...),
+    k: int = 12,
+    train_model: bool = True,
+    zones_mode: Literal["incremental", "full"] | None = None,
+    full: bool | None = None,
+    force: bool = False,
+):
+    """Stream the upload to a private temp file and queue the ETL; poll status_url for progress.
+
+    Only rows created since the previous run are processed (a file already processed is
+    skipped) unless `full=true` or ETL_INCREMENTAL=false; the first run is always full.
+    In a full run, `zones_mode=full` re-clusters zones from scratch instead of updating
+    the current ones. Stage outputs are reused for inputs seen before unless `force=true`.
+    """
+    suffix = os.path.splitext(os.path.basename(file.filename or ""))[1]
+    fd, tmp_path = tempfile.mkstemp(prefix="etl-upload-", suffix=suffix, dir=settings.etl_upload_dir)
+    limit = settings.etl_max_upload_mb << 20
+    size = 0
     try:
-        res = run_full_etl(tmp_path, cleaned_csv_out="/data/jobs_clean.csv", k_clusters=k, train_model=True)
-    finally:
-        try:
-            os.remove(tmp_path)
-        except Exception:
-            pass
-    return res
+        with os.fdopen(fd, "wb") as out:
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                size += len(chunk)
+                if size > limit:
+                    raise HTTPException(status_code=413, detail=f"upload exceeds {settings.etl_max_upload_mb} MB")
+                await run_in_threadpool(out.write, chunk)
+        # the ETL job owns the upload (and removes it) only once it is accepted
+        job = get_etl_jobs().submit(
+            tmp_path,
+            filename=file.filename or os.path.basename(tmp_path),
+            size_bytes=size,
+            cleaned_csv_out="/data/jobs_clean.parquet",
+            k_clusters=k,
+            train_model=train_model,
+            zones_mode=zones_mode,
+            full=full,
+            force=force,
+        )
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    return schemas.EtlJobAccepted(job_id=job.id, status=job.status, status_url=f"/jobs/admin/etl/{job.id}")
+
+
+@router.get("/admin/etl", response_model=list[schemas.EtlJobStatus])
+def list_etl_jobs(limit: int = Query(20, gt=0, le=100)):
+    return get_etl_jobs().list(limit=limit)
+
+
+@router.get("/admin/etl/{job_id}", response_model=schemas.EtlJobStatus)
+def etl_job_status(job_id: str):
+    job = get_etl_jobs().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="ETL job not found")
+    return job
@@ -1,11 +1,22 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel
-from typing import List
+from sqlalchemy.orm import Session
+from typing import List, Optional
 from pathlib import Path
+import logging
 import pandas as pd
+from ..db import get_read_db
+from ..services import rollups
+from ..services.datasets import dataset_exists, read_dataset
 
+logger = logging.getLogger("stores")
 
-CLEAN_CSV = Path("/data/jobs_clean.csv")
+
+CLEAN_DATA = Path("/data/jobs_clean.parquet")
+SUMMARY_COLUMNS = [
+    "store", "base_payout", "final_payout", "base_pay", "incentive_total",
+    "final_with_gst", "final_with_gst_minus_settlement",
+]
 
 
 class Store(BaseModel):
@@ -20,6 +31,7 @@ class StoreSummary(BaseModel):
     total_final_payout: float
     total_incentives: float
     avg_final_payout: float
+    total_energy_kwh: Optional[float] = None
 
 
 class StoreDemand(BaseModel):
@@ -30,16 +42,15 @@ class StoreDemand(BaseModel):
 router = APIRouter(prefix="/stores", tags=["stores"])
 
 
-def _load_clean() -> pd.DataFrame:
-    if not CLEAN_CSV.exists():
+def _load_clean(columns: List[str]) -> pd.DataFrame:
+    if not dataset_exists(CLEAN_DATA):
         raise HTTPException(status_code=404, detail="No cleaned data available. Run ETL first.")
-    df = pd.read_csv(CLEAN_CSV)
-    return df
+    return read_dataset(CLEAN_DATA, columns=columns)
 
 
 @router.get("/", response_model=List[Store])
 def list_stores():
-    df = _load_clean()
+    df = _load_clean(["store"])
     stores = []
     if "store" in df.columns:
         uniq = (
@@ -56,8 +67,20 @@ def list_stores_noslash():
 
 
 @router.get("/{store}/summary", response_model=StoreSummary)
-def store_summary(store: str):
-    df = _load_clean()
+def store_summary(store: str, db: Session = Depends(get_read_db)):
+    """Totals from the hourly rollups; the cleaned dataset is only read until the first ingest seeds them."""
+    try:
+        totals = rollups.summarize(db, rollups.STORE, store)
+    except Exception as e:
+        logger.warning("Store rollups unavailable, reading cleaned jobs: %s", e)
+        totals = None
+    if totals is not None:
+        return StoreSummary(store=store, **totals)
+    return _store_summary_from_csv(store)
+
+
+def _store_summary_from_csv(store: str) -> StoreSummary:
+    df = _load_clean(SUMMARY_COLUMNS)
     if "store" not in df.columns:
         raise HTTPException(status_code=404, detail="Store column not found in data")
     df_store = df[df["store"].astype(str) == store]
@@ -125,7 +148,7 @@ def store_summary(store: str):
 
 @router.get("/demand", response_model=List[StoreDemand])
 def demand_by_store():
-    df = _load_clean()
+    df = _load_clean(["store"])
     if "store" not in df.columns:
         return []
     counts = df["store"].astype(str).value_counts()
@@ -1,12 +1,19 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel
+from sqlalchemy.orm import Session
+import logging
 import pandas as pd
 from typing import List, Optional
 from pathlib import Path
+from ..db import get_read_db
+from ..services import rollups
+from ..services.datasets import dataset_exists, read_dataset
 
+logger = logging.getLogger("zones")
 
-ZONES_CSV = Path("/data/zones.csv")
-JOBS_ZONED_CSV = Path("/data/jobs_zoned.csv")
+
+ZONES_DATA = Path("/data/zones.parquet")
+JOBS_ZONED_DATA = Path("/data/jobs_zoned.parquet")
 
 
 class Zone(BaseModel):
@@ -23,16 +30,17 @@ class ZoneSummary(BaseModel):
     total_final_payout: float
     total_incentives: float
     avg_final_payout: float
+    total_energy_kwh: Optional[float] = None
 
 
 router = APIRouter(prefix="/zones", tags=["zones"])
 
 
 def _load_zones() -> List[Zone]:
-    if not ZONES_CSV.exists():
+    if not dataset_exists(ZONES_DATA):
         # No zones computed; return NA fallback
         return [Zone(id="NA", name="Not assigned")] 
-    df = pd.read_csv(ZONES_CSV)
+    df = read_dataset(ZONES_DATA, columns=["zone_id", "centroid_lat", "centroid_lng"])
     if df.empty:
         return [Zone(id="NA", name="Not assigned")]
     zones: List[Zone] = []
@@ -64,10 +72,22 @@ def list_zones():
 
 
 @router.get("/{zone_id}/summary", response_model=ZoneSummary)
-def zone_summary(zone_id: str):
-    if not JOBS_ZONED_CSV.exists():
+def zone_summary(zone_id: str, db: Session = Depends(get_read_db)):
+    """Totals from the hourly rollups; the zoned dataset is only read until the first ingest seeds them."""
+    try:
+        totals = rollups.summarize(db, rollups.ZONE, zone_id)
+    except Exception as e:
+        logger.warning("Zone rollups unavailable, reading zoned jobs: %s", e)
+        totals = None
+    if totals is not None:
+        return ZoneSummary(zone_id=zone_id, **totals)
+    return _zone_summary_from_csv(zone_id)
+
+
+def _zone_summary_from_csv(zone_id: str) -> ZoneSummary:
+    if not dataset_exists(JOBS_ZONED_DATA):
         raise HTTPException(status_code=404, detail="No zoned jobs available. Run ETL first.")
-    df = pd.read_csv(JOBS_ZONED_CSV)
+    df = read_dataset(JOBS_ZONED_DATA, columns=["zone_id", "base_payout", "final_payout"])
     # Coerce numerics
     for col in ["base_payout", "final_payout"]:
         if col in df.columns:
@@ -78,7 +98,7 @@ def zone_summary(zone_id: str):
     else:
         try:
             zid = int(zone_id)
-            df_zone = df[df["zone_id"] == zid] if "zone_id" in df.columns else df.head(0)
+            df_zone = df[df["zone_id"].eq(zid).fillna(False).astype(bool)] if "zone_id" in df.columns else df.head(0)
         except ValueError:
             df_zone = df.head(0)
 
@@ -1,4 +1,5 @@
 from datetime import datetime
+from typing import Literal
 from pydantic import BaseModel, Field
 
 
@@ -25,3 +26,57 @@ class Job(JobBase):
         from_attributes = True
 
 
+
+
+class JobAccepted(BaseModel):
+    external_job_id: str
+    status: str
+
+
+class JobNear(Job):
+    distance_km: float
+
+
+class BulkJobResult(BaseModel):
+    index: int
+    external_job_id: str | None = None
+    status: Literal["created", "duplicate", "invalid"]
+    error: str | None = None
+
+
+class BulkJobResponse(BaseModel):
+    total: int
+    created: int
+    duplicate: int
+    invalid: int
+    results: list[BulkJobResult]
+
+
+class EtlStage(BaseModel):
+    name: str
+    status: str
+    started_at: datetime
+    finished_at: datetime | None = None
+    duration_s: float | None = None
+
+
+class EtlJobStatus(BaseModel):
+    job_id: str
+    filename: str
+    size_bytes: int
+    params: dict
+    status: Literal["queued", "running", "succeeded", "failed"]
+    stage: str | None = None
+    created_at: datetime
+    started_at: datetime | None = None
+    finished_at: datetime | None = None
+    duration_s: float | None = None
+    stages: list[EtlStage] = []
+    result: dict | None = None
+    error: str | None = None
+
+
+class EtlJobAccepted(BaseModel):
+    job_id: str
+    status: str
+    status_url: str
@@ -0,0 +1,277 @@
+"""
+datasets.py
+-- Typed Parquet interchange between ETL stages and the routes that read them, CSV optional
+"""
+from __future__ import annotations
+
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import Iterable, Iterator, Optional, Sequence
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from ..config import settings
+
+logger = logging.getLogger("datasets")
+
+PARQUET = ".parquet"
+CSV = ".csv"
+UPSERT_BATCH_ROWS = 1_000_000
+
+
+def with_suffix(path, suffix: str) -> str:
+    return str(Path(path).with_suffix(suffix))
+
+
+def resolve(path) -> Optional[str]:
+    """The file backing dataset `path` (either suffix), newest first; None if there is none.
+
+    Stages write `<stem>.parquet` (plus `<stem>.csv` when exporting), so callers can keep
+    passing the historical `.csv` paths; a CSV written after the Parquet file wins.
+    """
+    found = []
+    for suffix in (PARQUET, CSV):
+        p = with_suffix(path, suffix)
+        try:
+            found.append((os.stat(p).st_mtime_ns, suffix == PARQUET, p))
+        except OSError:
+            continue
+    return max(found)[2] if found else None
+
+
+def dataset_exists(path) -> bool:
+    return resolve(path) is not None
+
+
+def _arrow_schema(df: pd.DataFrame) -> pa.Schema:
+    # an all-missing text column infers as null; later chunks would not fit that schema
+    schema = pa.Schema.from_pandas(df, preserve_index=False)
+    for i, f in enumerate(schema):
+        if pa.types.is_null(f.type):
+            schema = schema.set(i, f.with_type(pa.string()))
+    return schema
+
+
+class DatasetWriter:
+    """Writes one dataset from one or more frames with the same columns.
+
+    Parquet gets one row group per `write`; the CSV copy is written alongside when
+    `csv` is true (or instead, with ETL_FORMAT=csv). Files are written under a temporary
+    name and renamed on `close`, so readers never see a half-written dataset.
+    """
+
+    def __init__(self, path, csv: Optional[bool] = None):
+        self.parquet = settings.etl_format != "csv"
+        self.csv = not self.parquet or (settings.etl_export_csv if csv is None else csv)
+        self.path = with_suffix(path, PARQUET if self.parquet else CSV)
+        self._targets = [s for s, on in ((PARQUET, self.parquet), (CSV, self.csv)) if on]
+        self._tmp = {s: with_suffix(path, s) + ".tmp" for s in self._targets}
+        self._schema: Optional[pa.Schema] = None
+        self._parquet: Optional[pq.ParquetWriter] = None
+        self._columns: Optional[list] = None
+        self.rows = 0
+
+    def write(self, df: pd.DataFrame) -> None:
+        if self._columns is None:
+            self._columns = list(df.columns)
+        df = df[self._columns]
+        if self.parquet:
+            if self._parquet is None:
+                self._schema = _arrow_schema(df)
+                self._parquet = pq.ParquetWriter(self._tmp[PARQUET], self._schema)
+            self._parquet.write_table(pa.Table.from_pandas(df, schema=self._schema, preserve_index=False))
+        if self.csv:
+            df.to_csv(self._tmp[CSV], mode="a" if self.rows else "w", header=not self.rows, index=False)
+        self.rows += len(df)
+
+    def close(self) -> str:
+        if self._parquet is not None:
+            self._parquet.close()
+        elif self.parquet:
+            # nothing written: an empty file with whatever columns are known
+            pq.write_table(pa.table({c: pa.array([], pa.string()) for c in self._columns or []}), self._tmp[PARQUET])
+        if self.csv and not self.rows:
+            pd.DataFrame(columns=self._columns or []).to_csv(self._tmp[CSV], index=False)
+        for suffix in self._targets:
+            os.replace(self._tmp[suffix], with_suffix(self.path, suffix))
+        return self.path
+
+    def abort(self) -> None:
+        if self._parquet is not None:
+            self._parquet.close()
+        for tmp in self._tmp.values():
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+
+    def __enter__(self) -> "DatasetWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def dataset_files(path, csv: Optional[bool] = None) -> list:
+    """The files DatasetWriter(path, csv) produces, its primary `path` first."""
+    w = DatasetWriter(path, csv=csv)
+    return [with_suffix(w.path, s) for s in w._targets]
+
+
+def write_dataset(df: pd.DataFrame, path, csv: Optional[bool] = None) -> str:
+    """Write `df` as `<stem>.parquet` (and/or `<stem>.csv`); returns the primary path."""
+    with DatasetWriter(path, csv=csv) as w:
+        w.write(df)
+    logger.info("Wrote %d rows to %s", w.rows, w.path)
+    return w.path
+
+
+def _conform(df: pd.DataFrame, columns: Sequence[str]) -> pd.DataFrame:
+    extra = [c for c in df.columns if c not in columns]
+    if extra:
+        logger.warning("Dropping columns the existing dataset does not have: %s", extra)
+    df = df.copy()
+    for c in columns:
+        if c not in df.columns:
+            df[c] = None
+    return df[list(columns)]
+
+
+def upsert_dataset(
+    df: pd.DataFrame,
+    path,
+    key: Optional[str] = None,
+    parse_dates: Iterable[str] = (),
+    csv: Optional[bool] = None,
+) -> str:
+    """Rewrite dataset `path` with `df` appended; returns the primary path written.
+
+    With `key`, existing rows whose key reappears in `df` are dropped, so a re-sent row
+    replaces the old one. Existing rows are streamed through a row group at a time and
+    keep their columns; `df` is conformed to them. Without a dataset this is write_dataset.
+    """
+    if not dataset_exists(path):
+        return write_dataset(df, path, csv=csv)
+    keys = pd.Index(df[key].dropna().unique()) if key is not None and key in df.columns else None
+    dropped = 0
+    with DatasetWriter(path, csv=csv) as w:
+        columns = None
+        for batch in iter_dataset(path, UPSERT_BATCH_ROWS, parse_dates=parse_dates):
+            columns = list(batch.columns)
+            if keys is not None and key in batch.columns:
+                replaced = batch[key].isin(keys).to_numpy()
+                dropped += int(replaced.sum())
+                batch = batch[~replaced]
+            w.write(batch)
+        w.write(_conform(df, columns) if columns is not None else df)
+    logger.info("Upserted %d rows into %s (%d replaced); %d rows in total", len(df), w.path, dropped, w.rows)
+    return w.path
+
+
+def read_dataset(
+    path,
+    columns: Optional[Sequence[str]] = None,
+    parse_dates: Iterable[str] = (),
+) -> pd.DataFrame:
+    """Load dataset `path`, only `columns` if given (ones the file lacks are left out).
+
+    `parse_dates` only matters for CSV files; Parquet keeps its timestamps typed.
+    """
+    src = resolve(path)
+    if src is None:
+        raise FileNotFoundError(path)
+    if src.endswith(PARQUET):
+        if columns is not None:
+            names = set(pq.read_schema(src).names)
+            columns = [c for c in columns if c in names]
+        return pd.read_parquet(src, columns=columns)
+    try:
+        header = pd.read_csv(src, nrows=0).columns
+    except pd.errors.EmptyDataError:
+        return pd.DataFrame(columns=list(columns or []))
+    usecols = [c for c in columns if c in header] if columns is not None else None
+    dates = [c for c in parse_dates if c in header and (usecols is None or c in usecols)]
+    return pd.read_csv(src, usecols=usecols, parse_dates=dates)
+
+
+def iter_dataset(
+    path,
+    batch_rows: int,
+    columns: Optional[Sequence[str]] = None,
+    parse_dates: Iterable[str] = (),
+) -> Iterator[pd.DataFrame]:
+    """Like read_dataset, `batch_rows` rows at a time, with a running RangeIndex."""
+    src = resolve(path)
+    if src is None:
+        raise FileNotFoundError(path)
+    start = 0
+    if src.endswith(PARQUET):
+        f = pq.ParquetFile(src)
+        if columns is not None:
+            columns = [c for c in columns if c in f.schema_arrow.names]
+        # whole row groups sliced up: ParquetFile.iter_batches holds on to what it has decoded
+        batches = (
+            table.slice(offset, batch_rows).to_pandas()
+            for table in (f.read_row_group(i, columns=columns) for i in range(f.num_row_groups))
+            for offset in range(0, table.num_rows, batch_rows)
+        )
+    else:
+        try:
+            header = pd.read_csv(src, nrows=0).columns
+        except pd.errors.EmptyDataError:
+            return
+        usecols = [c for c in columns if c in header] if columns is not None else None
+        dates = [c for c in parse_dates if c in header and (usecols is None or c in usecols)]
+        batches = pd.read_csv(src, usecols=usecols, parse_dates=dates, chunksize=batch_rows)
+    for df in batches:
+        df.index = pd.RangeIndex(start, start + len(df))
+        start += len(df)
+        yield df
+
+
+class DatasetRef:
+    """A dataset on disk, plus the frame it was written from when that is still in memory.
+
+    Lets in-process consumers skip reading back what the previous stage just wrote.
+    Reads always return a new frame, so consumers may modify what they get.
+    """
+
+    def __init__(self, path, frame: Optional[pd.DataFrame] = None):
+        self.path = str(path)
+        self.frame = frame
+        # consumers in other threads (train and ingest) read the same frame
+        self._lock = threading.Lock()
+
+    def __repr__(self) -> str:
+        return f"DatasetRef({self.path!r}, in_memory={self.frame is not None})"
+
+    def read(self, columns: Optional[Sequence[str]] = None, parse_dates: Iterable[str] = ()) -> pd.DataFrame:
+        if self.frame is None:
+            return read_dataset(self.path, columns=columns, parse_dates=parse_dates)
+        with self._lock:
+            if columns is None:
+                return self.frame.copy()
+            return self.frame[[c for c in columns if c in self.frame.columns]].copy()
+
+    def iter(
+        self,
+        batch_rows: int,
+        columns: Optional[Sequence[str]] = None,
+        parse_dates: Iterable[str] = (),
+    ) -> Iterator[pd.DataFrame]:
+        """Like iter_dataset, slicing the in-memory frame when there is one."""
+        if self.frame is None:
+            yield from iter_dataset(self.path, batch_rows, columns=columns, parse_dates=parse_dates)
+            return
+        df = self.frame if columns is None else self.frame[[c for c in columns if c in self.frame.columns]]
+        for start in range(0, len(df), batch_rows):
+            batch = df.iloc[start:start + batch_rows].copy()
+            batch.index = pd.RangeIndex(start, start + len(batch))
+            yield batch
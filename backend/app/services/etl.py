@@ -1,77 +1,364 @@
+import argparse
+import json
 import logging
-from .preprocess import run_preprocess
-from .zones import cluster_jobs, assign_zone_to_jobs
-from .model_train import train_payout_model
+import os
+from typing import Callable, Optional
+from .preprocess import preprocess_dataset, preprocess_new_rows, source_created_max
+from .zones import cluster_dataset, zone_new_jobs, assign_zone_to_jobs
+from .model_train import train_payout_dataset, train_payout_model
+from .geo import geohash_encode_many
+from .datasets import DatasetRef, read_dataset
+from .etl_dag import EtlDag, Stage
+from .watermark import Watermark, file_fingerprint
+from . import rollups
+from ..config import settings
 from ..db import SessionLocal
-from .. import crud, schemas
+from .. import crud
+import numpy as np
 import pandas as pd
 
 logger = logging.getLogger("etl")
 logging.basicConfig(level=logging.INFO)
 
-def ingest_to_db(clean_csv_path: str):
-    """Read the cleaned CSV and insert rows into the jobs table (idempotent)."""
-    df = pd.read_csv(clean_csv_path, parse_dates=['created_at','scheduled_at','completed_at'])
+def _col(df: pd.DataFrame, name: str) -> pd.Series:
+    if name in df.columns:
+        return df[name]
+    return pd.Series(np.nan, index=df.index)
+
+
+def _num(df: pd.DataFrame, name: str) -> pd.Series:
+    return pd.to_numeric(_col(df, name), errors="coerce")
+
+
+def jobs_frame_to_records(df: pd.DataFrame) -> tuple[pd.DataFrame, int]:
+    """Map cleaned/zoned ETL columns onto the jobs table, column-wise.
+
+    Returns the mapped frame (one row per distinct job_id) and the number of input
+    rows dropped for having no job_id or repeating an earlier one.
+    """
+    df = df.reset_index(drop=True)
+    ext = _col(df, "job_id")
+    ext = ext[ext.notna()].astype(str)
+    ext = ext[~ext.duplicated(keep="first")]
+    dropped = int(len(df) - len(ext))
+    df = df.loc[ext.index]
+
+    ts = pd.to_datetime(_col(df, "created_at"), utc=True, errors="coerce")
+    ts = ts.fillna(pd.Timestamp.now(tz="UTC")).dt.tz_convert(None)
+
+    price = _num(df, "final_payout").fillna(_num(df, "base_payout")).fillna(_num(df, "price_usd"))
+    energy = _num(df, "energy_kwh").fillna(_num(df, "distance_km") * 0.2).fillna(10.0)
+
+    zone_raw = _col(df, "zone_id")
+    zone_num = pd.to_numeric(zone_raw, errors="coerce")
+    zone = zone_raw.astype(str).astype(object)
+    numeric = zone_num.notna()
+    zone[numeric] = np.trunc(zone_num[numeric]).astype("int64").astype(str)
+    zone[zone_raw.isna()] = None
+
+    pickup_lat = _num(df, "pickup_lat").fillna(0.0)
+    pickup_lng = _num(df, "pickup_lng").fillna(0.0)
+
+    out = pd.DataFrame({
+        "external_job_id": ext,
+        "timestamp": ts,
+        "pickup_lat": pickup_lat,
+        "pickup_lng": pickup_lng,
+        "dropoff_lat": _num(df, "drop_lat").fillna(0.0),
+        "dropoff_lng": _num(df, "drop_lng").fillna(0.0),
+        "energy_kwh": energy.astype(float),
+        "price_usd": price.astype(float),
+        "zone": zone,
+        "pickup_geohash": geohash_encode_many(pickup_lat.to_numpy(), pickup_lng.to_numpy()),
+    })
+    return out, dropped
+
+
+def _rows(out: pd.DataFrame):
+    """Row tuples in crud.JOB_COLUMNS order with NaN/NaT turned into None."""
+    out = out[list(crud.JOB_COLUMNS)]
+    obj = out.astype(object).where(out.notna(), None)
+    return obj.itertuples(index=False, name=None)
+
+
+def ingest_dataframe(df: pd.DataFrame, batch_size: int = 100_000) -> dict:
+    """Bulk insert a zoned jobs DataFrame; existing external_job_ids are skipped.
+
+    Zone/store rollups are incremented for the inserted jobs in the same transaction.
+    Jobs already in the table whose zone changed (zones were re-clustered) are moved
+    to it, rollups included. Until the rollups are seeded they are rebuilt instead,
+    from this frame and the jobs table (rollups.seed).
+    """
+    df = df.reset_index(drop=True)
+    out, dropped = jobs_frame_to_records(df)
+    facts = rollups.frame_facts(df, out)
+    positions = pd.Index(out["external_job_id"])
+    fresh = np.zeros(len(out), dtype=bool)
+
+    def _roll(db, ids):
+        take = np.zeros(len(out), dtype=bool)
+        take[positions.get_indexer(ids)] = True
+        rollups.apply_increments(db, rollups.aggregate_facts(facts[take[facts["row"].to_numpy()]]))
+
     db = SessionLocal()
-    inserted = 0
     try:
-        for _, r in df.iterrows():
-            external_job_id = str(r.get("job_id")) if not pd.isna(r.get("job_id")) else None
-            if not external_job_id:
-                continue
-            if crud.get_job_by_external_id(db, external_job_id):
-                continue
-
-            ts = r.get("created_at")
-            if pd.isna(ts):
-                ts = pd.Timestamp.utcnow()
-
-            price = r.get("final_payout")
-            if pd.isna(price):
-                price = r.get("base_payout")
-            if pd.isna(price):
-                price = r.get("price_usd")
-
-            dist = r.get("distance_km")
-            energy = r.get("energy_kwh")
-            if pd.isna(energy):
-                energy = (float(dist) * 0.2) if dist is not None and not pd.isna(dist) else 10.0
-
-            zone_val = r.get("zone_id")
-            zone = None
-            if zone_val is not None and not pd.isna(zone_val):
-                try:
-                    zone = str(int(zone_val))
-                except Exception:
-                    zone = str(zone_val)
-
-            job_in = schemas.JobCreate(
-                external_job_id=external_job_id,
-                timestamp=pd.to_datetime(ts).to_pydatetime(),
-                pickup_lat=float(r.get("pickup_lat")) if not pd.isna(r.get("pickup_lat")) else 0.0,
-                pickup_lng=float(r.get("pickup_lng")) if not pd.isna(r.get("pickup_lng")) else 0.0,
-                dropoff_lat=float(r.get("drop_lat")) if not pd.isna(r.get("drop_lat")) else 0.0,
-                dropoff_lng=float(r.get("drop_lng")) if not pd.isna(r.get("drop_lng")) else 0.0,
-                energy_kwh=float(energy),
-                price_usd=float(price) if price is not None and not pd.isna(price) else None,
-                zone=zone,
-            )
-            crud.create_job(db, job_in)
-            inserted += 1
+        seeded = rollups.is_seeded(db)
+        inserted_ids = crud.bulk_insert_jobs(db, _rows(out), batch_size=batch_size, on_batch=_roll if seeded else None)
+        fresh[positions.get_indexer(inserted_ids)] = True
+        # a seed counts every job under its current zone already
+        rezoned = _rezone(db, out, facts, np.flatnonzero(~fresh), batch_size, move_rollups=seeded)
+        if not seeded:
+            rollups.seed(db, rollups.aggregate_facts(facts), out["external_job_id"].tolist())
+            db.commit()
     finally:
         db.close()
-    logger.info("Ingested %d rows into DB", inserted)
-    return inserted
-
-def run_full_etl(input_path: str, cleaned_csv_out: str = "/data/jobs_clean.csv", k_clusters: int = 12, train_model: bool = True):
-    # 1. Preprocess
-    cleaned = run_preprocess(input_path, cleaned_csv_out)
-    # 2. Zone clustering (produce jobs_zoned.csv and zones.csv)
-    zones_csv, jobs_zoned_csv = cluster_jobs(cleaned, k=k_clusters)
-    # 3. Optionally train payout model
+    inserted = len(inserted_ids)
+    skipped = int(len(out) - inserted) + dropped
+    logger.info("Ingested %d rows into DB (%d skipped, %d moved to a new zone)", inserted, skipped, rezoned)
+    return {"inserted": inserted, "skipped": skipped, "rezoned": rezoned}
+
+
+def _rezone(db, out: pd.DataFrame, facts: pd.DataFrame, rows: np.ndarray, batch_size: int, move_rollups: bool) -> int:
+    """Bring the stored zone of the already-loaded jobs at `rows` (positions in `out`) up to date."""
+    moved = 0
+    for start in range(0, len(rows), batch_size):
+        chunk = out.iloc[rows[start:start + batch_size]]
+        stored = crud.job_zones(db, chunk["external_job_id"].tolist())
+        old = chunk["external_job_id"].map(stored)
+        changed = chunk["external_job_id"].isin(stored.keys()) & (
+            old.fillna(rollups.NO_ZONE).astype(str) != chunk["zone"].fillna(rollups.NO_ZONE).astype(str)
+        )
+        if not changed.any():
+            continue
+        if move_rollups:
+            old_keys = pd.Series(old[changed].fillna(rollups.NO_ZONE).astype(str).to_numpy(),
+                                 index=rows[start:start + batch_size][changed.to_numpy()])
+            rollups.apply_increments(db, rollups.move_increments(facts, old_keys))
+            rollups.drop_empty(db, rollups.ZONE)
+        crud.set_job_zones(db, chunk["external_job_id"][changed].tolist(), chunk["zone"][changed].tolist())
+        db.commit()
+        moved += int(changed.sum())
+    return moved
+
+
+# what jobs_frame_to_records and the rollup facts read from the zoned frame
+INGEST_COLUMNS = (
+    "job_id", "created_at", "pickup_lat", "pickup_lng", "drop_lat", "drop_lng",
+    "final_payout", "base_payout", "price_usd", "energy_kwh", "distance_km", "zone_id", "store",
+) + rollups.STORE_FINAL_COLUMNS + rollups.STORE_BASE_COLUMNS + ("incentive_total",)
+
+
+def ingest_to_db(clean_csv_path: str, batch_size: int = 100_000) -> dict:
+    """Read the cleaned/zoned dataset and bulk insert rows into the jobs table (idempotent)."""
+    return ingest_dataset(DatasetRef(clean_csv_path), batch_size=batch_size)
+
+
+def ingest_dataset(jobs_zoned: DatasetRef, batch_size: int = 100_000) -> dict:
+    df = jobs_zoned.read(columns=list(dict.fromkeys(INGEST_COLUMNS)), parse_dates=['created_at'])
+    return ingest_dataframe(df, batch_size=batch_size)
+
+
+def etl_stages(
+    input_path: str,
+    cleaned_csv_out: str = "/data/jobs_clean.parquet",
+    k_clusters: int = 12,
+    train_model: bool = True,
+    zones_mode: Optional[str] = None,
+    force: bool = False,
+) -> list[Stage]:
+    """preprocess -> zones -> (train, ingest): training and ingest both only need the zoned jobs.
+
+    `force` recomputes stages whose outputs the stage cache holds.
+    """
+
+    def zones(clean: DatasetRef):
+        zones_path, jobs_zoned = cluster_dataset(clean, k=k_clusters, mode=zones_mode, force=force)
+        # the cleaned frame was labeled in place and lives on as the zoned one
+        clean.frame = None
+        return zones_path, jobs_zoned
+
+    stages = [
+        Stage("preprocess", lambda: preprocess_dataset(input_path, cleaned_csv_out, chunk_rows=settings.etl_chunk_rows, force=force)),
+        Stage("zones", zones, deps=("preprocess",)),
+        Stage("ingest", lambda z: ingest_dataset(z[1]), deps=("zones",)),
+    ]
+    if train_model:
+        stages.append(Stage("train", lambda z: train_payout_dataset(z[1], force=force), deps=("zones",)))
+    return stages
+
+
+def run_full_etl(
+    input_path: str,
+    cleaned_csv_out: str = "/data/jobs_clean.parquet",
+    k_clusters: int = 12,
+    train_model: bool = True,
+    on_stage: Optional[Callable[[str], None]] = None,
+    zones_mode: Optional[str] = None,
+    on_stage_done: Optional[Callable[[str, str], None]] = None,
+    workers: Optional[int] = None,
+    force: bool = False,
+):
+    """Preprocess, cluster, then train and ingest side by side (see etl_stages).
+
+    Stages hand their frames to each other in memory; every dataset is still written
+    out. `on_stage(name)` / `on_stage_done(name, status)` are called as each stage starts
+    and ends, and `stages` in the result has each stage's timing and memory.
+    `zones_mode` overrides ZONES_MODE ("incremental" or "full") for this run;
+    `workers` overrides ETL_STAGE_WORKERS; `force` bypasses the stage cache.
+    """
+    dag = EtlDag(etl_stages(input_path, cleaned_csv_out, k_clusters, train_model, zones_mode, force=force))
+    try:
+        out = dag.run(
+            workers=workers or settings.etl_stage_workers, on_start=on_stage, on_finish=on_stage_done,
+        )
+    finally:
+        logger.info("ETL stages:\n%s", dag.format_report())
+    zones_csv, jobs_zoned = out["zones"]
+    if train_model:
+        logger.info("Payout model trained at %s", out["train"])
+    return {
+        "cleaned_csv": out["preprocess"].path,
+        "jobs_zoned_csv": jobs_zoned.path,
+        "zones_csv": zones_csv,
+        "ingest": out["ingest"],
+        "stages": dag.report,
+        "wall_s": round(dag.wall_s, 3),
+    }
+
+
+def incremental_stages(
+    input_path: str,
+    since,
+    cleaned_csv_out: str = "/data/jobs_clean.parquet",
+    train_model: bool = True,
+    force: bool = False,
+) -> list[Stage]:
+    """New rows only: preprocess -> zones (existing ones, not re-clustered) -> (train, ingest)."""
+
+    def zones(new: pd.DataFrame):
+        if new.empty:
+            return None
+        out = zone_new_jobs(new)
+        if out is None:
+            raise RuntimeError("No zones or zoned jobs to extend; run a full ETL first")
+        return out
+
+    stages = [
+        Stage("preprocess", lambda: preprocess_new_rows(input_path, cleaned_csv_out, since)),
+        Stage("zones", zones, deps=("preprocess",)),
+        # zones labeled the new rows in place; only they go to the database
+        Stage(
+            "ingest",
+            lambda z, new: ingest_dataframe(new) if z is not None else {"inserted": 0, "skipped": 0},
+            deps=("zones", "preprocess"),
+        ),
+    ]
     if train_model:
-        model_path = train_payout_model(jobs_zoned_csv)
-        logger.info("Payout model trained at %s", model_path)
-    # 4. Insert into DB
-    ingest_to_db(jobs_zoned_csv)
-    return {"cleaned_csv": cleaned, "jobs_zoned_csv": jobs_zoned_csv, "zones_csv": zones_csv}
+        # the model is refit on all zoned jobs, new and old
+        stages.append(Stage("train", lambda z: train_payout_model(z[1], force=force) if z is not None else None, deps=("zones",)))
+    return stages
+
+
+def run_incremental_etl(
+    input_path: str,
+    since,
+    cleaned_csv_out: str = "/data/jobs_clean.parquet",
+    train_model: bool = True,
+    on_stage: Optional[Callable[[str], None]] = None,
+    on_stage_done: Optional[Callable[[str, str], None]] = None,
+    workers: Optional[int] = None,
+    force: bool = False,
+):
+    """Process only the rows of `input_path` created at or after `since` (see incremental_stages)."""
+    dag = EtlDag(incremental_stages(input_path, since, cleaned_csv_out, train_model, force=force))
+    try:
+        out = dag.run(
+            workers=workers or settings.etl_stage_workers, on_start=on_stage, on_finish=on_stage_done,
+        )
+    finally:
+        logger.info("ETL stages:\n%s", dag.format_report())
+    new = out["preprocess"]
+    zones_csv, jobs_zoned_csv = out["zones"] if out["zones"] is not None else (None, None)
+    return {
+        "cleaned_csv": cleaned_csv_out,
+        "jobs_zoned_csv": jobs_zoned_csv,
+        "zones_csv": zones_csv,
+        "ingest": out["ingest"],
+        "new_rows": len(new),
+        "stages": dag.report,
+        "wall_s": round(dag.wall_s, 3),
+    }
+
+
+def run_etl(
+    input_path: str,
+    cleaned_csv_out: str = "/data/jobs_clean.parquet",
+    k_clusters: int = 12,
+    train_model: bool = True,
+    on_stage: Optional[Callable[[str], None]] = None,
+    zones_mode: Optional[str] = None,
+    on_stage_done: Optional[Callable[[str, str], None]] = None,
+    workers: Optional[int] = None,
+    full: Optional[bool] = None,
+    force: bool = False,
+):
+    """Run the ETL on `input_path`, incrementally unless `full` (default: not ETL_INCREMENTAL).
+
+    An incremental run processes only rows created at or after the watermark (the
+    latest created_at loaded so far), and skips an input whose content was already
+    processed. The first run, with no watermark yet, is a full one. A full run
+    reprocesses the whole file (see run_full_etl) and resets the watermark to it.
+    `force` recomputes everything: no cached stage outputs, no skipping a known input.
+    """
+    if full is None:
+        full = not settings.etl_incremental
+    mark = Watermark.load(settings.etl_watermark_path)
+    fingerprint = file_fingerprint(input_path)
+    name = os.path.basename(input_path)
+    if not full and not force and mark.seen(fingerprint):
+        logger.info("%s was already processed (%s); nothing to do", name, fingerprint)
+        return {"mode": "skipped", "fingerprint": fingerprint, "watermark": mark.created_at}
+    if full or mark.created_at is None:
+        result = run_full_etl(
+            input_path, cleaned_csv_out=cleaned_csv_out, k_clusters=k_clusters, train_model=train_model,
+            on_stage=on_stage, zones_mode=zones_mode, on_stage_done=on_stage_done, workers=workers, force=force,
+        )
+        rows = len(read_dataset(result["cleaned_csv"], columns=["job_id"]))
+        result["mode"] = "full"
+        mark = Watermark()
+    else:
+        logger.info("Incremental ETL of %s: rows created since %s", name, mark.created_at)
+        result = run_incremental_etl(
+            input_path, mark.created_at, cleaned_csv_out=cleaned_csv_out, train_model=train_model,
+            on_stage=on_stage, on_stage_done=on_stage_done, workers=workers, force=force,
+        )
+        rows = result["new_rows"]
+        result["mode"] = "incremental"
+    # only timestamps the export holds: a synthesized one (the run's time) would skip
+    # every real row dated before it on the next run
+    mark.advance(source_created_max(input_path), fingerprint, name, mode=result["mode"], rows=rows)
+    mark.save(settings.etl_watermark_path)
+    result.update({"fingerprint": fingerprint, "watermark": mark.created_at})
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the ETL: preprocess, zones, train and ingest")
+    parser.add_argument("input", nargs="?", default=settings.etl_input_path, help="input .csv/.xlsx")
+    parser.add_argument("k", nargs="?", type=int, default=12, help="zones for a fresh clustering")
+    parser.add_argument("--out", default="/data/jobs_clean.parquet", help="cleaned dataset path")
+    parser.add_argument("--no-train", action="store_true", help="skip training the payout model")
+    parser.add_argument("--zones-mode", choices=["incremental", "full"], default=None)
+    parser.add_argument("--workers", type=int, default=None, help="stages run at once (ETL_STAGE_WORKERS)")
+    parser.add_argument("--full", action="store_true", default=None, help="reprocess the whole input, not just rows past the watermark")
+    parser.add_argument("--force", action="store_true", help="recompute every stage instead of reusing cached outputs")
+    args = parser.parse_args(argv)
+    result = run_etl(
+        args.input, cleaned_csv_out=args.out, k_clusters=args.k, train_model=not args.no_train,
+        zones_mode=args.zones_mode, workers=args.workers, full=args.full, force=args.force,
+    )
+    print(json.dumps(result, indent=2, default=str))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+"""
+etl_bench.py
+-- Times each ETL stage on synthetic exports of several sizes and records wall time and peak RSS as JSON
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Sequence
+
+from .etl_dag import rss_mb
+from .synthetic import Layout, write_synthetic
+
+logger = logging.getLogger("etl_bench")
+
+STAGES = ("preprocess", "zones", "train", "ingest")
+DEFAULT_SIZES = "10k,100k,1M"
+
+
+def parse_size(text: str) -> int:
+    """"10k" / "2.5M" / "10000" -> rows."""
+    text = text.strip().lower().replace("_", "")
+    scale = {"k": 1_000, "m": 1_000_000}.get(text[-1:], 1)
+    return int(float(text[:-1] if scale > 1 else text) * scale)
+
+
+def _paths(workdir: str, rows: int) -> Dict[str, str]:
+    d = os.path.join(workdir, f"{rows}")
+    return {
+        "dir": d,
+        "clean": os.path.join(d, "jobs_clean.parquet"),
+        "zoned": os.path.join(d, "jobs_zoned.parquet"),
+        "zones": os.path.join(d, "zones.parquet"),
+        "model": os.path.join(d, "payout_model.joblib"),
+    }
+
+
+def _run_stage(stage: str, input_path: str, paths: Dict[str, str], k: int) -> Dict[str, Any]:
+    """Run one stage in this (fresh) process; stages read their inputs from the previous stage's files."""
+    from ..config import settings
+    from . import etl, model_train, preprocess, zones
+
+    # measure the work itself, not a copy out of the stage cache
+    settings.etl_cache = False
+    rss_start = rss_mb()
+    t0 = time.perf_counter()
+    if stage == "preprocess":
+        preprocess.run_preprocess(input_path, paths["clean"], chunk_rows=settings.etl_chunk_rows)
+        out: Any = None
+    elif stage == "zones":
+        # no previous zones: every size clusters from scratch
+        for suffix in (".parquet", ".csv"):
+            p = os.path.splitext(paths["zones"])[0] + suffix
+            if os.path.exists(p):
+                os.remove(p)
+        zones.cluster_jobs(paths["clean"], k=k, jobs_zoned_out=paths["zoned"], zones_out=paths["zones"])
+        out = None
+    elif stage == "train":
+        model_train.train_payout_model(paths["zoned"], model_path=paths["model"])
+        out = None
+    elif stage == "ingest":
+        out = etl.ingest_to_db(paths["zoned"])
+    else:
+        raise ValueError(f"unknown stage {stage!r}")
+    wall = time.perf_counter() - t0
+    # ru_maxrss is in KiB on Linux; the process only ever ran this stage
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return {"wall_s": wall, "rss_start_mb": rss_start, "peak_rss_mb": peak, "output": out}
+
+
+def _host() -> Dict[str, Any]:
+    import numpy
+    import pandas
+    import sklearn
+
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "pandas": pandas.__version__,
+        "numpy": numpy.__version__,
+        "sklearn": sklearn.__version__,
+    }
+
+
+def run_benchmark(
+    sizes: Sequence[int],
+    workdir: str,
+    stages: Sequence[str] = ("preprocess", "zones", "train"),
+    k: int = 12,
+    repeat: int = 1,
+    layout: Optional[Layout] = None,
+    seed: int = 0,
+    keep: bool = False,
+) -> Dict[str, Any]:
+    """Generate a job export per size under `workdir`, then run `stages` on it in order.
+
+    Each (size, stage, repeat) runs in a freshly spawned process, so its peak RSS covers
+    that stage alone (plus the interpreter and imports, reported as rss_start_mb). A
+    failed stage is recorded and the stages after it are skipped for that size.
+    """
+    unknown = [s for s in stages if s not in STAGES]
+    if unknown:
+        raise ValueError(f"unknown stages {unknown}; choose from {list(STAGES)}")
+    stages = [s for s in STAGES if s in stages]
+    layout = layout or Layout.build(seed=seed)
+    results: List[Dict[str, Any]] = []
+    ctx = multiprocessing.get_context("spawn")
+    for rows in sizes:
+        paths = _paths(workdir, rows)
+        os.makedirs(paths["dir"], exist_ok=True)
+        input_path = os.path.join(paths["dir"], "jobs_export.csv")
+        t0 = time.perf_counter()
+        write_synthetic("jobs", rows, input_path, layout, seed=seed)
+        logger.info("Generated %d rows in %.1fs", rows, time.perf_counter() - t0)
+        failed = False
+        for stage in stages:
+            for r in range(repeat):
+                entry: Dict[str, Any] = {"stage": stage, "rows": rows, "repeat": r}
+                if failed:
+                    results.append({**entry, "status": "skipped"})
+                    continue
+                try:
+                    with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+                        m = pool.submit(_run_stage, stage, input_path, paths, k).result()
+                except Exception as exc:
+                    logger.exception("%s at %d rows failed", stage, rows)
+                    results.append({**entry, "status": "failed", "error": f"{type(exc).__name__}: {exc}"})
+                    failed = True
+                    continue
+                entry.update(
+                    status="ok",
+                    wall_s=round(m["wall_s"], 4),
+                    rows_per_s=round(rows / m["wall_s"]) if m["wall_s"] > 0 else None,
+                    rss_start_mb=round(m["rss_start_mb"], 1) if m["rss_start_mb"] is not None else None,
+                    peak_rss_mb=round(m["peak_rss_mb"], 1),
+                )
+                if m["output"] is not None:
+                    entry["output"] = m["output"]
+                results.append(entry)
+                logger.info("%s at %d rows: %.2fs, peak %.0f MB", stage, rows, m["wall_s"], m["peak_rss_mb"])
+        if not keep:
+            shutil.rmtree(paths["dir"], ignore_errors=True)
+    return {
+        "created_at": datetime.now(tz=timezone.utc).isoformat(),
+        "host": _host(),
+        "params": {"sizes": list(sizes), "stages": list(stages), "k": k, "repeat": repeat, "seed": seed,
+                   "cities": layout.cities, "stores": len(layout.store_names)},
+        "results": results,
+    }
+
+
+def _best(results: List[Dict[str, Any]]) -> Dict[tuple, Dict[str, float]]:
+    best: Dict[tuple, Dict[str, float]] = {}
+    for r in results:
+        if r.get("status") != "ok":
+            continue
+        b = best.setdefault((r["stage"], r["rows"]), {"wall_s": r["wall_s"], "peak_rss_mb": r["peak_rss_mb"]})
+        b["wall_s"] = min(b["wall_s"], r["wall_s"])
+        b["peak_rss_mb"] = min(b["peak_rss_mb"], r["peak_rss_mb"])
+    return best
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], max_slowdown: float = 1.25,
+            max_memory_growth: float = 1.25, min_delta_s: float = 0.05) -> List[Dict[str, Any]]:
+    """(stage, rows) pairs whose best wall time or peak RSS grew past the allowed ratio.
+
+    Slowdowns of less than `min_delta_s` are timer noise on small inputs and are ignored.
+    """
+    now, then = _best(current["results"]), _best(baseline["results"])
+    regressions = []
+    for key in sorted(now.keys() & then.keys()):
+        for metric, limit in (("wall_s", max_slowdown), ("peak_rss_mb", max_memory_growth)):
+            if metric == "wall_s" and now[key][metric] - then[key][metric] < min_delta_s:
+                continue
+            if then[key][metric] > 0 and now[key][metric] / then[key][metric] > limit:
+                regressions.append({"stage": key[0], "rows": key[1], "metric": metric, "baseline": then[key][metric],
+                                    "current": now[key][metric], "ratio": round(now[key][metric] / then[key][metric], 2)})
+    return regressions
+
+
+def format_results(results: List[Dict[str, Any]]) -> str:
+    lines = [f"{'stage':<10}  {'rows':>10}  {'wall_s':>8}  {'rows/s':>10}  {'peak_mb':>8}  status"]
+    for r in results:
+        if r.get("status") == "ok":
+            lines.append(f"{r['stage']:<10}  {r['rows']:>10}  {r['wall_s']:8.2f}  {r['rows_per_s'] or 0:>10}  "
+                         f"{r['peak_rss_mb']:8.0f}  ok")
+        else:
+            lines.append(f"{r['stage']:<10}  {r['rows']:>10}  {'-':>8}  {'-':>10}  {'-':>8}  {r['status']}")
+    return "\n".join(lines)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the ETL stages on synthetic job exports")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="comma-separated row counts, e.g. 10k,100k,1M,10M")
+    parser.add_argument("--stages", default="preprocess,zones,train",
+                        help="any of preprocess,zones,train,ingest (ingest writes to DATABASE_URL)")
+    parser.add_argument("--k", type=int, default=12)
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--cities", default="3", help="how many cities, or a comma-separated list of names")
+    parser.add_argument("--stores-per-city", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", default="/tmp/etl_bench", help="generated inputs and stage outputs")
+    parser.add_argument("--keep", action="store_true", help="keep the generated files")
+    parser.add_argument("--out", default="etl_bench.json", help="results file (JSON)")
+    parser.add_argument("--baseline", help="earlier results file; exit 1 on a regression")
+    parser.add_argument("--max-slowdown", type=float, default=1.25)
+    parser.add_argument("--max-memory-growth", type=float, default=1.25)
+    args = parser.parse_args(argv)
+
+    cities = int(args.cities) if args.cities.isdigit() else args.cities.split(",")
+    layout = Layout.build(cities, args.stores_per_city, seed=args.seed)
+    report = run_benchmark(
+        [parse_size(s) for s in args.sizes.split(",") if s.strip()], args.workdir,
+        stages=[s.strip() for s in args.stages.split(",") if s.strip()], k=args.k, repeat=args.repeat,
+        layout=layout, seed=args.seed, keep=args.keep,
+    )
+    regressions: List[Dict[str, Any]] = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.max_slowdown, args.max_memory_growth)
+        report["baseline"] = os.path.abspath(args.baseline)
+        report["regressions"] = regressions
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2, default=str)
+    print(format_results(report["results"]))
+    for r in regressions:
+        print(f"REGRESSION {r['stage']} @ {r['rows']} rows: {r['metric']} {r['baseline']} -> {r['current']} (x{r['ratio']})")
+    print(f"results written to {args.out}")
+    failed = any(r.get("status") == "failed" for r in report["results"])
+    return 1 if regressions or failed else 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    raise SystemExit(main())
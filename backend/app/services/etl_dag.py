@@ -0,0 +1,218 @@
+"""
+etl_dag.py
+-- Runs ETL stages as a dependency graph: independent stages overlap, each gets a time/memory report
+"""
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import asdict, dataclass, field
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger("etl_dag")
+
+PENDING = "pending"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+SKIPPED = "skipped"
+
+_PAGE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def rss_mb() -> Optional[float]:
+    """Resident set size of this process, or None where /proc is unavailable."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _PAGE / 2**20
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+@dataclass
+class Stage:
+    """One step of the graph: `fn` is called with the results of `deps`, in that order."""
+
+    name: str
+    fn: Callable[..., Any]
+    deps: Tuple[str, ...] = ()
+
+
+@dataclass
+class StageReport:
+    name: str
+    deps: Tuple[str, ...]
+    status: str = PENDING
+    start_s: Optional[float] = None  # since the run started
+    wall_s: Optional[float] = None
+    rss_start_mb: Optional[float] = None
+    rss_end_mb: Optional[float] = None
+    # process-wide, sampled while the stage ran, so overlapping stages share it
+    rss_peak_mb: Optional[float] = None
+    error: Optional[str] = None
+    _t0: float = field(default=0.0, repr=False)
+
+    def as_dict(self) -> Dict[str, Any]:
+        out = asdict(self)
+        out.pop("_t0")
+        out["deps"] = list(self.deps)
+        for k in ("start_s", "wall_s"):
+            if out[k] is not None:
+                out[k] = round(out[k], 3)
+        for k in ("rss_start_mb", "rss_end_mb", "rss_peak_mb"):
+            if out[k] is not None:
+                out[k] = round(out[k], 1)
+        return out
+
+
+class EtlDag:
+    """Stages in a dependency graph, run on a thread pool as soon as their inputs are ready.
+
+    Results pass between stages in memory. Threads rather than processes, so frames
+    are shared instead of pickled; the heavy lifting (numpy, scikit-learn, the COPY into
+    Postgres) releases the GIL. When a stage fails nothing new is started, running
+    stages are waited for, and the stage's exception is raised; `report` stays filled in.
+    """
+
+    def __init__(self, stages: Iterable[Stage]):
+        self.stages: Dict[str, Stage] = {}
+        for s in stages:
+            if s.name in self.stages:
+                raise ValueError(f"duplicate stage {s.name!r}")
+            self.stages[s.name] = s
+        for s in self.stages.values():
+            missing = [d for d in s.deps if d not in self.stages]
+            if missing:
+                raise ValueError(f"stage {s.name!r} depends on unknown stages {missing}")
+        self.order = self._topological_order()
+        self.reports: Dict[str, StageReport] = {n: StageReport(n, tuple(self.stages[n].deps)) for n in self.order}
+        self.wall_s: Optional[float] = None
+
+    def _topological_order(self) -> List[str]:
+        order: List[str] = []
+        state: Dict[str, int] = {}  # 1 = visiting, 2 = done
+
+        def visit(name: str, path: Tuple[str, ...]) -> None:
+            if state.get(name) == 2:
+                return
+            if state.get(name) == 1:
+                raise ValueError(f"dependency cycle: {' -> '.join(path + (name,))}")
+            state[name] = 1
+            for d in self.stages[name].deps:
+                visit(d, path + (name,))
+            state[name] = 2
+            order.append(name)
+
+        for name in self.stages:
+            visit(name, ())
+        return order
+
+    @property
+    def report(self) -> List[Dict[str, Any]]:
+        return [self.reports[n].as_dict() for n in self.order]
+
+    def format_report(self) -> str:
+        def num(v, fmt):
+            return format(v, fmt) if v is not None else f"{'-':>8}"
+
+        width = max([len(n) for n in self.order] + [5])
+        lines = [f"{'stage':<{width}}  {'start_s':>8}  {'wall_s':>8}  {'rss_mb':>8}  {'peak_mb':>8}  status"]
+        for n in self.order:
+            r = self.reports[n]
+            lines.append(
+                f"{n:<{width}}  {num(r.start_s, '8.2f')}  {num(r.wall_s, '8.2f')}  "
+                f"{num(r.rss_end_mb, '8.0f')}  {num(r.rss_peak_mb, '8.0f')}  {r.status}"
+            )
+        if self.wall_s is not None:
+            lines.append(f"{'total':<{width}}  {'':>8}  {self.wall_s:8.2f}")
+        return "\n".join(lines)
+
+    def run(
+        self,
+        workers: int = 2,
+        on_start: Optional[Callable[[str], None]] = None,
+        on_finish: Optional[Callable[[str, str], None]] = None,
+        sample_interval_s: float = 0.05,
+    ) -> Dict[str, Any]:
+        """Run every stage; returns {stage name: result}.
+
+        `on_start(name)` and `on_finish(name, status)` are called from the scheduling thread.
+        """
+        workers = max(1, workers)
+        results: Dict[str, Any] = {}
+        running: Dict[Any, str] = {}
+        done: set = set()
+        failure: Optional[BaseException] = None
+        t_run = time.perf_counter()
+        stop = threading.Event()
+        lock = threading.Lock()
+
+        def sample() -> None:
+            while not stop.wait(sample_interval_s):
+                rss = rss_mb()
+                if rss is None:
+                    return
+                with lock:
+                    for name in running.values():
+                        r = self.reports[name]
+                        r.rss_peak_mb = max(r.rss_peak_mb or 0.0, rss)
+
+        def call(stage: Stage) -> Any:
+            return stage.fn(*(results[d] for d in stage.deps))
+
+        sampler = threading.Thread(target=sample, name="etl-dag-rss", daemon=True)
+        sampler.start()
+        try:
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="etl-stage") as pool:
+                while True:
+                    if failure is None:
+                        for name in self.order:
+                            if len(running) >= workers:
+                                break
+                            r = self.reports[name]
+                            if r.status == PENDING and all(d in done for d in self.stages[name].deps):
+                                r.status = RUNNING
+                                r._t0 = time.perf_counter()
+                                r.start_s = r._t0 - t_run
+                                r.rss_start_mb = r.rss_peak_mb = rss_mb()
+                                if on_start is not None:
+                                    on_start(name)
+                                fut = pool.submit(call, self.stages[name])
+                                with lock:
+                                    running[fut] = name
+                    if not running:
+                        break
+                    finished, _ = wait(list(running), return_when=FIRST_COMPLETED)
+                    for fut in finished:
+                        with lock:
+                            name = running.pop(fut)
+                        r = self.reports[name]
+                        r.wall_s = time.perf_counter() - r._t0
+                        r.rss_end_mb = rss_mb()
+                        if r.rss_end_mb is not None:
+                            r.rss_peak_mb = max(r.rss_peak_mb or 0.0, r.rss_end_mb)
+                        exc = fut.exception()
+                        if exc is None:
+                            results[name] = fut.result()
+                            done.add(name)
+                            r.status = SUCCEEDED
+                        else:
+                            r.status = FAILED
+                            r.error = f"{type(exc).__name__}: {exc}"
+                            if failure is None:
+                                failure = exc
+                        logger.info("Stage %s %s in %.2fs", name, r.status, r.wall_s)
+                        if on_finish is not None:
+                            on_finish(name, r.status)
+        finally:
+            stop.set()
+            self.wall_s = time.perf_counter() - t_run
+        for r in self.reports.values():
+            if r.status == PENDING:
+                r.status = SKIPPED
+        if failure is not None:
+            raise failure
+        return results
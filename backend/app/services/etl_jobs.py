@@ -0,0 +1,209 @@
+"""
+etl_jobs.py
+-- Background ETL runs for uploaded files, with per-stage progress and timings
+"""
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from ..config import settings
+from .etl import run_etl
+
+logger = logging.getLogger("etl_jobs")
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+
+def _now() -> datetime:
+    return datetime.now(tz=timezone.utc)
+
+
+@dataclass
+class EtlStage:
+    name: str
+    status: str = RUNNING
+    started_at: datetime = field(default_factory=_now)
+    finished_at: Optional[datetime] = None
+    duration_s: Optional[float] = None
+    _t0: float = field(default_factory=time.perf_counter, repr=False)
+
+    def finish(self, status: str) -> None:
+        self.status = status
+        self.finished_at = _now()
+        self.duration_s = round(time.perf_counter() - self._t0, 3)
+
+
+@dataclass
+class EtlJob:
+    id: str
+    filename: str
+    path: str
+    size_bytes: int
+    params: Dict[str, Any]
+    status: str = QUEUED
+    created_at: datetime = field(default_factory=_now)
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    duration_s: Optional[float] = None
+    stages: List[EtlStage] = field(default_factory=list)
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+
+    @property
+    def stage(self) -> Optional[str]:
+        return self.stages[-1].name if self.stages else None
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "filename": self.filename,
+            "size_bytes": self.size_bytes,
+            "params": self.params,
+            "status": self.status,
+            "stage": self.stage,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "duration_s": self.duration_s,
+            "stages": [
+                {
+                    "name": s.name,
+                    "status": s.status,
+                    "started_at": s.started_at,
+                    "finished_at": s.finished_at,
+                    "duration_s": s.duration_s,
+                }
+                for s in self.stages
+            ],
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+class EtlJobRegistry:
+    """Queue of ETL runs executed by a small thread pool.
+
+    run_etl writes fixed output paths under /data, so the default is a single
+    worker and runs execute one after another. Finished runs beyond `keep` are
+    forgotten oldest-first. State is per process.
+    """
+
+    def __init__(self, workers: int = 1, keep: int = 100):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="etl")
+        self._jobs: "OrderedDict[str, EtlJob]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.keep = keep
+
+    def submit(self, path: str, filename: str, size_bytes: int, **params: Any) -> EtlJob:
+        job = EtlJob(id=uuid.uuid4().hex, filename=filename, path=path, size_bytes=size_bytes, params=params)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._prune()
+        try:
+            self._executor.submit(self._run, job)
+        except BaseException:
+            # never going to run: don't list it as queued forever
+            with self._lock:
+                self._jobs.pop(job.id, None)
+            raise
+        return job
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return job.snapshot() if job is not None else None
+
+    def list(self, limit: int = 20) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [j.snapshot() for j in reversed(list(self._jobs.values())[-limit:])]
+
+    def _prune(self) -> None:
+        finished = [k for k, j in self._jobs.items() if j.status in (SUCCEEDED, FAILED)]
+        for k in finished[: max(0, len(self._jobs) - self.keep)]:
+            del self._jobs[k]
+
+    def _on_stage(self, job: EtlJob, name: str) -> None:
+        with self._lock:
+            job.stages.append(EtlStage(name=name))
+        logger.info("ETL %s: %s", job.id, name)
+
+    def _on_stage_done(self, job: EtlJob, name: str, status: str) -> None:
+        with self._lock:
+            for stage in job.stages:
+                if stage.name == name and stage.status == RUNNING:
+                    stage.finish(status)
+
+    def _run(self, job: EtlJob) -> None:
+        t0 = time.perf_counter()
+        with self._lock:
+            job.status = RUNNING
+            job.started_at = _now()
+        try:
+            result = run_etl(
+                job.path,
+                on_stage=lambda name: self._on_stage(job, name),
+                on_stage_done=lambda name, status: self._on_stage_done(job, name, status),
+                **job.params,
+            )
+        except Exception as e:
+            logger.exception("ETL %s failed", job.id)
+            with self._lock:
+                for stage in job.stages:
+                    if stage.status == RUNNING:
+                        stage.finish(FAILED)
+                job.status = FAILED
+                job.error = f"{type(e).__name__}: {e}"
+        else:
+            with self._lock:
+                job.status = SUCCEEDED
+                job.result = result
+        finally:
+            with self._lock:
+                job.finished_at = _now()
+                job.duration_s = round(time.perf_counter() - t0, 3)
+            try:
+                os.remove(job.path)
+            except OSError:
+                pass
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        with self._lock:
+            queued = [j for j in self._jobs.values() if j.status == QUEUED]
+        for job in queued:
+            try:
+                os.remove(job.path)
+            except OSError:
+                pass
+
+
+_registry: Optional[EtlJobRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_etl_jobs() -> EtlJobRegistry:
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = EtlJobRegistry(workers=settings.etl_workers)
+    return _registry
+
+
+def shutdown_etl_jobs() -> None:
+    global _registry
+    if _registry is not None:
+        _registry.close()
+        _registry = None
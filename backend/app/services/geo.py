@@ -0,0 +1,99 @@
+"""
+geo.py
+-- Geohash cells and haversine distances for spatial job queries
+"""
+from __future__ import annotations
+
+import math
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEG_LAT = 111.32
+GEOHASH_PRECISION = 9  # ~4.8m x 4.8m cells, stored on every job
+BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+_BASE32_BYTES = np.frombuffer(BASE32.encode(), dtype=np.uint8)
+
+
+def haversine_np(lat1, lon1, lat2, lon2):
+    """Great-circle distance in km, element-wise over arrays (NaN in -> NaN out)."""
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(x, dtype=float)) for x in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+def _bits(precision: int) -> tuple[int, int]:
+    total = 5 * precision
+    return total // 2, total - total // 2  # (lat bits, lng bits)
+
+
+def cell_size_deg(precision: int) -> tuple[float, float]:
+    lat_bits, lng_bits = _bits(precision)
+    return 180.0 / (1 << lat_bits), 360.0 / (1 << lng_bits)
+
+
+def geohash_encode_many(lat, lng, precision: int = GEOHASH_PRECISION) -> np.ndarray:
+    """Vectorized geohash; rows with NaN coordinates come back as None."""
+    shape = np.shape(lat)
+    lat = np.asarray(lat, dtype=float).ravel()
+    lng = np.asarray(lng, dtype=float).ravel()
+    valid = ~(np.isnan(lat) | np.isnan(lng))
+    lat_bits, lng_bits = _bits(precision)
+    lat_q = np.clip(((np.nan_to_num(lat) + 90.0) / 180.0 * (1 << lat_bits)).astype(np.int64), 0, (1 << lat_bits) - 1)
+    lng_q = np.clip(((np.nan_to_num(lng) + 180.0) / 360.0 * (1 << lng_bits)).astype(np.int64), 0, (1 << lng_bits) - 1)
+    # interleave: even bit positions (from the most significant end) come from longitude
+    code = np.zeros(lat.shape, dtype=np.int64)
+    for i in range(5 * precision):
+        if i % 2 == 0:
+            bit = (lng_q >> (lng_bits - 1 - i // 2)) & 1
+        else:
+            bit = (lat_q >> (lat_bits - 1 - i // 2)) & 1
+        code = (code << 1) | bit
+    shifts = 5 * np.arange(precision - 1, -1, -1, dtype=np.int64)
+    chars = _BASE32_BYTES[(code[:, None] >> shifts) & 31]
+    out = np.ascontiguousarray(chars).view(f"S{precision}").ravel().astype(str).astype(object)
+    out[~valid] = None
+    return out.reshape(shape)
+
+
+def geohash_encode(lat: float, lng: float, precision: int = GEOHASH_PRECISION) -> str | None:
+    return geohash_encode_many(np.array([lat]), np.array([lng]), precision)[0]
+
+
+def _grid_cells(min_lat: float, min_lng: float, max_lat: float, max_lng: float, precision: int) -> set[str]:
+    dlat, dlng = cell_size_deg(precision)
+    lats = np.arange(min_lat, max_lat + dlat, dlat)
+    lngs = np.arange(min_lng, max_lng + dlng, dlng)
+    lats = np.clip(np.append(lats, max_lat), -90, 90)
+    lngs = np.clip(np.append(lngs, max_lng), -180, 180)
+    glat, glng = np.meshgrid(lats, lngs, indexing="ij")
+    return set(geohash_encode_many(glat.ravel(), glng.ravel(), precision))
+
+
+def cells_for_radius(lat: float, lng: float, radius_km: float) -> list[str]:
+    """Geohash prefixes whose union covers the circle: the coarsest cell at least as
+    large as the radius, plus its neighbours."""
+    km_per_deg_lng = KM_PER_DEG_LAT * max(math.cos(math.radians(lat)), 1e-6)
+    precision = 1
+    for p in range(GEOHASH_PRECISION, 0, -1):
+        dlat, dlng = cell_size_deg(p)
+        if dlat * KM_PER_DEG_LAT >= radius_km and dlng * km_per_deg_lng >= radius_km:
+            precision = p
+            break
+    dlat, dlng = cell_size_deg(precision)
+    return sorted(_grid_cells(lat - dlat, lng - dlng, lat + dlat, lng + dlng, precision))
+
+
+def cells_for_bbox(min_lat: float, min_lng: float, max_lat: float, max_lng: float, max_cells: int = 32) -> list[str]:
+    """Finest set of geohash prefixes (at most `max_cells`) covering the box."""
+    for p in range(GEOHASH_PRECISION, 0, -1):
+        dlat, dlng = cell_size_deg(p)
+        estimate = (math.ceil((max_lat - min_lat) / dlat) + 2) * (math.ceil((max_lng - min_lng) / dlng) + 2)
+        if estimate <= max_cells:
+            return sorted(_grid_cells(min_lat, min_lng, max_lat, max_lng, p))
+    return sorted(_grid_cells(min_lat, min_lng, max_lat, max_lng, 1))
+
+
+def bounding_box(lat: float, lng: float, radius_km: float) -> tuple[float, float, float, float]:
+    dlat = radius_km / KM_PER_DEG_LAT
+    dlng = radius_km / (KM_PER_DEG_LAT * max(math.cos(math.radians(lat)), 1e-6))
+    return lat - dlat, lng - dlng, lat + dlat, lng + dlng
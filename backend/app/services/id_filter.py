@@ -0,0 +1,212 @@
+"""
+id_filter.py
+-- Bloom filter of known external_job_ids, so new jobs skip the duplicate lookup
+"""
+from __future__ import annotations
+
+import hashlib
+import logging
+import math
+import threading
+import time
+from typing import Iterable, Optional
+
+import numpy as np
+from sqlalchemy import func, select
+
+from ..config import settings
+from ..db import engine
+from .. import models
+
+logger = logging.getLogger("id_filter")
+
+_MASK64 = (1 << 64) - 1
+
+
+def _hashes(key: str) -> tuple[int, int]:
+    # two 64-bit halves of one digest, combined by double hashing into k bit positions
+    d = int.from_bytes(hashlib.blake2b(key.encode(), digest_size=16).digest(), "little")
+    return d & _MASK64, (d >> 64) | 1
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings, sized for `capacity` items at `fpr`."""
+
+    def __init__(self, capacity: int, fpr: float = 0.01):
+        self.capacity = max(int(capacity), 1)
+        self.fpr = fpr
+        self.m = max(64, int(math.ceil(-self.capacity * math.log(fpr) / math.log(2) ** 2)))
+        self.k = max(1, int(round(self.m / self.capacity * math.log(2))))
+        self._bits = np.zeros((self.m + 7) // 8, dtype=np.uint8)
+        self._lock = threading.Lock()
+        self.count = 0
+
+    def add_many(self, keys: Iterable[str]) -> None:
+        hashes = np.array([_hashes(k) for k in keys], dtype=np.uint64).reshape(-1, 2)
+        if not len(hashes):
+            return
+        i = np.arange(self.k, dtype=np.uint64)
+        pos = ((hashes[:, :1] + i * hashes[:, 1:]) % np.uint64(self.m)).ravel()
+        masks = np.left_shift(np.uint8(1), (pos & np.uint64(7)).astype(np.uint8))
+        with self._lock:
+            np.bitwise_or.at(self._bits, pos >> np.uint64(3), masks)
+            self.count += len(hashes)
+
+    def __contains__(self, key: str) -> bool:
+        h1, h2 = _hashes(key)
+        bits, m = self._bits, self.m
+        for i in range(self.k):
+            p = ((h1 + i * h2) & _MASK64) % m
+            if not bits[p >> 3] & (1 << (p & 7)):
+                return False
+        return True
+
+    def expected_fpr(self) -> float:
+        return (1 - math.exp(-self.k * self.count / self.m)) ** self.k
+
+    @property
+    def nbytes(self) -> int:
+        return self._bits.nbytes
+
+
+class JobIdFilter:
+    """Known external_job_ids, loaded from the jobs table in the background.
+
+    Until the load finishes every id is a "maybe", so callers fall back to the
+    database. Ids inserted by this process are added as they commit; ids written by
+    other processes are not, so a "definitely new" answer must still be backed by the
+    unique constraint. Once the filter holds more ids than it was sized for it is
+    rebuilt at twice the capacity.
+    """
+
+    def __init__(self, capacity: int, fpr: float = 0.01, bind=engine):
+        self.min_capacity = capacity
+        self.target_fpr = fpr
+        self._bind = bind
+        self._active: Optional[BloomFilter] = None
+        self._building: Optional[BloomFilter] = None
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self.load_s: Optional[float] = None
+        self.lookups = 0
+        self.skipped_queries = 0
+        self.false_positives = 0
+
+    @property
+    def ready(self) -> bool:
+        return self._active is not None
+
+    def start(self) -> None:
+        self._rebuild(capacity=None)
+
+    def _rebuild(self, capacity: Optional[int]) -> None:
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._load, args=(capacity,), name="job-id-filter", daemon=True)
+            self._thread.start()
+
+    def _load(self, capacity: Optional[int]) -> None:
+        t0 = time.perf_counter()
+        try:
+            with self._bind.connect() as conn:
+                rows = conn.scalar(select(func.count()).select_from(models.Job)) or 0
+                bloom = BloomFilter(max(capacity or 0, self.min_capacity, 2 * rows), self.target_fpr)
+                with self._lock:
+                    self._building = bloom
+                # Core rows, streamed server-side: no ORM overhead for a million ids
+                result = conn.execution_options(stream_results=True, yield_per=100_000).execute(
+                    select(models.Job.external_job_id)
+                )
+                for chunk in result.scalars().partitions():
+                    bloom.add_many(chunk)
+        except Exception:
+            logger.exception("Loading external_job_id filter failed; duplicate checks stay on the database")
+            with self._lock:
+                self._building = None
+            return
+        with self._lock:
+            self._active, self._building = bloom, None
+        self.load_s = round(time.perf_counter() - t0, 3)
+        logger.info("external_job_id filter loaded: %d ids, %d KiB in %.2fs", bloom.count, bloom.nbytes >> 10, self.load_s)
+
+    def add_many(self, ids: Iterable[str]) -> None:
+        ids = list(ids)
+        with self._lock:
+            targets = [b for b in (self._active, self._building) if b is not None]
+        for bloom in targets:
+            bloom.add_many(ids)
+        active = self._active
+        if active is not None and active.count > active.capacity:
+            self._rebuild(capacity=2 * active.capacity)
+
+    def might_contain(self, external_job_id: str) -> bool:
+        """False only when the id has definitely not been inserted (as far as this process knows)."""
+        self.lookups += 1
+        active = self._active
+        if active is None or external_job_id in active:
+            return True
+        self.skipped_queries += 1
+        return False
+
+    def record_false_positive(self) -> None:
+        self.false_positives += 1
+
+    def stats(self) -> dict:
+        active = self._active
+        maybes = self.lookups - self.skipped_queries
+        out = {
+            "ready": active is not None,
+            "rebuilding": self._building is not None,
+            "load_s": self.load_s,
+            "lookups": self.lookups,
+            "skipped_queries": self.skipped_queries,
+            "false_positives": self.false_positives,
+            # share of lookups for absent ids that still went to the database
+            "observed_fpr": round(self.false_positives / (self.false_positives + self.skipped_queries), 6)
+            if self.false_positives + self.skipped_queries else None,
+            "maybe_present": maybes,
+        }
+        if active is not None:
+            out.update({
+                "ids": active.count,
+                "capacity": active.capacity,
+                "bits": active.m,
+                "hashes": active.k,
+                "memory_bytes": active.nbytes,
+                "target_fpr": active.fpr,
+                "expected_fpr": round(active.expected_fpr(), 6),
+            })
+        return out
+
+
+_global_filter: Optional[JobIdFilter] = None
+_global_lock = threading.Lock()
+
+
+def get_job_id_filter() -> Optional[JobIdFilter]:
+    """The process-wide filter, or None when JOB_ID_FILTER is off."""
+    global _global_filter
+    if not settings.job_id_filter:
+        return None
+    if _global_filter is None:
+        with _global_lock:
+            if _global_filter is None:
+                f = JobIdFilter(settings.job_id_filter_capacity, settings.job_id_filter_fpr)
+                f.start()
+                _global_filter = f
+    return _global_filter
+
+
+def start_job_id_filter() -> None:
+    get_job_id_filter()
+
+
+def note_inserted(ids: Iterable[str]) -> None:
+    """Record committed inserts; a no-op in processes that never started the filter (ETL scripts)."""
+    if _global_filter is not None:
+        _global_filter.add_many(ids)
+
+
+def job_id_filter_stats() -> Optional[dict]:
+    return _global_filter.stats() if _global_filter is not None else None
@@ -0,0 +1,336 @@
+"""
+job_buffer.py
+-- Write-behind buffer for POST /jobs: durable append-only log, batched inserts into Postgres
+"""
+from __future__ import annotations
+
+import asyncio
+import fcntl
+import logging
+import os
+import queue
+import threading
+import time
+from typing import List, Optional, Tuple
+
+from pydantic import ValidationError
+
+from ..config import settings
+from ..db import SessionLocal
+from .. import crud, schemas
+from . import rollups
+
+logger = logging.getLogger("job_buffer")
+
+_SEGMENT_SUFFIX = ".jsonl"
+
+
+class JobWriteBuffer:
+    """Acknowledges jobs once they are in the local log; a flusher loads them in batches.
+
+    Requests hand their job to a writer thread, which appends every waiting job to the
+    active log segment and fsyncs once for the whole group before acknowledging them.
+    The segment is sealed once it holds `batch_size` jobs or is `flush_interval_s` old;
+    a second thread bulk inserts sealed segments (skipping external_job_ids that already
+    exist) and deletes them once committed. Segments left behind by a crash are replayed
+    on start.
+
+    Each process claims its own log slot under `base_dir` with an exclusive flock, so
+    several workers can share one directory and a restarted worker replays the slot a
+    dead one left behind.
+    """
+
+    def __init__(
+        self,
+        base_dir: str,
+        batch_size: int = 1000,
+        flush_interval_s: float = 0.2,
+        fsync: bool = True,
+        session_factory=SessionLocal,
+    ):
+        self.base_dir = base_dir
+        self.batch_size = batch_size
+        self.flush_interval_s = flush_interval_s
+        self.fsync = fsync
+        self._session_factory = session_factory
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._waiting: List[Tuple[str, schemas.JobCreate, asyncio.AbstractEventLoop, asyncio.Future]] = []
+        self._pending_ids: set[str] = set()
+        self._sealed: "queue.Queue[Optional[Tuple[str, List[schemas.JobCreate]]]]" = queue.Queue()
+        self._threads: List[threading.Thread] = []
+        self._lock_fd: Optional[int] = None
+        self.dir: Optional[str] = None
+        self._seq = 0
+        self._segment = None
+        self._segment_path: Optional[str] = None
+        self._segment_jobs: List[schemas.JobCreate] = []
+        self._segment_opened = 0.0
+        self.accepted = 0
+        self.flushed = 0
+        self.skipped = 0
+        self.replayed = 0
+        self.flush_errors = 0
+
+    # -- lifecycle -----------------------------------------------------------
+    def start(self) -> None:
+        if self._threads:
+            return
+        self._claim_dir()
+        self._replay()
+        self._open_segment()
+        self._stop.clear()
+        self._threads = [
+            threading.Thread(target=self._write_loop, name="jobs-wal-writer", daemon=True),
+            threading.Thread(target=self._flush_loop, name="jobs-wal-flusher", daemon=True),
+        ]
+        for t in self._threads:
+            t.start()
+
+    def close(self, timeout_s: float = 10.0) -> None:
+        """Stop accepting, seal the active segment and wait for the flusher to drain."""
+        self._stop.set()
+        self._wake.set()
+        writer, flusher = self._threads or (None, None)
+        if writer is not None:
+            writer.join(timeout=timeout_s)
+        self._sealed.put(None)
+        if flusher is not None:
+            flusher.join(timeout=timeout_s)
+        self._threads = []
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)
+            self._lock_fd = None
+
+    def _claim_dir(self) -> None:
+        os.makedirs(self.base_dir, exist_ok=True)
+        for slot in range(256):
+            path = os.path.join(self.base_dir, f"w{slot}")
+            if not os.path.isdir(path):
+                os.makedirs(path, exist_ok=True)
+                self._sync_dir(self.base_dir)
+            fd = os.open(os.path.join(path, "lock"), os.O_CREAT | os.O_RDWR, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(fd)
+                continue
+            self._lock_fd = fd
+            self.dir = path
+            return
+        raise RuntimeError(f"no free write-behind log slot under {self.base_dir}")
+
+    def _segments(self) -> List[str]:
+        names = sorted(n for n in os.listdir(self.dir) if n.endswith(_SEGMENT_SUFFIX))
+        return [os.path.join(self.dir, n) for n in names]
+
+    def _replay(self) -> None:
+        for path in self._segments():
+            jobs = []
+            with open(path, "rb") as f:
+                for line in f:
+                    try:
+                        jobs.append(schemas.JobCreate.model_validate_json(line))
+                    except ValidationError:
+                        # a torn final line from a crash mid-write was never acknowledged
+                        logger.warning("Skipping unreadable line in %s", path)
+            self._seq = max(self._seq, int(os.path.basename(path)[: -len(_SEGMENT_SUFFIX)]))
+            self._pending_ids.update(j.external_job_id for j in jobs)
+            self.replayed += len(jobs)
+            self._sealed.put((path, jobs))
+        if self.replayed:
+            logger.info("Replaying %d buffered jobs from %s", self.replayed, self.dir)
+
+    # -- producer ------------------------------------------------------------
+    async def append(self, job: schemas.JobCreate) -> bool:
+        """Durably log `job`; False if the same external_job_id is still waiting to be flushed."""
+        fut = asyncio.get_running_loop().create_future()
+        line = job.model_dump_json()
+        with self._lock:
+            if self._stop.is_set():
+                raise RuntimeError("write-behind buffer is closed")
+            if job.external_job_id in self._pending_ids:
+                return False
+            self._pending_ids.add(job.external_job_id)
+            self._waiting.append((line, job, asyncio.get_running_loop(), fut))
+        self._wake.set()
+        await fut
+        return True
+
+    # -- writer --------------------------------------------------------------
+    def _open_segment(self) -> None:
+        self._seq += 1
+        self._segment_path = os.path.join(self.dir, f"{self._seq:012d}{_SEGMENT_SUFFIX}")
+        self._segment = open(self._segment_path, "ab")
+        # the fsync after each append covers the file's data, not its directory entry
+        self._sync_dir(self.dir)
+        self._segment_jobs = []
+        self._segment_opened = time.monotonic()
+
+    def _sync_dir(self, path: str) -> None:
+        """Make created/removed entries of directory `path` durable (with fsync on)."""
+        if not self.fsync:
+            return
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def _seal_segment(self) -> None:
+        self._segment.close()
+        self._sealed.put((self._segment_path, self._segment_jobs))
+        self._open_segment()
+
+    def _write_loop(self) -> None:
+        while True:
+            self._wake.wait(self.flush_interval_s)
+            self._wake.clear()
+            with self._lock:
+                batch, self._waiting = self._waiting, []
+            if batch:
+                try:
+                    self._segment.write(("\n".join(line for line, _, _, _ in batch) + "\n").encode())
+                    self._segment.flush()
+                    if self.fsync:
+                        os.fsync(self._segment.fileno())
+                except Exception as e:
+                    logger.exception("Write-behind log append failed")
+                    with self._lock:
+                        self._pending_ids.difference_update(job.external_job_id for _, job, _, _ in batch)
+                    _notify(batch, e)
+                else:
+                    self._segment_jobs.extend(job for _, job, _, _ in batch)
+                    self.accepted += len(batch)
+                    _notify(batch, None)
+            stopping = self._stop.is_set()
+            if self._segment_jobs and (
+                stopping
+                or len(self._segment_jobs) >= self.batch_size
+                or time.monotonic() - self._segment_opened >= self.flush_interval_s
+            ):
+                self._seal_segment()
+            if stopping:
+                with self._lock:
+                    if self._waiting:
+                        continue
+                self._segment.close()
+                if not self._segment_jobs:
+                    os.remove(self._segment_path)
+                return
+
+    # -- flusher -------------------------------------------------------------
+    def _flush_loop(self) -> None:
+        while True:
+            item = self._sealed.get()
+            if item is None:
+                return
+            path, jobs = item
+            delay = 0.5
+            while True:
+                try:
+                    self._load(jobs)
+                    break
+                except Exception:
+                    self.flush_errors += 1
+                    if self._stop.is_set():
+                        # leave this and any later segments on disk for the next process to replay
+                        logger.exception("Write-behind flush of %s failed during shutdown", path)
+                        return
+                    logger.exception("Write-behind flush of %s failed; retrying in %.1fs", path, delay)
+                    time.sleep(delay)
+                    delay = min(delay * 2, 30.0)
+            os.remove(path)
+            # a segment that came back after a crash would only be replayed into skips
+            self._sync_dir(self.dir)
+            with self._lock:
+                self._pending_ids.difference_update(j.external_job_id for j in jobs)
+
+    def _load(self, jobs: List[schemas.JobCreate]) -> None:
+        by_id = {j.external_job_id: j for j in jobs}
+
+        def _roll(db, ids):
+            rollups.apply_increments(db, rollups.job_increments(by_id[i] for i in ids))
+
+        with self._session_factory() as db:
+            inserted = crud.bulk_insert_jobs(db, (crud.job_row(j) for j in by_id.values()), on_batch=_roll)
+        self.flushed += len(inserted)
+        dropped = by_id.keys() - set(inserted)
+        if dropped:
+            # acknowledged with 202 but already in Postgres (or replayed after a flush committed)
+            self.skipped += len(dropped)
+            logger.warning(
+                "Dropped %d buffered jobs whose external_job_id already exists: %s",
+                len(dropped), ", ".join(sorted(dropped)[:10]) + (" ..." if len(dropped) > 10 else ""),
+            )
+
+    def stats(self) -> dict:
+        with self._lock:
+            waiting = len(self._waiting)
+            pending = len(self._pending_ids)
+        return {
+            "dir": self.dir,
+            "waiting_for_log": waiting,
+            "pending": pending,
+            "sealed_segments": self._sealed.qsize(),
+            "accepted": self.accepted,
+            "flushed": self.flushed,
+            "skipped_existing": self.skipped,
+            "replayed": self.replayed,
+            "flush_errors": self.flush_errors,
+        }
+
+
+def _notify(batch, error: Optional[BaseException]) -> None:
+    for _, _, loop, fut in batch:
+        try:
+            loop.call_soon_threadsafe(_resolve, fut, error)
+        except RuntimeError:
+            pass  # the requester's loop is gone; nothing left to acknowledge
+
+
+def _resolve(fut: asyncio.Future, error: Optional[BaseException]) -> None:
+    if fut.done():
+        return
+    if error is None:
+        fut.set_result(None)
+    else:
+        fut.set_exception(error)
+
+
+_global_buffer: Optional[JobWriteBuffer] = None
+_global_lock = threading.Lock()
+
+
+def get_job_buffer() -> JobWriteBuffer:
+    global _global_buffer
+    if _global_buffer is None:
+        with _global_lock:
+            if _global_buffer is None:
+                buffer = JobWriteBuffer(
+                    settings.jobs_write_behind_dir,
+                    batch_size=settings.jobs_flush_batch_size,
+                    flush_interval_s=settings.jobs_flush_interval_s,
+                    fsync=settings.jobs_write_behind_fsync,
+                )
+                buffer.start()
+                _global_buffer = buffer
+    return _global_buffer
+
+
+def job_buffer_stats() -> Optional[dict]:
+    return _global_buffer.stats() if _global_buffer is not None else None
+
+
+def start_job_buffer() -> None:
+    """Startup hook: replay anything a previous process left in the log."""
+    if settings.jobs_write_behind:
+        get_job_buffer()
+
+
+def shutdown_job_buffer() -> None:
+    global _global_buffer
+    if _global_buffer is not None:
+        _global_buffer.close()
+        _global_buffer = None
@@ -8,6 +8,9 @@ import joblib
 import logging
 import os
 import numpy as np
+from . import datasets
+from .datasets import DatasetRef, resolve
+from .stage_cache import get_stage_cache
 
 logger = logging.getLogger("model_train")
 logging.basicConfig(level=logging.INFO)
@@ -15,18 +18,35 @@ logging.basicConfig(level=logging.INFO)
 MODEL_DIR = "backend/app/models_artifacts"
 MODEL_PATH = os.path.join(MODEL_DIR, "payout_model_v1.joblib")
 
+# the only jobs_zoned columns training looks at
+TRAIN_COLUMNS = ['created_at', 'zone_id', 'distance_km', 'final_payout', 'base_payout']
+
 def prepare_features(df: pd.DataFrame):
     df = df.copy()
     df['hour'] = pd.to_datetime(df['created_at'], errors='coerce').dt.hour.fillna(0).astype(int)
-    df['zone_id'] = df['zone_id'].fillna(-1)
+    df['zone_id'] = df['zone_id'].astype(float).fillna(-1)
     df['distance_km'] = df['distance_km'].fillna(df['distance_km'].median() if not df['distance_km'].isna().all() else 1.0)
     X = df[['distance_km','hour','zone_id']].astype(float).fillna(0)
     return X
 
-def train_payout_model(jobs_zoned_csv: str):
-    if not os.path.exists(MODEL_DIR):
-        os.makedirs(MODEL_DIR, exist_ok=True)
-    df = pd.read_csv(jobs_zoned_csv, parse_dates=['created_at'])
+def train_payout_model(jobs_zoned_csv: str, force: bool = False, model_path: str = MODEL_PATH):
+    return train_payout_dataset(DatasetRef(jobs_zoned_csv), force=force, model_path=model_path)
+
+def train_payout_dataset(jobs_zoned: DatasetRef, force: bool = False, model_path: str = MODEL_PATH):
+    """Fit the payout model on the zoned jobs; reuses a cached artifact for the same jobs unless `force`."""
+    cache = get_stage_cache()
+    if cache is not None:
+        key = cache.key("train", code=[__file__, datasets.__file__], inputs=[resolve(jobs_zoned.path)])
+        if not force and cache.restore("train", [key], [model_path]):
+            return model_path
+    path = _train_payout_dataset(jobs_zoned, model_path)
+    if cache is not None:
+        cache.store("train", key, [path])
+    return path
+
+def _train_payout_dataset(jobs_zoned: DatasetRef, model_path: str = MODEL_PATH):
+    os.makedirs(os.path.dirname(model_path) or ".", exist_ok=True)
+    df = jobs_zoned.read(columns=TRAIN_COLUMNS, parse_dates=['created_at'])
     # target: final_payout or base_payout fallback
     df['target'] = df['final_payout'].fillna(df['base_payout']).astype(float)
     df = df.dropna(subset=['target'])
@@ -35,12 +55,12 @@ def train_payout_model(jobs_zoned_csv: str):
         model = LinearRegression()
         model.intercept_ = 0.0
         model.coef_ = np.array([0.0,0.0,0.0])
-        joblib.dump(model, MODEL_PATH)
-        return MODEL_PATH
+        joblib.dump(model, model_path)
+        return model_path
     X = prepare_features(df)
     y = df['target']
     model = LinearRegression()
     model.fit(X, y)
-    joblib.dump(model, MODEL_PATH)
-    logger.info("Trained payout model saved to %s", MODEL_PATH)
-    return MODEL_PATH
+    joblib.dump(model, model_path)
+    logger.info("Trained payout model saved to %s", model_path)
+    return model_path
@@ -2,7 +2,18 @@ import pandas as pd
 import numpy as np
 from datetime import datetime
 from math import radians, cos, sin, asin, sqrt
+import itertools
 import logging
+import os
+import sqlite3
+import tempfile
+import warnings
+from typing import Iterator
+import openpyxl
+from . import datasets, geo
+from .datasets import DatasetRef, DatasetWriter, dataset_files, upsert_dataset
+from .geo import haversine_np
+from .stage_cache import get_stage_cache
 
 logger = logging.getLogger("preprocess")
 logging.basicConfig(level=logging.INFO)
@@ -28,6 +39,83 @@ def parse_datetime(x):
         except Exception:
             return pd.NaT
 
+def _utc_ns(parsed: pd.Series) -> np.ndarray:
+    return parsed.dt.tz_localize(None).to_numpy(dtype='datetime64[ns]')
+
+def _parse_iso(strs: pd.Series) -> pd.Series:
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        try:
+            parsed = pd.to_datetime(strs, format='ISO8601', errors='coerce')
+        except ValueError:
+            parsed = None
+    if parsed is not None and pd.api.types.is_datetime64_any_dtype(parsed):
+        return parsed.dt.tz_localize('UTC') if parsed.dt.tz is None else parsed.dt.tz_convert('UTC')
+    # naive and offset strings mixed: one utc=True pass would apply an offset to the naive ones
+    out = pd.Series(pd.NaT, index=strs.index, dtype='datetime64[ns, UTC]')
+    has_tz = strs.str.contains(r'(?:Z|[+-]\d{2}:?\d{2})$', regex=True).to_numpy()
+    for group in (has_tz, ~has_tz):
+        if group.any():
+            out.iloc[group] = pd.to_datetime(strs[group], utc=True, format='ISO8601', errors='coerce').array
+    return out
+
+def parse_datetimes(s: pd.Series) -> pd.Series:
+    """parse_datetime over a whole column.
+
+    Strings are parsed as ISO 8601 in one pass and those that are not ISO each on its
+    own format (format='mixed'), as the per-cell parse would. Other non-string cells
+    (datetime objects, numbers) are converted together, with parse_datetime as the
+    last resort.
+    """
+    if pd.api.types.is_datetime64_any_dtype(s) or pd.api.types.is_numeric_dtype(s):
+        out = pd.to_datetime(s, utc=True, errors='coerce')
+    else:
+        values = np.full(len(s), np.datetime64('NaT'), dtype='datetime64[ns]')
+        is_str = s.map(type).eq(str).to_numpy()
+        if is_str.any():
+            strs = s[is_str]
+            parsed = _parse_iso(strs)
+            retry = parsed.isna().to_numpy()
+            if retry.any():
+                parsed.iloc[retry] = pd.to_datetime(strs[retry], utc=True, format='mixed', errors='coerce').array
+            values[is_str] = _utc_ns(parsed)
+        other = ~is_str & s.notna().to_numpy()
+        if other.any():
+            vals = s[other]
+            parsed = pd.to_datetime(vals, utc=True, errors='coerce')
+            retry = parsed.isna().to_numpy()
+            if retry.any():
+                parsed.iloc[retry] = pd.to_datetime(vals[retry].map(parse_datetime), utc=True).array
+            values[other] = _utc_ns(parsed)
+        out = pd.Series(values, index=s.index).dt.tz_localize('UTC')
+    if out.isna().all():
+        # the per-cell parse yields a tz-naive column when nothing parses
+        return out.dt.tz_localize(None)
+    return out
+
+def _tag(s: pd.Series, prefix: str = "") -> pd.Series:
+    """str(v) (or f"{prefix}{int(v)}" with a prefix) per cell; NaN where the cell is missing."""
+    present = s.notna()
+    vals = s[present]
+    if prefix:
+        nums = pd.to_numeric(vals)
+        vals = np.trunc(nums.astype(float)).astype(np.int64) if nums.dtype.kind == 'f' else nums.astype(np.int64)
+    return (prefix + vals.astype(str)).reindex(s.index)
+
+def make_ids(df: pd.DataFrame, row_offset: int = 0) -> pd.Series:
+    """"<cee_id>-y<year>-w<week>-<row>" from whichever of the parts are present."""
+    df = df.reset_index(drop=True)
+    ids = pd.Series((df.index + row_offset).astype(str), index=df.index)
+    # row-wise access upcasts numeric-only frames (int cee_id 7 -> "7.0"); match that
+    row_dtype = df.iloc[0].dtype if len(df) else object
+    for col, prefix in (('week', 'w'), ('year', 'y'), ('cee_id', '')):
+        if col not in df.columns:
+            continue
+        part = df[col] if row_dtype == object or prefix else df[col].astype(row_dtype)
+        tag = _tag(part, prefix)
+        ids = ids.where(tag.isna(), tag + "-" + ids)
+    return ids
+
 # Mapping suggestions (extend if your Excel has other names)
 COLUMN_MAP = {
     'order_id':'job_id','orderid':'job_id','job_id':'job_id',
@@ -66,42 +154,50 @@ def fill_missing_fields(df: pd.DataFrame) -> pd.DataFrame:
             df[c] = np.nan
     return df
 
-def clean_dataframe(df: pd.DataFrame) -> pd.DataFrame:
+def _utcnow() -> pd.Timestamp:
+    return pd.Timestamp.utcnow()
+
+def _synth_created(df: pd.DataFrame, now: pd.Timestamp) -> pd.Series:
+    """created_at for rows without one: the first of their year/month, else `now`."""
+    if 'year' not in df.columns or 'month' not in df.columns:
+        return pd.Series(now, index=df.index)
+    ym = pd.DataFrame({
+        'year': np.trunc(pd.to_numeric(df['year'], errors='coerce')),
+        'month': np.trunc(pd.to_numeric(df['month'], errors='coerce')),
+        'day': 1,
+    })
+    # unusable year/month falls back to now
+    return pd.to_datetime(ym, errors='coerce').dt.tz_localize('UTC').fillna(now)
+
+def _fill(s: pd.Series, values: pd.Series) -> pd.Series:
+    missing = s.isna()
+    if missing.all():
+        return values
+    return s.astype(object).where(~missing, values)
+
+def clean_dataframe(df: pd.DataFrame, row_offset: int = 0, now: pd.Timestamp | None = None) -> pd.DataFrame:
+    """Normalize, parse, derive and dedupe one export (or one chunk of it).
+
+    Rows without a job_id or created_at get synthesized ones, row by row, so a row's
+    values never depend on how the input was chunked: `row_offset` is the position
+    of df's first row in the whole input and `now` the run's fallback timestamp.
+    """
+    now = _utcnow() if now is None else now
     logger.info("Normalizing column names...")
     df = normalize_columns(df)
     df = fill_missing_fields(df)
-    # synthesize job_id if missing
-    if 'job_id' not in df.columns or df['job_id'].isna().all():
-        def make_id(row, idx):
-            parts = []
-            if 'cee_id' in row and not pd.isna(row['cee_id']):
-                parts.append(str(row['cee_id']))
-            if 'year' in row and not pd.isna(row['year']):
-                parts.append(f"y{int(row['year'])}")
-            if 'week' in row and not pd.isna(row['week']):
-                parts.append(f"w{int(row['week'])}")
-            parts.append(str(idx))
-            return "-".join(parts)
-        df = df.reset_index(drop=True)
-        df['job_id'] = [make_id(df.loc[i], i) for i in range(len(df))]
-    # ensure created_at exists
-    if 'created_at' not in df.columns or df['created_at'].isna().all():
-        if 'year' in df.columns and 'month' in df.columns:
-            def mk_date(y, m):
-                try:
-                    return pd.to_datetime({'year':[int(y)],'month':[int(m)],'day':[1]}).iloc[0]
-                except Exception:
-                    return pd.Timestamp.utcnow()
-            df['created_at'] = [mk_date(y, m) for y, m in zip(df.get('year', []), df.get('month', []))]
-        else:
-            df['created_at'] = pd.Timestamp.utcnow()
+    df = df.reset_index(drop=True)
+    if df['job_id'].isna().any():
+        df['job_id'] = _fill(df['job_id'], make_ids(df, row_offset))
+    if df['created_at'].isna().any():
+        df['created_at'] = _fill(df['created_at'], _synth_created(df, now))
     # parse dates
     for d in ['created_at','scheduled_at','completed_at']:
         if d in df.columns:
-            df[d] = df[d].apply(parse_datetime)
+            df[d] = parse_datetimes(df[d])
     # compute distances
     logger.info("Computing haversine distances...")
-    df['distance_km'] = df.apply(lambda r: haversine(r.get('pickup_lat'), r.get('pickup_lng'), r.get('drop_lat'), r.get('drop_lng')), axis=1)
+    df['distance_km'] = haversine_np(*(pd.to_numeric(df[c], errors='coerce') for c in ('pickup_lat', 'pickup_lng', 'drop_lat', 'drop_lng')))
     # duration in seconds
     if 'completed_at' in df.columns and 'scheduled_at' in df.columns:
         df['duration_seconds'] = (df['completed_at'] - df['scheduled_at']).dt.total_seconds()
@@ -134,7 +230,30 @@ def clean_dataframe(df: pd.DataFrame) -> pd.DataFrame:
         'rider_id','cancellation_flag','cancellation_reason'
     ]
     present = [c for c in cols if c in df.columns]
-    return df[present]
+    return with_output_types(df[present])
+
+TEXT_COLUMNS = ['job_id','store','rider_id','cancellation_reason']
+DATE_COLUMNS = ['created_at','scheduled_at','completed_at']
+
+def with_output_types(df: pd.DataFrame) -> pd.DataFrame:
+    """Pin the cleaned frame's dtypes so every chunk (and every file) has one schema.
+
+    Ids and labels become text, coordinates and amounts float64, timestamps UTC;
+    otherwise a column's type would depend on which values a chunk happened to hold.
+    """
+    df = df.copy()
+    for c in df.columns:
+        s = df[c]
+        if c in TEXT_COLUMNS:
+            df[c] = s.astype(str).where(s.notna(), None)
+        elif c in DATE_COLUMNS:
+            s = pd.to_datetime(s, utc=True) if s.dtype == object else s
+            df[c] = s.dt.tz_localize('UTC') if s.dt.tz is None else s.dt.tz_convert('UTC')
+        elif c == 'cancellation_flag' and pd.api.types.is_integer_dtype(s):
+            continue
+        else:
+            df[c] = pd.to_numeric(s, errors='coerce').astype('float64')
+    return df
 
 def read_input(path: str) -> pd.DataFrame:
     if path.lower().endswith('.xlsx') or path.lower().endswith('.xls'):
@@ -144,12 +263,186 @@ def read_input(path: str) -> pd.DataFrame:
         df = pd.read_csv(path)
     return df
 
-def run_preprocess(input_path: str, output_csv: str):
+def read_input_chunks(path: str, chunk_rows: int) -> Iterator[pd.DataFrame]:
+    """Yield the input `chunk_rows` rows at a time (first sheet for workbooks)."""
+    lower = path.lower()
+    if lower.endswith('.xlsx'):
+        wb = openpyxl.load_workbook(path, read_only=True, data_only=True)
+        try:
+            rows = wb.worksheets[0].iter_rows(values_only=True)
+            header = [str(c) if c is not None else f"Unnamed: {i}" for i, c in enumerate(next(rows, ()))]
+            while True:
+                block = list(itertools.islice(rows, chunk_rows))
+                if not block:
+                    break
+                yield pd.DataFrame.from_records(block, columns=header)
+        finally:
+            wb.close()
+    elif lower.endswith('.xls'):
+        logger.warning("Legacy .xls cannot be streamed; reading %s whole", path)
+        yield read_input(path)
+    else:
+        yield from pd.read_csv(path, chunksize=chunk_rows)
+
+# keeps the latest created_at per job_id; on a tie the later row wins, like keep='last'
+_LATEST_UPSERT = (
+    "INSERT INTO latest (job_id, created, seq) VALUES (?, ?, ?) "
+    "ON CONFLICT (job_id) DO UPDATE SET created = excluded.created, seq = excluded.seq "
+    "WHERE excluded.created >= latest.created"
+)
+
+def _created_ns(created: pd.Series) -> np.ndarray:
+    # NaT sorts first in the in-memory dedupe, so it loses to any parsed timestamp
+    ts = pd.to_datetime(created, utc=True)
+    return np.where(ts.isna(), np.iinfo(np.int64).min, ts.dt.tz_localize(None).to_numpy(dtype='datetime64[ns]').view(np.int64))
+
+def run_preprocess_chunked(input_path: str, output_csv: str, chunk_rows: int) -> str:
+    """Bounded-memory run_preprocess: peak memory follows chunk_rows, not file size.
+
+    Chunks are cleaned one at a time and spooled to disk while an on-disk SQLite
+    index keeps the latest-by-created_at row per job_id across chunks; a second pass
+    writes the surviving rows to the `output_csv` dataset one row group per chunk.
+    Rows come out in input order rather than sorted by created_at.
+    """
+    out_dir = os.path.dirname(os.path.abspath(output_csv))
+    with tempfile.TemporaryDirectory(prefix="preprocess-", dir=out_dir) as spool:
+        index = sqlite3.connect(os.path.join(spool, "latest.sqlite"))
+        try:
+            index.execute("PRAGMA journal_mode = OFF")
+            index.execute("PRAGMA synchronous = OFF")
+            index.execute("CREATE TABLE latest (job_id TEXT PRIMARY KEY, created INTEGER NOT NULL, seq INTEGER NOT NULL)")
+            parts, raw, seq = [], 0, 0
+            now = _utcnow()
+            for chunk in read_input_chunks(input_path, chunk_rows):
+                clean = clean_dataframe(chunk, row_offset=raw, now=now)
+                raw += len(chunk)
+                clean.index = pd.RangeIndex(seq, seq + len(clean))
+                index.executemany(_LATEST_UPSERT, zip(
+                    clean['job_id'].astype(str), _created_ns(clean['created_at']).tolist(), clean.index.tolist(),
+                ))
+                part = os.path.join(spool, f"{len(parts):06d}.pkl")
+                clean.to_pickle(part)
+                parts.append(part)
+                seq += len(clean)
+                logger.info(f"Cleaned {raw} raw rows ({seq} after in-chunk dedupe)")
+            index.execute("CREATE INDEX latest_seq ON latest (seq)")
+            with DatasetWriter(output_csv) as out:
+                for part in parts:
+                    clean = pd.read_pickle(part)
+                    os.remove(part)
+                    if clean.empty:
+                        continue
+                    keep = [r[0] for r in index.execute(
+                        "SELECT seq FROM latest WHERE seq BETWEEN ? AND ? ORDER BY seq",
+                        (int(clean.index[0]), int(clean.index[-1])),
+                    )]
+                    out.write(clean.loc[keep])
+        finally:
+            index.close()
+    logger.info(f"Raw rows: {raw}; clean rows: {out.rows}")
+    return out.path
+
+def preprocess_dataset(input_path: str, output_csv: str, chunk_rows: int = 0, force: bool = False) -> DatasetRef:
+    """Clean `input_path` into the `output_csv` dataset (Parquet unless ETL_FORMAT=csv).
+
+    The cleaned frame stays attached to the result for in-process consumers, except
+    when a positive `chunk_rows` streams the input (it never is all in memory then)
+    or the output came from the stage cache, which `force` bypasses.
+    """
+    cache = get_stage_cache()
+    outputs = dataset_files(output_csv)
+    if cache is not None:
+        # chunked runs keep input order rather than created_at order
+        key = cache.key("preprocess", code=[__file__, datasets.__file__, geo.__file__], inputs=[input_path],
+                        params={"chunked": bool(chunk_rows and chunk_rows > 0), "outputs": [os.path.splitext(p)[1] for p in outputs]})
+        if not force and cache.restore("preprocess", [key], outputs):
+            return DatasetRef(outputs[0])
+    ref = _preprocess_dataset(input_path, output_csv, chunk_rows)
+    if cache is not None:
+        cache.store("preprocess", key, outputs)
+    return ref
+
+def _preprocess_dataset(input_path: str, output_csv: str, chunk_rows: int) -> DatasetRef:
+    if chunk_rows and chunk_rows > 0:
+        logger.info(f"Streaming {input_path} in chunks of {chunk_rows} rows ...")
+        out = run_preprocess_chunked(input_path, output_csv, chunk_rows)
+        logger.info(f"Wrote cleaned data to {out}")
+        return DatasetRef(out)
     logger.info(f"Reading input {input_path} ...")
     df = read_input(input_path)
     logger.info(f"Raw rows: {len(df)}")
     clean = clean_dataframe(df)
+    del df
+    # same row labels as a read of the written file
+    clean.index = pd.RangeIndex(len(clean))
     logger.info(f"Clean rows: {len(clean)}")
-    clean.to_csv(output_csv, index=False)
-    logger.info(f"Wrote cleaned CSV to {output_csv}")
-    return output_csv
+    with DatasetWriter(output_csv) as out:
+        out.write(clean)
+    logger.info(f"Wrote cleaned data to {out.path}")
+    return DatasetRef(out.path, clean)
+
+def _created_since(df: pd.DataFrame, since: pd.Timestamp) -> pd.DataFrame:
+    """Raw rows created at or after `since`, when that can be told before cleaning.
+
+    Only when every row has a real job_id and some created_at values parse: a
+    synthesized id depends on the row's position in the whole input, and created_at
+    may still be derived from year/month.
+    """
+    df = normalize_columns(df)
+    if 'job_id' not in df.columns or df['job_id'].isna().any() or 'created_at' not in df.columns:
+        return df
+    created = parse_datetimes(df['created_at'])
+    if created.isna().all():
+        return df
+    # at, not just after: rows stamped exactly `since` may have missed the last run; the
+    # ones that did not are replaced by job_id downstream and not counted into zones again
+    keep = (created.isna() | (created >= since)).to_numpy()
+    df = df[keep].copy()
+    df['created_at'] = created[keep]
+    return df
+
+def preprocess_new_rows(input_path: str, output_csv: str, since: pd.Timestamp | None) -> pd.DataFrame:
+    """Clean the rows of `input_path` created at or after `since` and upsert them into `output_csv`.
+
+    Rows without a parseable created_at always count as new. Returns the cleaned new rows.
+    """
+    logger.info(f"Reading input {input_path} ...")
+    df = read_input(input_path)
+    raw = len(df)
+    if since is not None:
+        df = _created_since(df, since)
+    clean = clean_dataframe(df)
+    del df
+    if since is not None:
+        clean = clean[~(clean['created_at'] < since)].copy()
+    clean.index = pd.RangeIndex(len(clean))
+    logger.info(f"Raw rows: {raw}; new clean rows since {since}: {len(clean)}")
+    upsert_dataset(clean, output_csv, key='job_id', parse_dates=DATE_COLUMNS)
+    return clean
+
+def _is_created_at(column: str) -> bool:
+    return COLUMN_MAP.get(str(column).lower()) == 'created_at'
+
+def source_created_max(input_path: str, chunk_rows: int = 500_000) -> pd.Timestamp | None:
+    """Latest created_at the input itself holds, or None when none parses.
+
+    Values clean_dataframe synthesizes (from year/month, or the run's time) do not
+    count: they are no evidence of how far the export goes.
+    """
+    if input_path.lower().endswith(('.xlsx', '.xls')):
+        chunks = read_input_chunks(input_path, chunk_rows)
+    else:
+        chunks = pd.read_csv(input_path, chunksize=chunk_rows, usecols=_is_created_at)
+    latest = pd.NaT
+    for chunk in chunks:
+        columns = [c for c in chunk.columns if _is_created_at(c)]
+        if not columns:
+            continue
+        ts = parse_datetimes(chunk[columns[0]]).max()
+        if not pd.isna(ts) and (pd.isna(latest) or ts > latest):
+            latest = ts
+    return None if pd.isna(latest) else latest
+
+def run_preprocess(input_path: str, output_csv: str, chunk_rows: int = 0, force: bool = False):
+    """Clean `input_path` into the `output_csv` dataset; returns the path written."""
+    return preprocess_dataset(input_path, output_csv, chunk_rows, force=force).path
@@ -0,0 +1,240 @@
+"""
+rollups.py
+-- Hourly job rollups per zone and per store, maintained incrementally on ingest
+"""
+from __future__ import annotations
+
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Iterable, Optional
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import func, select, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from .. import models
+
+ZONE = "zone"
+STORE = "store"
+NO_ZONE = "NA"
+
+MEASURES = (
+    "jobs_count", "base_sum", "base_count", "final_sum", "final_count",
+    "incentive_sum", "incentive_count", "energy_kwh_sum",
+)
+
+# store totals prefer the GST-inclusive settlement figures when the export has them
+STORE_FINAL_COLUMNS = ("final_with_gst_minus_settlement", "final_with_gst", "final_payout")
+STORE_BASE_COLUMNS = ("base_payout", "base_pay")
+
+
+def _hour(ts: datetime) -> datetime:
+    if ts.tzinfo is not None:
+        ts = ts.astimezone(timezone.utc).replace(tzinfo=None)
+    return ts.replace(minute=0, second=0, microsecond=0)
+
+
+def _num(df: pd.DataFrame, name: str) -> pd.Series:
+    if name not in df.columns:
+        return pd.Series(np.nan, index=df.index)
+    return pd.to_numeric(df[name], errors="coerce").replace([np.inf, -np.inf], np.nan)
+
+
+def _first_present(df: pd.DataFrame, names: Iterable[str]) -> pd.Series:
+    for name in names:
+        if name in df.columns:
+            return _num(df, name)
+    return pd.Series(np.nan, index=df.index)
+
+
+def frame_facts(df: pd.DataFrame, jobs: pd.DataFrame) -> pd.DataFrame:
+    """One row per (job, dimension) with the measures each summary aggregates.
+
+    `df` is the cleaned/zoned ETL frame and `jobs` its mapping onto the jobs table
+    (etl.jobs_frame_to_records), which shares df's index. `row` is the job's position
+    in `jobs`, for cheap selection of the rows a batch actually inserted.
+    """
+    src = df.loc[jobs.index]
+    hour = pd.to_datetime(jobs["timestamp"]).dt.floor("h")
+    energy = jobs["energy_kwh"].astype(float)
+    row = np.arange(len(jobs))
+
+    zone_base = _num(src, "base_payout")
+    zone_final = _num(src, "final_payout")
+    zone = pd.DataFrame({
+        "row": row,
+        "dim": ZONE,
+        "key": jobs["zone"].fillna(NO_ZONE).astype(str),
+        "hour": hour,
+        "base": zone_base,
+        "final": zone_final,
+        "incentive": np.nan,
+        "energy_kwh": energy,
+    })
+    if "store" not in src.columns:
+        return zone
+
+    has_store = src["store"].notna()
+    store = pd.DataFrame({
+        "row": row,
+        "dim": STORE,
+        "key": src["store"].astype(str),
+        "hour": hour,
+        "base": _first_present(src, STORE_BASE_COLUMNS),
+        "final": _first_present(src, STORE_FINAL_COLUMNS),
+        "incentive": _num(src, "incentive_total"),
+        "energy_kwh": energy,
+    })[has_store]
+    return pd.concat([zone, store], ignore_index=True)
+
+
+def aggregate_facts(facts: pd.DataFrame) -> list[dict]:
+    """Collapse facts into rollup increments keyed by (dim, key, hour)."""
+    if facts.empty:
+        return []
+    agg = facts.groupby(["dim", "key", "hour"], sort=False).agg(
+        jobs_count=("energy_kwh", "size"),
+        base_sum=("base", "sum"),
+        base_count=("base", "count"),
+        final_sum=("final", "sum"),
+        final_count=("final", "count"),
+        incentive_sum=("incentive", "sum"),
+        incentive_count=("incentive", "count"),
+        energy_kwh_sum=("energy_kwh", "sum"),
+    ).reset_index()
+    return agg.to_dict("records")
+
+
+def move_increments(facts: pd.DataFrame, old_keys: pd.Series) -> list[dict]:
+    """Increments moving jobs' zone facts from the zone they were rolled up under to their current one.
+
+    `old_keys` maps a job's `row` (see frame_facts) to the zone key it was counted
+    under; the facts carry the current key. Buckets that both lose and gain jobs get
+    one net increment, as a single upsert may touch a row only once.
+    """
+    now = facts[(facts["dim"] == ZONE) & facts["row"].isin(old_keys.index)]
+    if now.empty:
+        return []
+    before = now.assign(key=old_keys.loc[now["row"]].to_numpy())
+    plus, minus = pd.DataFrame(aggregate_facts(now)), pd.DataFrame(aggregate_facts(before))
+    minus[list(MEASURES)] = -minus[list(MEASURES)]
+    net = pd.concat([plus, minus]).groupby(["dim", "key", "hour"], sort=False)[list(MEASURES)].sum().reset_index()
+    return net.to_dict("records")
+
+
+def drop_empty(db, dim: str) -> None:
+    """Remove buckets of `dim` that moves left without jobs."""
+    t = models.JobRollup.__table__
+    db.execute(t.delete().where(t.c.dim == dim, t.c.jobs_count <= 0))
+
+
+def job_increments(jobs: Iterable) -> list[dict]:
+    """Rollup increments for API-created jobs (JobCreate-like: zone, price, energy)."""
+    acc: dict[tuple, dict] = defaultdict(lambda: dict.fromkeys(MEASURES, 0))
+    for job in jobs:
+        row = acc[(ZONE, job.zone if job.zone is not None else NO_ZONE, _hour(job.timestamp))]
+        row["jobs_count"] += 1
+        if job.price_usd is not None:
+            row["final_sum"] += job.price_usd
+            row["final_count"] += 1
+        row["energy_kwh_sum"] += job.energy_kwh
+    return [{"dim": d, "key": k, "hour": h, **m} for (d, k, h), m in acc.items()]
+
+
+def _upsert_sql() -> str:
+    cols = ("dim", "key", "hour") + MEASURES
+    types = ["text", "text", "timestamp"] + ["bigint" if m.endswith("_count") else "float8" for m in MEASURES]
+    arrays = ", ".join(f"CAST(:{c} AS {t}[])" for c, t in zip(cols, types))
+    updates = ", ".join(f"{m} = job_rollups_hourly.{m} + EXCLUDED.{m}" for m in MEASURES)
+    return (
+        f"INSERT INTO job_rollups_hourly ({', '.join(cols)}) SELECT * FROM unnest({arrays}) "
+        f"ON CONFLICT (dim, key, hour) DO UPDATE SET {updates}"
+    )
+
+
+# one statement with array parameters, whatever the number of buckets
+UPSERT = text(_upsert_sql())
+
+
+def _params(rows: list[dict]) -> dict:
+    return {c: [r[c] for r in rows] for c in ("dim", "key", "hour") + MEASURES}
+
+
+def apply_increments(db, rows: list[dict]) -> None:
+    """Add increments within the caller's transaction (the one inserting the jobs)."""
+    if rows:
+        db.execute(UPSERT, _params(rows))
+
+
+async def aapply_increments(db, rows: list[dict]) -> None:
+    if rows:
+        await db.execute(UPSERT, _params(rows))
+
+
+def is_seeded(db) -> bool:
+    return db.scalar(select(models.JobRollupSeed.id).limit(1)) is not None
+
+
+# zone facts of jobs known only from the jobs table, counted like job_increments does
+_SEED_FROM_JOBS = text(
+    "INSERT INTO job_rollups_hourly (dim, key, hour, " + ", ".join(MEASURES) + ") "
+    f"SELECT '{ZONE}', COALESCE(zone, '{NO_ZONE}'), date_trunc('hour', timestamp), "
+    "count(*), 0, 0, COALESCE(sum(price_usd), 0), count(price_usd), 0, 0, sum(energy_kwh) "
+    "FROM jobs WHERE external_job_id NOT IN (SELECT unnest(CAST(:ids AS text[]))) "
+    "GROUP BY 2, 3 "
+    "ON CONFLICT (dim, key, hour) DO UPDATE SET "
+    + ", ".join(f"{m} = job_rollups_hourly.{m} + EXCLUDED.{m}" for m in MEASURES)
+)
+
+
+def seed(db, rows: list[dict], external_job_ids: list[str]) -> None:
+    """Rebuild all rollups within the caller's transaction and mark them seeded.
+
+    `rows` are the increments of every job in an ETL frame (store and payout columns
+    included) and `external_job_ids` those jobs; every other job in the table, such as
+    ones created through the API, is rolled up from its stored columns. Rollup writes
+    by other transactions wait until the caller commits.
+    """
+    t = models.JobRollup.__table__
+    db.execute(text("LOCK TABLE job_rollups_hourly IN EXCLUSIVE MODE"))
+    db.execute(t.delete())
+    apply_increments(db, rows)
+    db.execute(_SEED_FROM_JOBS, {"ids": external_job_ids})
+    mark = pg_insert(models.JobRollupSeed).values(id=1, seeded_at=datetime.now(tz=timezone.utc).replace(tzinfo=None))
+    # a concurrent first ingest may have seeded while this one waited for the lock
+    db.execute(mark.on_conflict_do_update(index_elements=["id"], set_={"seeded_at": mark.excluded.seeded_at}))
+
+
+def summarize(db, dim: str, key: str) -> Optional[dict]:
+    """Totals for one zone/store across all hours, or None until the rollups are seeded.
+
+    A key no job has been rolled up under gets zeros.
+    """
+    if not is_seeded(db):
+        return None
+    t = models.JobRollup
+    totals = db.execute(
+        select(*[func.coalesce(func.sum(getattr(t, m)), 0).label(m) for m in MEASURES])
+        .where(t.dim == dim, t.key == key)
+    ).mappings().one()
+    # SUM over bigint comes back as Decimal
+    row = {m: (int if m.endswith("_count") else float)(v) for m, v in totals.items()}
+    if row["incentive_count"]:
+        incentives = row["incentive_sum"]
+    else:
+        incentives = max(0.0, row["final_sum"] - row["base_sum"])
+    if row["final_count"]:
+        avg_final = row["final_sum"] / row["final_count"]
+    elif row["base_count"]:
+        avg_final = row["base_sum"] / row["base_count"]
+    else:
+        avg_final = 0.0
+    return {
+        "demand_jobs": row["jobs_count"],
+        "total_base_payout": round(row["base_sum"], 2),
+        "total_final_payout": round(row["final_sum"], 2),
+        "total_incentives": round(incentives, 2),
+        "avg_final_payout": round(avg_final, 2),
+        "total_energy_kwh": round(row["energy_kwh_sum"], 2),
+    }
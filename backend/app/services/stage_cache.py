@@ -0,0 +1,273 @@
+"""
+stage_cache.py
+-- Content-addressed cache of ETL stage outputs, keyed by code, inputs and parameters, LRU-bounded
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+from ..config import settings
+
+logger = logging.getLogger("stage_cache")
+
+_META = "meta.json"
+_DIGESTS = "digests.json"
+
+
+def _hash_file(path: str, block_size: int = 1 << 20) -> str:
+    h = hashlib.blake2b(digest_size=20)
+    with open(path, "rb") as f:
+        while True:
+            block = f.read(block_size)
+            if not block:
+                break
+            h.update(block)
+    return h.hexdigest()
+
+
+def _copy(src: str, dst: str) -> None:
+    # copy then rename, so readers of dst never see a partial file (and the cache
+    # keeps its own copy: joblib.dump and friends overwrite files in place)
+    os.makedirs(os.path.dirname(dst) or ".", exist_ok=True)
+    tmp = f"{dst}.{uuid.uuid4().hex[:8]}.tmp"
+    shutil.copyfile(src, tmp)
+    os.replace(tmp, dst)
+
+
+class StageCache:
+    """Stage outputs stored under `<root>/<key>/`, reused when a stage's key comes round again.
+
+    A key hashes the stage name, its parameters and the content of its code and input
+    files (file digests are remembered by path, size and mtime, so unchanged inputs
+    are not re-read). Entries are evicted least recently used first once they take
+    more than `max_bytes`. A stage may also register aliases: further keys under
+    which the same entry is found (see cluster_dataset).
+    """
+
+    def __init__(self, root: str, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._digests: Optional[Dict[str, List]] = None
+        self.hits = 0
+        self.misses = 0
+
+    # -- keys -------------------------------------------------------------
+
+    def _load_digests(self) -> Dict[str, List]:
+        if self._digests is None:
+            try:
+                with open(os.path.join(self.root, _DIGESTS)) as f:
+                    self._digests = json.load(f)
+            except (OSError, ValueError):
+                self._digests = {}
+        return self._digests
+
+    def digest(self, path: Optional[str]) -> str:
+        """Content digest of `path` ("absent" when there is no such file)."""
+        if path is None:
+            return "absent"
+        try:
+            st = os.stat(path)
+        except OSError:
+            return "absent"
+        real = os.path.realpath(path)
+        with self._lock:
+            known = self._load_digests().get(real)
+        if known and known[0] == st.st_size and known[1] == st.st_mtime_ns:
+            return known[2]
+        digest = _hash_file(path)
+        with self._lock:
+            self._load_digests()[real] = [st.st_size, st.st_mtime_ns, digest]
+            self._save_digests()
+        return digest
+
+    def _save_digests(self) -> None:
+        # caller holds the lock
+        try:
+            os.makedirs(self.root, exist_ok=True)
+            tmp = os.path.join(self.root, f"{_DIGESTS}.{uuid.uuid4().hex[:8]}.tmp")
+            with open(tmp, "w") as f:
+                json.dump(self._digests, f)
+            os.replace(tmp, os.path.join(self.root, _DIGESTS))
+        except OSError:
+            logger.debug("Could not persist input digests", exc_info=True)
+
+    def key(
+        self,
+        stage: str,
+        code: Iterable[str] = (),
+        inputs: Iterable[Optional[str]] = (),
+        params: Optional[Dict[str, Any]] = None,
+    ) -> str:
+        """Hash of the stage name, its code and input file contents, and its parameters."""
+        h = hashlib.blake2b(digest_size=20)
+        h.update(stage.encode())
+        for path in code:
+            h.update(b"code:" + self.digest(path).encode())
+        for path in inputs:
+            h.update(b"input:" + self.digest(path).encode())
+        h.update(json.dumps(params or {}, sort_keys=True, default=str).encode())
+        return h.hexdigest()
+
+    # -- entries ----------------------------------------------------------
+
+    def _entry(self, key: str) -> str:
+        return os.path.join(self.root, key)
+
+    def _alias(self, alias: str) -> str:
+        return os.path.join(self.root, "aliases", alias)
+
+    def _find(self, keys: Sequence[str]) -> Optional[str]:
+        for key in keys:
+            if os.path.exists(os.path.join(self._entry(key), _META)):
+                return key
+            try:
+                with open(self._alias(key)) as f:
+                    target = f.read().strip()
+            except OSError:
+                continue
+            if os.path.exists(os.path.join(self._entry(target), _META)):
+                return target
+        return None
+
+    def restore(self, stage: str, keys: Sequence[str], outputs: Sequence[str]) -> bool:
+        """Copy a cached entry for any of `keys` onto `outputs`; False on a miss."""
+        key = self._find(keys)
+        if key is None:
+            self.misses += 1
+            return False
+        entry = self._entry(key)
+        try:
+            with open(os.path.join(entry, _META)) as f:
+                meta = json.load(f)
+            if len(meta["outputs"]) != len(outputs):
+                raise ValueError("cached entry has different outputs")
+            for i, dst in enumerate(outputs):
+                _copy(os.path.join(entry, str(i)), dst)
+            os.utime(os.path.join(entry, _META))
+        except (OSError, ValueError, KeyError):
+            logger.warning("Unusable cache entry %s for %s; recomputing", key, stage, exc_info=True)
+            self.misses += 1
+            return False
+        self.hits += 1
+        logger.info("%s: reused cached outputs %s", stage, key[:12])
+        return True
+
+    def store(self, stage: str, key: str, outputs: Sequence[str], aliases: Iterable[str] = ()) -> None:
+        """Keep copies of `outputs` under `key` (replacing any entry), then evict down to max_bytes."""
+        if self.max_bytes <= 0:
+            return
+        entry = self._entry(key)
+        tmp = f"{entry}.{uuid.uuid4().hex[:8]}.tmp"
+        try:
+            os.makedirs(tmp)
+            size = 0
+            for i, src in enumerate(outputs):
+                shutil.copyfile(src, os.path.join(tmp, str(i)))
+                size += os.path.getsize(src)
+            with open(os.path.join(tmp, _META), "w") as f:
+                json.dump({"stage": stage, "outputs": [os.path.basename(p) for p in outputs], "bytes": size,
+                           "created_at": time.time()}, f)
+            if os.path.exists(entry):
+                shutil.rmtree(entry, ignore_errors=True)
+            os.replace(tmp, entry)
+            for alias in aliases:
+                os.makedirs(os.path.dirname(self._alias(alias)), exist_ok=True)
+                with open(self._alias(alias), "w") as f:
+                    f.write(key)
+        except OSError:
+            logger.warning("Could not cache %s outputs", stage, exc_info=True)
+            shutil.rmtree(tmp, ignore_errors=True)
+            return
+        self.evict()
+
+    def evict(self) -> None:
+        entries = []
+        try:
+            names = os.listdir(self.root)
+        except OSError:
+            return
+        for name in names:
+            meta = os.path.join(self.root, name, _META)
+            try:
+                with open(meta) as f:
+                    size = json.load(f)["bytes"]
+                entries.append((os.stat(meta).st_mtime, size, name))
+            except (OSError, ValueError, KeyError):
+                continue
+        total = sum(size for _, size, _ in entries)
+        evicted = 0
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(self._entry(name), ignore_errors=True)
+            total -= size
+            evicted += 1
+            logger.info("Evicted cached stage outputs %s (%d bytes)", name[:12], size)
+        if evicted:
+            self._prune_records()
+
+    def _prune_records(self) -> None:
+        """Drop aliases of evicted entries, and digests that can no longer match their file.
+
+        A digest is only reused while its file keeps the recorded size and mtime, so
+        records of files that are gone or rewritten since (e.g. the inputs of evicted
+        entries) are dead weight in digests.json.
+        """
+        aliases = os.path.dirname(self._alias("x"))
+        try:
+            names = os.listdir(aliases)
+        except OSError:
+            names = []
+        for name in names:
+            path = os.path.join(aliases, name)
+            try:
+                with open(path) as f:
+                    target = f.read().strip()
+                if not os.path.exists(os.path.join(self._entry(target), _META)):
+                    os.remove(path)
+            except OSError:
+                continue
+        with self._lock:
+            digests = self._load_digests()
+            stale = []
+            for real, (size, mtime_ns, _) in digests.items():
+                try:
+                    st = os.stat(real)
+                except OSError:
+                    stale.append(real)
+                    continue
+                if st.st_size != size or st.st_mtime_ns != mtime_ns:
+                    stale.append(real)
+            for real in stale:
+                del digests[real]
+            if stale:
+                self._save_digests()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"root": self.root, "max_bytes": self.max_bytes, "hits": self.hits, "misses": self.misses}
+
+
+_global_cache: Optional[StageCache] = None
+_global_lock = threading.Lock()
+
+
+def get_stage_cache() -> Optional[StageCache]:
+    """The process-wide cache, or None when ETL_CACHE is off."""
+    global _global_cache
+    if not settings.etl_cache:
+        return None
+    if _global_cache is None:
+        with _global_lock:
+            if _global_cache is None:
+                _global_cache = StageCache(settings.etl_cache_dir, settings.etl_cache_max_mb << 20)
+    return _global_cache
@@ -0,0 +1,294 @@
+"""
+synthetic.py
+-- Synthetic job exports and rider-week payout sheets, same columns as the real ones, at any size
+"""
+from __future__ import annotations
+
+import argparse
+import logging
+import math
+import os
+from dataclasses import dataclass
+from typing import Iterator, List, Sequence, Union
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+logger = logging.getLogger("synthetic")
+
+CITY_CENTERS = {
+    "BENGALURU": (12.9716, 77.5946),
+    "PUNE": (18.5204, 73.8567),
+    "MUMBAI": (19.0760, 72.8777),
+    "DELHI": (28.6139, 77.2090),
+    "HYDERABAD": (17.3850, 78.4867),
+    "CHENNAI": (13.0827, 80.2707),
+    "KOLKATA": (22.5726, 88.3639),
+    "AHMEDABAD": (23.0225, 72.5714),
+}
+
+# share of orders by hour of day (IST-shaped lunch and dinner peaks), normalised below
+_HOURLY = np.array([
+    0.4, 0.2, 0.1, 0.1, 0.1, 0.2, 0.5, 1.0, 1.6, 2.0, 2.4, 3.2,
+    4.6, 4.8, 3.4, 2.4, 2.2, 2.8, 3.8, 5.0, 5.4, 4.6, 3.0, 1.2,
+])
+_HOURLY = _HOURLY / _HOURLY.sum()
+_PEAK_HOURS = np.array([12, 13, 19, 20, 21])
+
+_CANCEL_REASONS = np.array(["customer_cancelled", "store_delay", "rider_unavailable", "address_not_found"])
+_CEE_CATEGORIES = np.array(["NEV", "LSV", "NEW JOINER", "EV"])
+_CEE_CATEGORY_P = np.array([0.53, 0.30, 0.12, 0.05])
+
+DEFAULT_CHUNK_ROWS = 500_000
+_BLOCK_ROWS = 100_000
+
+
+@dataclass
+class Layout:
+    """Cities, their stores (with coordinates and demand weights) and rider pools."""
+
+    cities: List[str]
+    store_names: np.ndarray
+    store_city: np.ndarray  # index into cities
+    store_lat: np.ndarray
+    store_lng: np.ndarray
+    store_p: np.ndarray  # share of orders per store
+    riders_per_store: int
+
+    @classmethod
+    def build(cls, cities: Union[int, Sequence[str]] = 3, stores_per_city: int = 20, riders_per_store: int = 40,
+              seed: int = 0) -> "Layout":
+        if isinstance(cities, int):
+            if not 1 <= cities <= len(CITY_CENTERS):
+                raise ValueError(f"cities must be between 1 and {len(CITY_CENTERS)}")
+            cities = list(CITY_CENTERS)[:cities]
+        cities = [c.upper() for c in cities]
+        unknown = [c for c in cities if c not in CITY_CENTERS]
+        if unknown:
+            raise ValueError(f"unknown cities {unknown}; known: {sorted(CITY_CENTERS)}")
+        rng = np.random.default_rng([seed, 0])
+        n = len(cities) * stores_per_city
+        city = np.repeat(np.arange(len(cities)), stores_per_city)
+        centers = np.array([CITY_CENTERS[c] for c in cities])
+        # stores spread ~8km around the centre; a few busy stores, a long tail of quiet ones
+        lat = centers[city, 0] + rng.normal(0, 0.07, n)
+        lng = centers[city, 1] + rng.normal(0, 0.07, n)
+        p = rng.pareto(1.5, n) + 1.0
+        names = np.array([f"BS{cities[c][:3]}-AREA{i % stores_per_city:03d}-S{i % 7 + 1}" for i, c in enumerate(city)])
+        return cls(cities, names, city, lat, lng, p / p.sum(), riders_per_store)
+
+    def rider_ids(self, store: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+        return store * self.riders_per_store + rng.integers(0, self.riders_per_store, len(store)) + 100_000
+
+
+def _offset(lat: np.ndarray, lng: np.ndarray, km: np.ndarray, bearing: np.ndarray):
+    dlat = km * np.cos(bearing) / 111.0
+    dlng = km * np.sin(bearing) / (111.0 * np.cos(np.radians(lat)))
+    return lat + dlat, lng + dlng
+
+
+def _unit_hash(ids: np.ndarray, salt: int) -> np.ndarray:
+    """A fixed pseudo-random number in [0, 1) per id (Fibonacci hashing)."""
+    h = (ids.astype(np.uint64) + np.uint64(salt)) * np.uint64(0x9E3779B97F4A7C15)
+    return (h >> np.uint64(11)).astype(np.float64) / 2.0**53
+
+
+def _fmt(ts: pd.Series) -> pd.Series:
+    # "YYYY-MM-DD HH:MM:SS" like the exports; several times faster than Series.dt.strftime
+    iso = np.datetime_as_string(ts.to_numpy().astype("datetime64[s]"))
+    return pd.Series(iso, index=ts.index).str.replace("T", " ", regex=False)
+
+
+def job_rows(layout: Layout, n: int, rng: np.random.Generator, row_offset: int = 0,
+             start: pd.Timestamp = pd.Timestamp("2025-09-01"), days: int = 28,
+             dup_frac: float = 0.02, cancel_frac: float = 0.03) -> pd.DataFrame:
+    """`n` rows of a job export, as the ops tool writes it (column names before normalize_columns).
+
+    A `dup_frac` share of rows repeat an earlier order id from the same batch with a later
+    created_at, like the re-exported (updated) orders preprocess has to dedupe.
+    """
+    store = rng.choice(len(layout.store_p), n, p=layout.store_p)
+    ids = np.arange(row_offset, row_offset + n)
+    dup = rng.random(n) < dup_frac
+    dup[:1] = False
+    # a repeat points at an earlier row; its created_at is pushed later below
+    earlier = (rng.random(n) * np.arange(n)).astype(np.int64)
+    ids[dup] = ids[earlier[dup]]
+    store[dup] = store[earlier[dup]]
+
+    day = rng.integers(0, days, n)
+    hour = rng.choice(24, n, p=_HOURLY)
+    secs = day * 86400 + hour * 3600 + rng.integers(0, 3600, n)
+    secs[dup] = secs[earlier[dup]] + rng.integers(60, 1800, int(dup.sum()))
+    created = pd.Series(start + pd.to_timedelta(secs, unit="s"))
+
+    pickup_lat, pickup_lng = _offset(layout.store_lat[store], layout.store_lng[store],
+                                     rng.exponential(0.15, n), rng.uniform(0, 2 * np.pi, n))
+    km = np.clip(rng.lognormal(math.log(2.5), 0.6, n), 0.2, 15.0)
+    drop_lat, drop_lng = _offset(pickup_lat, pickup_lng, km, rng.uniform(0, 2 * np.pi, n))
+
+    wait_s = rng.lognormal(math.log(480), 0.4, n)
+    ride_s = km / rng.uniform(14, 24, n) * 3600 + rng.normal(120, 60, n).clip(0)
+    scheduled = created + pd.to_timedelta(wait_s, unit="s")
+    completed = scheduled + pd.to_timedelta(ride_s, unit="s")
+
+    peak = np.isin(hour, _PEAK_HOURS)
+    base = (25 + 7.0 * km + rng.normal(0, 2, n)).clip(15)
+    surge = np.where(peak & (rng.random(n) < 0.5), 10.0, 0.0) + np.where(rng.random(n) < 0.05, 15.0, 0.0)
+    final = base + surge + rng.gamma(1.5, 2.0, n)
+
+    cancelled = rng.random(n) < cancel_frac
+    reason = pd.Series(_CANCEL_REASONS[rng.integers(0, len(_CANCEL_REASONS), n)]).where(cancelled)
+    delivered = _fmt(completed).where(~cancelled)
+
+    return pd.DataFrame({
+        "order_id": pd.Series(ids).map("SYN{:010d}".format),
+        "store": layout.store_names[store],
+        "pickup_lat": pickup_lat.round(6),
+        "pickup_long": pickup_lng.round(6),
+        "drop_lat": drop_lat.round(6),
+        "drop_long": drop_lng.round(6),
+        "created_at": _fmt(created),
+        "pickup_time": _fmt(scheduled),
+        "delivered_at": delivered,
+        "base_payout": base.round(2),
+        "surge": surge,
+        "final_payout": final.round(2),
+        "rider_id": layout.rider_ids(store, rng),
+        "cancellation_reason": reason,
+    })
+
+
+def rider_week_rows(layout: Layout, n: int, rng: np.random.Generator, row_offset: int = 0,
+                    start: pd.Timestamp = pd.Timestamp("2025-09-01"), weeks: int = 4) -> pd.DataFrame:
+    """`n` rows of a weekly rider payout sheet (one rider-week each; riders recur across `weeks`)."""
+    row = np.arange(row_offset, row_offset + n)
+    rider = row // weeks
+    week_start = start + pd.to_timedelta((row % weeks) * 7, unit="D")
+    # a rider keeps one store and one category across weeks
+    store = np.minimum(np.searchsorted(np.cumsum(layout.store_p), _unit_hash(rider, 1)), len(layout.store_p) - 1)
+    category = _CEE_CATEGORIES[np.minimum(np.searchsorted(np.cumsum(_CEE_CATEGORY_P), _unit_hash(rider, 2)), 3)]
+
+    active = rng.random(n) > 0.06
+    orders = np.where(active, rng.negative_binomial(1.6, 1.6 / (1.6 + 108), n), 0)
+    weekend = rng.binomial(orders, 0.27)
+    base_pay = orders * rng.normal(46, 6, n).clip(30)
+    incentive = base_pay * rng.uniform(0.2, 0.6, n)
+    surge = 5.0 * rng.binomial(orders, 0.18)
+    peak = np.where(rng.random(n) < 0.4, 5.0 * rng.binomial(orders, 0.35), 0.0)
+    mg = np.where(active & (orders < 40) & (rng.random(n) < 0.5), rng.uniform(200, 3500, n), 0.0)
+    deductions = np.where(rng.random(n) < 0.3, rng.uniform(20, 400, n), 0.0)
+    cash_adj = np.where(rng.random(n) < 0.35, rng.uniform(10, 500, n), 0.0)
+    fee = orders * rng.normal(2.2, 0.3, n).clip(1)
+    total = (base_pay + surge + peak + mg + cash_adj - deductions).clip(0)
+    final = (total + fee) * 1.18
+
+    return pd.DataFrame({
+        "year": week_start.year,
+        "month": week_start.month,
+        "week": (week_start.day - 1) // 7 + 1,
+        "city": np.array(layout.cities)[layout.store_city[store]],
+        "store": layout.store_names[store],
+        "cee_id": 700_000 + rider,
+        "cee_name": pd.Series(rider).map("RIDER{:07d}".format),
+        "cee_employment_category": "TPL CEE",
+        "cee_category": category,
+        "final_with_gst": final.round(2),
+        "total_with_arrears_and_deductions": total.round(2),
+        "total_orders": orders,
+        "weekday_orders": orders - weekend,
+        "weekend_orders": weekend,
+        "base_pay": base_pay.round(2),
+        "incentive_total": incentive.round(2),
+        "surge_payout": surge,
+        "peak_hour_payout": peak,
+        "minimum_guarantee": mg.round(2),
+        "management_fee": fee.round(2),
+        "deductions_amount": deductions.round(2),
+        "total_cash_adjustment": cash_adj.round(2),
+        "distance_km": (orders * rng.normal(2.2, 0.4, n).clip(0.5)).round(2),
+    })
+
+
+KINDS = {"jobs": job_rows, "rider-weeks": rider_week_rows}
+
+
+def generate(kind: str, rows: int, layout: Layout, seed: int = 0, chunk_rows: int = DEFAULT_CHUNK_ROWS,
+             **options) -> Iterator[pd.DataFrame]:
+    """Yield `rows` rows of `kind` in chunks of about `chunk_rows`; the rows do not depend on chunk_rows."""
+    if kind not in KINDS:
+        raise ValueError(f"kind must be one of {sorted(KINDS)}")
+    make = KINDS[kind]
+    pending: List[pd.DataFrame] = []
+    pending_rows = 0
+    # one random stream per block of _BLOCK_ROWS rows, so chunk_rows only regroups rows
+    for b, offset in enumerate(range(0, rows, _BLOCK_ROWS)):
+        n = min(_BLOCK_ROWS, rows - offset)
+        pending.append(make(layout, n, np.random.default_rng([seed, 1, b]), row_offset=offset, **options))
+        pending_rows += n
+        if pending_rows >= chunk_rows:
+            yield pd.concat(pending, ignore_index=True)
+            pending, pending_rows = [], 0
+    if pending:
+        yield pd.concat(pending, ignore_index=True)
+
+def write_synthetic(kind: str, rows: int, path: str, layout: Layout, seed: int = 0,
+                    chunk_rows: int = DEFAULT_CHUNK_ROWS, **options) -> str:
+    """Write `rows` rows of `kind` to `path` (.csv, .parquet or .xlsx), one chunk in memory at a time."""
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in (".csv", ".parquet", ".xlsx"):
+        raise ValueError("path must end in .csv, .parquet or .xlsx")
+    if ext == ".xlsx" and rows > 1_048_575:
+        raise ValueError("an .xlsx sheet holds at most 1,048,575 rows; write .csv or .parquet instead")
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    chunks = generate(kind, rows, layout, seed=seed, chunk_rows=chunk_rows, **options)
+    if ext == ".xlsx":
+        pd.concat(chunks, ignore_index=True).to_excel(path, index=False)
+    elif ext == ".csv":
+        with open(path, "w", newline="") as f:
+            for i, chunk in enumerate(chunks):
+                chunk.to_csv(f, index=False, header=i == 0)
+    else:
+        writer = None
+        try:
+            for chunk in chunks:
+                table = pa.Table.from_pandas(chunk, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(path, table.schema)
+                writer.write_table(table.cast(writer.schema))
+        finally:
+            if writer is not None:
+                writer.close()
+    logger.info("Wrote %d synthetic %s rows to %s", rows, kind, path)
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write a synthetic job export or rider-week payout sheet")
+    parser.add_argument("kind", choices=sorted(KINDS))
+    parser.add_argument("rows", type=int)
+    parser.add_argument("out", help="output .csv, .parquet or .xlsx")
+    parser.add_argument("--cities", default="3", help="how many cities, or a comma-separated list of names")
+    parser.add_argument("--stores-per-city", type=int, default=20)
+    parser.add_argument("--riders-per-store", type=int, default=40)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--start", default="2025-09-01", help="first day covered")
+    parser.add_argument("--days", type=int, default=28, help="days of orders (jobs)")
+    parser.add_argument("--weeks", type=int, default=4, help="weeks per rider (rider-weeks)")
+    parser.add_argument("--dup-frac", type=float, default=0.02, help="share of re-exported orders (jobs)")
+    args = parser.parse_args(argv)
+    cities = int(args.cities) if args.cities.isdigit() else args.cities.split(",")
+    layout = Layout.build(cities, args.stores_per_city, args.riders_per_store, seed=args.seed)
+    options = {"start": pd.Timestamp(args.start)}
+    if args.kind == "jobs":
+        options.update(days=args.days, dup_frac=args.dup_frac)
+    else:
+        options.update(weeks=args.weeks)
+    print(write_synthetic(args.kind, args.rows, args.out, layout, seed=args.seed, **options))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -0,0 +1,85 @@
+"""
+watermark.py
+-- How far the ETL has got: the latest created_at loaded and the input files already processed
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+import pandas as pd
+
+logger = logging.getLogger("watermark")
+
+
+def file_fingerprint(path: str, block_size: int = 1 << 20) -> str:
+    """Content hash of an input file (size-prefixed), independent of its name and mtime."""
+    h = hashlib.blake2b(digest_size=16)
+    h.update(str(os.path.getsize(path)).encode())
+    with open(path, "rb") as f:
+        while True:
+            block = f.read(block_size)
+            if not block:
+                break
+            h.update(block)
+    return h.hexdigest()
+
+
+@dataclass
+class Watermark:
+    """Rows created before `created_at` are already in every ETL output.
+
+    `files` maps the fingerprints of processed inputs to what came of them, so the
+    same export uploaded twice is skipped outright.
+    """
+
+    created_at: Optional[pd.Timestamp] = None
+    files: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+
+    @classmethod
+    def load(cls, path: str) -> "Watermark":
+        try:
+            with open(path) as f:
+                raw = json.load(f)
+        except FileNotFoundError:
+            return cls()
+        except (OSError, ValueError):
+            logger.warning("Unreadable ETL watermark %s; treating everything as new", path, exc_info=True)
+            return cls()
+        created = raw.get("created_at")
+        return cls(
+            created_at=pd.Timestamp(created).tz_convert("UTC") if created else None,
+            files=dict(raw.get("files") or {}),
+        )
+
+    def save(self, path: str) -> None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        data = {
+            "created_at": self.created_at.isoformat() if self.created_at is not None else None,
+            "files": self.files,
+        }
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(data, f, indent=2)
+        os.replace(tmp, path)
+
+    def seen(self, fingerprint: str) -> bool:
+        return fingerprint in self.files
+
+    def advance(self, created_at_max, fingerprint: str, name: str, **info: Any) -> None:
+        """Record a processed input and move the watermark up to its latest created_at."""
+        if created_at_max is not None and not pd.isna(created_at_max):
+            ts = pd.Timestamp(created_at_max)
+            ts = ts.tz_localize("UTC") if ts.tzinfo is None else ts.tz_convert("UTC")
+            if self.created_at is None or ts > self.created_at:
+                self.created_at = ts
+        self.files[fingerprint] = {
+            "name": name,
+            "processed_at": datetime.now(tz=timezone.utc).isoformat(),
+            **info,
+        }
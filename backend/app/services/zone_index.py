@@ -0,0 +1,198 @@
+"""
+zone_index.py
+-- Nearest-zone lookups for live jobs and estimates, over the current zone centroids
+"""
+from __future__ import annotations
+
+import logging
+import math
+import os
+import threading
+import time
+from typing import Iterable, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+from sklearn.neighbors import BallTree
+
+from ..config import settings
+from .datasets import read_dataset, resolve
+
+logger = logging.getLogger("zone_index")
+
+# below this many zones a plain loop beats BallTree.query's per-call overhead (~70us)
+_LINEAR_MAX = 64
+
+
+class ZoneIndex:
+    """Haversine BallTree over zone centroids.
+
+    The ETL labels jobs through it too (zones._label), so a job gets the same zone
+    whether it came in through the API or an ETL run.
+    """
+
+    def __init__(self, zones: pd.DataFrame, version=None):
+        zones = zones.dropna(subset=["zone_id", "centroid_lat", "centroid_lng"])
+        self.version = version
+        self.zone_ids = zones["zone_id"].astype("int64").to_numpy()
+        rad = np.radians(zones[["centroid_lat", "centroid_lng"]].to_numpy(dtype="float64"))
+        self._tree = BallTree(rad, metric="haversine") if len(rad) else None
+        self._lat = rad[:, 0].tolist()
+        self._lng = rad[:, 1].tolist()
+        self._cos_lat = np.cos(rad[:, 0]).tolist()
+        self._ids = self.zone_ids.tolist()
+
+    @classmethod
+    def load(cls, path) -> Optional["ZoneIndex"]:
+        src = resolve(path)
+        if src is None:
+            return None
+        return cls(read_dataset(src, columns=["zone_id", "centroid_lat", "centroid_lng"]), version=_version(src))
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def nearest(self, lat: float, lng: float) -> Optional[int]:
+        """Zone id nearest to one point; None without zones or for non-finite coordinates."""
+        if not self._ids or not (math.isfinite(lat) and math.isfinite(lng)):
+            return None
+        la, ln = math.radians(lat), math.radians(lng)
+        if len(self._ids) > _LINEAR_MAX:
+            return self._ids[int(self._tree.query([[la, ln]], k=1, return_distance=False)[0, 0])]
+        cos_la = math.cos(la)
+        best, best_h = 0, 2.0
+        for i, (zla, zln, zcos) in enumerate(zip(self._lat, self._lng, self._cos_lat)):
+            # haversine term; monotonic in great-circle distance
+            h = math.sin((zla - la) / 2) ** 2 + cos_la * zcos * math.sin((zln - ln) / 2) ** 2
+            if h < best_h:
+                best, best_h = i, h
+        return self._ids[best]
+
+    def nearest_many(self, lats: Sequence[float], lngs: Sequence[float]) -> pd.Series:
+        """Nearest zone ids for many points (nullable Int64; NA without zones or coordinates)."""
+        lat = np.asarray(lats, dtype="float64")
+        lng = np.asarray(lngs, dtype="float64")
+        ok = np.isfinite(lat) & np.isfinite(lng)
+        out = np.zeros(len(lat), dtype="int64")
+        if self._tree is not None and len(lat) <= 8 and len(self._ids) <= _LINEAR_MAX:
+            # a handful of points (a small micro-batch): the loop beats the tree's per-query overhead
+            for i in np.flatnonzero(ok):
+                out[i] = self.nearest(float(lat[i]), float(lng[i]))
+        elif self._tree is None:
+            ok[:] = False
+        elif ok.any():
+            idx = self._tree.query(np.radians(np.column_stack([lat[ok], lng[ok]])), k=1, return_distance=False)
+            out[ok] = self.zone_ids[idx[:, 0]]
+        return pd.Series(pd.arrays.IntegerArray(out, ~ok))
+
+
+def _version(src: str) -> tuple:
+    st = os.stat(src)
+    return (src, st.st_mtime_ns, st.st_size)
+
+
+class ZoneIndexHolder:
+    """The index for the zones file at `path`, rebuilt when a new version appears.
+
+    The file is stat'ed at most every `check_interval_s`, so lookups stay in memory;
+    a rebuild happens on the calling thread and is swapped in atomically.
+    """
+
+    def __init__(self, path, check_interval_s: float = 5.0):
+        self.path = path
+        self.check_interval_s = check_interval_s
+        self._index: Optional[ZoneIndex] = None
+        self._checked = float("-inf")
+        self._lock = threading.Lock()
+        self.builds = 0
+        self.build_s: Optional[float] = None
+
+    def get(self) -> Optional[ZoneIndex]:
+        now = time.monotonic()
+        if now - self._checked < self.check_interval_s:
+            return self._index
+        with self._lock:
+            if now - self._checked < self.check_interval_s:
+                return self._index
+            self._refresh()
+            self._checked = time.monotonic()
+        return self._index
+
+    def _refresh(self) -> None:
+        src = resolve(self.path)
+        if src is None:
+            self._index = None
+            return
+        try:
+            version = _version(src)
+            if self._index is not None and self._index.version == version:
+                return
+            t0 = time.perf_counter()
+            index = ZoneIndex.load(src)
+        except Exception:
+            logger.exception("Loading zones from %s failed; keeping the previous index", src)
+            return
+        self._index = index
+        self.builds += 1
+        self.build_s = round(time.perf_counter() - t0, 4)
+        logger.info("Zone index built from %s: %d zones in %.1fms", src, len(index), self.build_s * 1000)
+
+    def stats(self) -> dict:
+        index = self._index
+        return {
+            "path": str(self.path),
+            "zones": len(index) if index is not None else 0,
+            "version": list(index.version[1:]) if index is not None and index.version else None,
+            "builds": self.builds,
+            "build_s": self.build_s,
+        }
+
+
+_global_holder: Optional[ZoneIndexHolder] = None
+_global_lock = threading.Lock()
+
+
+def _holder() -> ZoneIndexHolder:
+    global _global_holder
+    if _global_holder is None:
+        with _global_lock:
+            if _global_holder is None:
+                _global_holder = ZoneIndexHolder(settings.zones_path, settings.zone_index_check_s)
+    return _global_holder
+
+
+def get_zone_index() -> Optional[ZoneIndex]:
+    """The index for the current zones file, or None before the first ETL run."""
+    return _holder().get()
+
+
+def zone_index_stats() -> dict:
+    return _holder().stats()
+
+
+def nearest_zone(lat: float, lng: float) -> Optional[int]:
+    index = get_zone_index()
+    return index.nearest(lat, lng) if index is not None else None
+
+
+def fill_zones(jobs: Iterable) -> List:
+    """JobCreate-likes with a missing `zone` set to the nearest zone to their pickup.
+
+    Jobs that already name a zone keep it; returns the (possibly copied) jobs.
+    """
+    jobs = list(jobs)
+    missing = [i for i, j in enumerate(jobs) if j.zone is None]
+    index = get_zone_index()
+    if not missing or index is None:
+        return jobs
+    if len(missing) == 1:
+        i = missing[0]
+        z = index.nearest(jobs[i].pickup_lat, jobs[i].pickup_lng)
+        if z is not None:
+            jobs[i] = jobs[i].model_copy(update={"zone": str(z)})
+        return jobs
+    zones = index.nearest_many([jobs[i].pickup_lat for i in missing], [jobs[i].pickup_lng for i in missing])
+    for i, z in zip(missing, zones.tolist()):
+        if z is not pd.NA:
+            jobs[i] = jobs[i].model_copy(update={"zone": str(z)})
+    return jobs
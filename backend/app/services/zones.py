@@ -4,42 +4,329 @@ zones.py
 """
 import pandas as pd
 import numpy as np
+from scipy.optimize import linear_sum_assignment
 from sklearn.cluster import KMeans
+from sklearn.metrics import pairwise_distances_argmin
 import logging
+import os
+from typing import Optional
+from ..config import settings
+from . import datasets
+from .datasets import (
+    DatasetRef, DatasetWriter, dataset_exists, dataset_files, iter_dataset, read_dataset, resolve, upsert_dataset,
+    write_dataset,
+)
+from .stage_cache import get_stage_cache
+from . import zone_index
+from .zone_index import ZoneIndex
 
 logger = logging.getLogger("zones")
 logging.basicConfig(level=logging.INFO)
 
-def cluster_jobs(clean_csv_path: str, k: int = 12, jobs_zoned_out: str = "/data/jobs_zoned.csv", zones_out: str = "/data/zones.csv"):
-    df = pd.read_csv(clean_csv_path)
-    # filter rows that have pickup coords
-    coords = df[['pickup_lat','pickup_lng']].dropna()
-    if coords.empty:
+INCREMENTAL = "incremental"
+FULL = "full"
+COORDS = ['pickup_lat','pickup_lng']
+DATE_COLUMNS = ['created_at','scheduled_at','completed_at']
+
+
+def _coords(df: pd.DataFrame) -> pd.DataFrame:
+    return df[COORDS].dropna()
+
+
+def load_zones(zones_path: str, jobs_zoned_path: Optional[str] = None) -> Optional[pd.DataFrame]:
+    """Previous run's zones (zone_id, centroids, jobs_count), or None if there are none.
+
+    Zones files from before jobs_count was recorded take their weights from the
+    previous zoned jobs, when those are still around.
+    """
+    if not dataset_exists(zones_path):
+        return None
+    zones = read_dataset(zones_path).dropna(subset=['zone_id','centroid_lat','centroid_lng'])
+    if zones.empty:
+        return None
+    zones = zones.astype({'zone_id': 'int64', 'centroid_lat': 'float64', 'centroid_lng': 'float64'})
+    if 'jobs_count' not in zones.columns:
+        counts = pd.Series(dtype='int64')
+        if jobs_zoned_path and dataset_exists(jobs_zoned_path):
+            counts = read_dataset(jobs_zoned_path, columns=['zone_id'])['zone_id'].dropna().astype('int64').value_counts()
+        zones['jobs_count'] = zones['zone_id'].map(counts).fillna(0)
+    zones['jobs_count'] = zones['jobs_count'].astype('int64')
+    return zones.sort_values('zone_id').reset_index(drop=True)
+
+
+def _hash_ids(job_ids: pd.Series) -> np.ndarray:
+    return pd.util.hash_pandas_object(job_ids.astype(str), index=False).to_numpy()
+
+
+def absorbed_ids(jobs_zoned_path: str, batch_rows: int) -> Optional[np.ndarray]:
+    """Sorted hashes of the job_ids already counted into the zones (the previous zoned jobs).
+
+    Hashes rather than the ids themselves keep this at 8 bytes a job. None when there
+    are no zoned jobs to go by.
+    """
+    if not dataset_exists(jobs_zoned_path):
+        return None
+    parts = [_hash_ids(b['job_id']) for b in iter_dataset(jobs_zoned_path, batch_rows, columns=['job_id'])
+             if 'job_id' in b.columns]
+    return np.unique(np.concatenate(parts)) if parts else np.empty(0, dtype='uint64')
+
+
+def is_absorbed(job_ids: pd.Series, absorbed: np.ndarray) -> np.ndarray:
+    h = _hash_ids(job_ids)
+    pos = np.searchsorted(absorbed, h).clip(max=max(len(absorbed) - 1, 0))
+    return (absorbed[pos] == h) if len(absorbed) else np.zeros(len(h), dtype=bool)
+
+
+def stable_ids(centroids: np.ndarray, previous: Optional[pd.DataFrame]) -> np.ndarray:
+    """Zone ids for freshly fitted centroids, reusing the id of the nearest previous zone.
+
+    Centroids are paired with previous zones by minimum total distance (Hungarian
+    matching); any left over get ids above the previous maximum.
+    """
+    ids = np.arange(len(centroids))
+    if previous is None or previous.empty:
+        return ids
+    old = previous[['centroid_lat','centroid_lng']].to_numpy()
+    cost = np.linalg.norm(centroids[:, None, :] - old[None, :, :], axis=2)
+    rows, cols = linear_sum_assignment(cost)
+    ids = np.full(len(centroids), -1)
+    ids[rows] = previous['zone_id'].to_numpy()[cols]
+    fresh = ids < 0
+    ids[fresh] = previous['zone_id'].max() + 1 + np.arange(fresh.sum())
+    return ids
+
+
+class StreamingKMeans:
+    """Mini-batch k-means over pickups, one batch at a time.
+
+    Each batch is assigned to its nearest centroids, and every centroid moves to the
+    running mean of all points it has absorbed so far (its learning rate is
+    1 / jobs_count). Warm-started from earlier zones with their counts as weights,
+    the zones drift towards new demand without being relabeled.
+    """
+
+    def __init__(self, centroids: np.ndarray, counts: np.ndarray):
+        self.centroids = np.asarray(centroids, dtype='float64').copy()
+        self.counts = np.asarray(counts, dtype='int64').copy()
+
+    def partial_fit(self, X: np.ndarray) -> "StreamingKMeans":
+        if not len(X):
+            return self
+        labels = pairwise_distances_argmin(X, self.centroids)
+        k = len(self.centroids)
+        m = np.bincount(labels, minlength=k)
+        sums = np.stack([np.bincount(labels, weights=X[:, j], minlength=k) for j in range(X.shape[1])], axis=1)
+        hit = m > 0
+        n = self.counts[hit][:, None]
+        self.centroids[hit] = (self.centroids[hit] * n + sums[hit]) / (n + m[hit][:, None])
+        self.counts += m
+        return self
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        return pairwise_distances_argmin(X, self.centroids)
+
+
+def _fit_full(clean: DatasetRef, k: int, previous: Optional[pd.DataFrame]):
+    X = _coords(clean.read(columns=COORDS)).to_numpy()
+    if not len(X):
+        return None
+    km = KMeans(n_clusters=min(k, len(X)), random_state=42, n_init='auto').fit(X)
+    counts = np.bincount(km.labels_, minlength=km.n_clusters)
+    return km.cluster_centers_, counts, stable_ids(km.cluster_centers_, previous)
+
+
+def _fit_incremental(
+    clean: DatasetRef, k: int, previous: Optional[pd.DataFrame], batch_rows: int, absorbed: Optional[np.ndarray],
+):
+    """Update the previous zones with the jobs they have not absorbed yet.
+
+    `clean` is usually the whole history (a full ETL run reprocesses the input), so
+    jobs whose id is in `absorbed` (see absorbed_ids) are skipped rather than counted
+    and fitted again. Zones without zoned jobs to tell what they absorbed are
+    re-clustered from the whole history instead (ids kept by stable_ids).
+    """
+    model, ids = None, None
+    if previous is not None:
+        if absorbed is None:
+            logger.info("No zoned jobs next to the zones; re-clustering instead of updating them")
+            return _fit_full(clean, k, previous)
+        model = StreamingKMeans(previous[['centroid_lat','centroid_lng']].to_numpy(), previous['jobs_count'].to_numpy())
+        ids = previous['zone_id'].to_numpy()
+        if k != len(ids):
+            logger.info("Keeping the %d existing zones (k=%d applies to a full re-cluster)", len(ids), k)
+    fed = 0
+    for batch in clean.iter(batch_rows, columns=COORDS + ['job_id']):
+        if absorbed is not None and len(absorbed) and 'job_id' in batch.columns:
+            batch = batch[~is_absorbed(batch['job_id'], absorbed)]
+        X = _coords(batch).to_numpy()
+        fed += len(X)
+        if model is None:
+            if not len(X):
+                continue
+            # cold start: seed with a full KMeans on the first batch, stream the rest
+            km = KMeans(n_clusters=min(k, len(X)), random_state=42, n_init='auto').fit(X)
+            model = StreamingKMeans(km.cluster_centers_, np.bincount(km.labels_, minlength=km.n_clusters))
+            ids = np.arange(km.n_clusters)
+            continue
+        model.partial_fit(X)
+    if model is None:
+        return None
+    logger.info("Fitted zones on %d jobs they had not absorbed yet", fed)
+    return model.centroids, model.counts, ids
+
+
+def cluster_jobs(
+    clean_csv_path: str,
+    k: int = 12,
+    jobs_zoned_out: str = "/data/jobs_zoned.parquet",
+    zones_out: str = "/data/zones.parquet",
+    mode: Optional[str] = None,
+    batch_rows: Optional[int] = None,
+    force: bool = False,
+):
+    """Cluster pickups into zones; returns the (zones, jobs_zoned) dataset paths written.
+
+    `mode` (default ZONES_MODE) is "incremental": update the zones in `zones_out`
+    with these jobs, streaming `batch_rows` rows at a time, so zone ids never change
+    (the first run clusters into `k` zones). "full" re-clusters all pickups into `k`
+    zones from scratch, carrying ids over to the nearest previous zones.
+
+    zone_id is a nullable integer column: jobs without pickup coordinates have no zone.
+    """
+    zones, jobs_zoned = cluster_dataset(
+        DatasetRef(clean_csv_path), k=k, jobs_zoned_out=jobs_zoned_out, zones_out=zones_out,
+        mode=mode, batch_rows=batch_rows, force=force,
+    )
+    return zones, jobs_zoned.path
+
+
+def _zone_index(centroids: Optional[np.ndarray], ids: Optional[np.ndarray]) -> Optional[ZoneIndex]:
+    if centroids is None:
+        return None
+    return ZoneIndex(pd.DataFrame({'zone_id': ids, 'centroid_lat': centroids[:, 0], 'centroid_lng': centroids[:, 1]}))
+
+
+def _label(batch: pd.DataFrame, index: Optional[ZoneIndex]) -> pd.DataFrame:
+    """Set batch's zone_id to its nearest zone (NA without coordinates, or with no zones).
+
+    Nearest by great-circle distance through the ZoneIndex that live jobs and
+    estimates use, so a job gets the same zone whichever way it comes in.
+    """
+    if index is None:
+        batch['zone_id'] = pd.array([pd.NA] * len(batch), dtype='Int64')
+    else:
+        batch['zone_id'] = index.nearest_many(batch['pickup_lat'], batch['pickup_lng']).array
+    return batch
+
+
+def cluster_dataset(
+    clean: DatasetRef,
+    k: int = 12,
+    jobs_zoned_out: str = "/data/jobs_zoned.parquet",
+    zones_out: str = "/data/zones.parquet",
+    mode: Optional[str] = None,
+    batch_rows: Optional[int] = None,
+    force: bool = False,
+):
+    """cluster_jobs over a DatasetRef; returns the zones path and a DatasetRef to the zoned jobs.
+
+    An in-memory `clean` frame is labeled in place and handed on as the zoned frame;
+    otherwise the jobs are labeled batch by batch from disk and the result has no frame.
+
+    Outputs are reused from the stage cache (unless `force`) for the same cleaned jobs,
+    parameters and previous zones. Since the previous zones are an input, a rerun on
+    the same jobs would otherwise update the zones it produced itself; that is
+    recognised too, and it gets the zones and labels of the first run back.
+    """
+    mode = mode or settings.zones_mode
+    batch_rows = batch_rows or settings.zones_batch_rows
+    cache = get_stage_cache()
+    if cache is not None:
+        zoned_files, zones_files = dataset_files(jobs_zoned_out), dataset_files(zones_out)
+        # labels come from ZoneIndex
+        code = [__file__, datasets.__file__, zone_index.__file__]
+        clean_file = resolve(clean.path)
+        params = {"k": k, "mode": mode, "batch_rows": batch_rows, "outputs": [os.path.splitext(p)[1] for p in zoned_files]}
+
+        def rerun_key(zones_file):
+            return cache.key("zones", code=code, inputs=[clean_file], params={**params, "rerun_of": cache.digest(zones_file)})
+
+        previous_file = resolve(zones_out)
+        key = cache.key("zones", code=code, inputs=[clean_file, previous_file], params=params)
+        if not force and cache.restore("zones", [key, rerun_key(previous_file)], zoned_files + zones_files):
+            return zones_files[0], DatasetRef(zoned_files[0])
+    zones_path, jobs_zoned = _cluster_dataset(clean, k, jobs_zoned_out, zones_out, mode, batch_rows)
+    if cache is not None:
+        cache.store("zones", key, zoned_files + zones_files, aliases=[rerun_key(zones_path)])
+    return zones_path, jobs_zoned
+
+
+def _cluster_dataset(clean: DatasetRef, k: int, jobs_zoned_out: str, zones_out: str, mode: str, batch_rows: int):
+    previous = load_zones(zones_out, jobs_zoned_out)
+    if mode == FULL:
+        fit = _fit_full(clean, k, previous)
+    elif mode == INCREMENTAL:
+        absorbed = absorbed_ids(jobs_zoned_out, batch_rows) if previous is not None else None
+        fit = _fit_incremental(clean, k, previous, batch_rows, absorbed)
+    else:
+        raise ValueError(f"unknown zones mode {mode!r}")
+    centroids, ids = None, None
+    if fit is None:
         logger.warning("No pickup coordinates found for clustering.")
-        df['zone_id'] = np.nan
-        df.to_csv(jobs_zoned_out, index=False)
-        pd.DataFrame([], columns=['zone_id','centroid_lat','centroid_lng']).to_csv(zones_out, index=False)
-        return zones_out, jobs_zoned_out
-    X = coords.values
-    k = min(k, len(X))
-    km = KMeans(n_clusters=k, random_state=42, n_init='auto')
-    labels = km.fit_predict(X)
-    zone_series = pd.Series(index=coords.index, data=labels)
-    df['zone_id'] = np.nan
-    df.loc[coords.index, 'zone_id'] = zone_series.values
-    centroids = km.cluster_centers_
-    centroid_df = pd.DataFrame(centroids, columns=['centroid_lat','centroid_lng'])
-    centroid_df['zone_id'] = centroid_df.index
-    centroid_df.to_csv(zones_out, index=False)
-    df.to_csv(jobs_zoned_out, index=False)
-    logger.info("Created %d zones, wrote %s and %s", k, zones_out, jobs_zoned_out)
-    return zones_out, jobs_zoned_out
+        centroid_df = pd.DataFrame({
+            'zone_id': pd.array([], dtype='int64'), 'centroid_lat': pd.array([], dtype='float64'), 'centroid_lng': pd.array([], dtype='float64'),
+        })
+    else:
+        centroids, counts, ids = fit
+        centroid_df = pd.DataFrame(centroids, columns=['centroid_lat','centroid_lng'])
+        centroid_df['zone_id'] = ids
+        centroid_df['jobs_count'] = counts
+
+    # second pass: label every job with its nearest zone
+    index = _zone_index(centroids, ids)
+    with DatasetWriter(jobs_zoned_out) as out:
+        if clean.frame is not None:
+            frame = _label(clean.frame, index)
+            out.write(frame)
+        else:
+            frame = None
+            for batch in clean.iter(batch_rows, parse_dates=DATE_COLUMNS):
+                out.write(_label(batch, index))
+    zones_out = write_dataset(centroid_df, zones_out)
+    logger.info("%s clustering: %d zones, wrote %s and %s", mode, len(centroid_df), zones_out, out.path)
+    return zones_out, DatasetRef(out.path, frame)
+
+def zone_new_jobs(
+    new: pd.DataFrame,
+    jobs_zoned_out: str = "/data/jobs_zoned.parquet",
+    zones_out: str = "/data/zones.parquet",
+):
+    """Label `new` jobs with the existing zones and add them to the zoned jobs.
+
+    Centroids stay where they are (so earlier labels stay right); only the zones'
+    jobs_count grows, by the jobs not zoned before (a re-sent job replaces its old
+    row without being counted twice). `new` gains zone_id in place. Returns the
+    (zones, jobs_zoned) paths, or None when there are no zones or zoned jobs to extend yet.
+    """
+    previous = load_zones(zones_out, jobs_zoned_out)
+    if previous is None or not dataset_exists(jobs_zoned_out):
+        return None
+    _label(new, ZoneIndex(previous))
+    fresh = new['zone_id']
+    if 'job_id' in new.columns:
+        fresh = fresh[~is_absorbed(new['job_id'], absorbed_ids(jobs_zoned_out, settings.zones_batch_rows))]
+    added = fresh.value_counts()
+    previous['jobs_count'] += previous['zone_id'].map(added).fillna(0).astype('int64')
+    jobs_zoned = upsert_dataset(new, jobs_zoned_out, key='job_id', parse_dates=DATE_COLUMNS)
+    zones = write_dataset(previous, zones_out)
+    logger.info("Assigned %d jobs (%d not zoned before) to %d existing zones", len(new), len(fresh), len(previous))
+    return zones, jobs_zoned
+
 
 def assign_zone_to_jobs(df: pd.DataFrame, centroid_df: pd.DataFrame):
-    # simple nearest-centroid assignment (if needed)
-    from sklearn.metrics import pairwise_distances_argmin_min
-    centroids = centroid_df[['centroid_lat','centroid_lng']].values
-    coords = df[['pickup_lat','pickup_lng']].fillna(0).values
-    idx, dist = pairwise_distances_argmin_min(coords, centroids)
-    df['zone_id'] = idx
+    # nearest-centroid assignment by great-circle distance; pickups without coordinates get no zone
+    if 'zone_id' not in centroid_df.columns:
+        centroid_df = centroid_df.assign(zone_id=np.arange(len(centroid_df)))
+    index = ZoneIndex(centroid_df)
+    df['zone_id'] = index.nearest_many(df['pickup_lat'], df['pickup_lng']).set_axis(df.index)
     return df
@@ -1,3 +1,6 @@
+import base64
+import json
+from datetime import datetime
 from fastapi import HTTPException
 
 
@@ -7,3 +10,15 @@ def ensure_not_none(value, message: str):
     return value
 
 
+def encode_cursor(timestamp: datetime, id_: int) -> str:
+    raw = json.dumps([timestamp.isoformat(), id_], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        ts, id_ = json.loads(raw)
+        return datetime.fromisoformat(ts), int(id_)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
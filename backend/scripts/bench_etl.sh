@@ -0,0 +1,7 @@
+#!/usr/bin/env bash
+# bench_etl.sh [sizes] [results.json] [extra args, e.g. --baseline old.json --stages preprocess,zones]
+# Runs each ETL stage on synthetic exports of each size and writes wall time / peak RSS as JSON.
+set -euo pipefail
+SIZES=${1:-10k,100k,1M}
+OUT=${2:-etl_bench.json}
+python -m app.services.etl_bench --sizes "$SIZES" --out "$OUT" "${@:3}"
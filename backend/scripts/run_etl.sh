@@ -1,12 +1,11 @@
 #!/usr/bin/env bash
-# run_etl.sh <input_xlsx_or_csv> [k_clusters]
+# run_etl.sh <input_xlsx_or_csv> [k_clusters] [--full]
+# Only rows newer than the last run are processed unless --full is given.
+# Prints a per-stage wall time / memory table, then the run summary as JSON.
 INPUT=$1
 K=${2:-12}
 if [ -z "$INPUT" ]; then
-  echo "Usage: run_etl.sh <input.xlsx|csv> [k_clusters]"
+  echo "Usage: run_etl.sh <input.xlsx|csv> [k_clusters] [--full]"
   exit 1
 fi
-python - <<PY
-from app.services.etl import run_full_etl
-print(run_full_etl("$INPUT", cleaned_csv_out="/data/jobs_clean.csv", k_clusters=int($K), train_model=True))
-PY
+python -m app.services.etl "$INPUT" "$K" --out /data/jobs_clean.parquet "${@:3}"
@@ -0,0 +1,66 @@
+import os
+import uuid
+
+import pytest
+
+# keep test runs out of the shared stage cache (and /data)
+os.environ.setdefault("ETL_CACHE", "false")
+
+
+@pytest.fixture(scope="session")
+def pg_engine():
+    """An engine on a throwaway schema of TEST_DATABASE_URL with the app's tables; skips without one."""
+    url = os.environ.get("TEST_DATABASE_URL")
+    if not url:
+        pytest.skip("TEST_DATABASE_URL is not set")
+    from sqlalchemy import create_engine, exc, text
+
+    from app import models  # noqa: F401  (register tables on Base.metadata)
+    from app.db import Base
+
+    schema = f"test_{uuid.uuid4().hex[:8]}"
+    admin = create_engine(url)
+    try:
+        with admin.begin() as conn:
+            conn.execute(text(f'CREATE SCHEMA "{schema}"'))
+    except exc.OperationalError as e:
+        admin.dispose()
+        pytest.skip(f"Postgres at TEST_DATABASE_URL is unavailable: {e}")
+    engine = create_engine(url, connect_args={"options": f"-csearch_path={schema}"})
+    Base.metadata.create_all(engine)
+    try:
+        yield engine
+    finally:
+        engine.dispose()
+        with admin.begin() as conn:
+            conn.execute(text(f'DROP SCHEMA "{schema}" CASCADE'))
+        admin.dispose()
+
+
+@pytest.fixture
+def pg_session_factory(pg_engine):
+    """sessionmaker on pg_engine; tables are emptied after each test."""
+    from sqlalchemy import text
+    from sqlalchemy.orm import sessionmaker
+
+    from app.db import Base
+
+    yield sessionmaker(bind=pg_engine)
+    with pg_engine.begin() as conn:
+        conn.execute(text("TRUNCATE " + ", ".join(t.name for t in Base.metadata.sorted_tables)))
+
+
+@pytest.fixture
+def pg_async_session_factory(pg_engine, pg_session_factory):
+    """async_sessionmaker on pg_engine's schema (unpooled: every TestClient runs its own event loop)."""
+    from sqlalchemy import text
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+    from sqlalchemy.pool import NullPool
+
+    with pg_engine.connect() as conn:
+        schema = conn.execute(text("SHOW search_path")).scalar_one()
+    engine = create_async_engine(
+        os.environ["TEST_DATABASE_URL"], poolclass=NullPool, connect_args={"options": f"-csearch_path={schema}"}
+    )
+    yield async_sessionmaker(bind=engine, expire_on_commit=False)
+    engine.sync_engine.dispose()
@@ -0,0 +1,137 @@
+import asyncio
+import base64
+
+import httpx
+import pytest
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
+from cryptography.hazmat.primitives.serialization import Encoding, PublicFormat
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+
+from app.beckn import auth
+from app.config import settings
+
+SUBSCRIBER, UK_ID = "bap.example", "k1"
+SEED = bytes(range(32))
+
+
+def _public_b64(seed: bytes = SEED) -> str:
+    key = Ed25519PrivateKey.from_private_bytes(seed).public_key()
+    return base64.b64encode(key.public_bytes(Encoding.Raw, PublicFormat.Raw)).decode()
+
+
+class StubRegistry:
+    """Answers /lookup with `records` (or whatever `response` returns), counting calls."""
+
+    def __init__(self, records=None, response=None, delay_s: float = 0.0):
+        self.records = records if records is not None else [
+            {"subscriber_id": SUBSCRIBER, "ukId": UK_ID, "signing_public_key": _public_b64()},
+        ]
+        self.response = response
+        self.delay_s = delay_s
+        self.calls = 0
+
+    async def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.calls += 1
+        if self.delay_s:
+            await asyncio.sleep(self.delay_s)
+        if self.response is not None:
+            return self.response(request)
+        return httpx.Response(200, json={"message": {"subscribers": self.records}})
+
+    def verifier(self) -> auth.Verifier:
+        client = httpx.AsyncClient(transport=httpx.MockTransport(self))
+        return auth.Verifier(auth.PublicKeyCache("http://registry.test", client=client))
+
+
+def _signed(body: bytes):
+    signer = auth.Signer(SUBSCRIBER, UK_ID, base64.b64encode(SEED).decode())
+    return signer.sign(body)["Authorization"]
+
+
+def test_sign_verify_round_trip():
+    body = b'{"context": {"action": "search"}}'
+    sender = asyncio.run(StubRegistry().verifier().verify(_signed(body), body))
+    assert (sender.subscriber_id, sender.unique_key_id) == (SUBSCRIBER, UK_ID)
+    assert sender.digest == auth.body_digest(body)
+
+
+def test_tampered_body_is_rejected():
+    header = _signed(b'{"amount": 10}')
+    with pytest.raises(PermissionError, match="signature mismatch"):
+        asyncio.run(StubRegistry().verifier().verify(header, b'{"amount": 1000}'))
+
+
+def test_key_of_another_subscriber_is_rejected():
+    registry = StubRegistry(records=[
+        {"subscriber_id": SUBSCRIBER, "ukId": UK_ID, "signing_public_key": _public_b64(bytes(32))},
+    ])
+    body = b"{}"
+    with pytest.raises(PermissionError, match="signature mismatch"):
+        asyncio.run(registry.verifier().verify(_signed(body), body))
+
+
+def test_concurrent_lookups_share_one_fetch():
+    registry = StubRegistry(delay_s=0.05)
+    cache = registry.verifier().keys
+
+    async def lookups():
+        return await asyncio.gather(*(cache.get(SUBSCRIBER, UK_ID) for _ in range(20)))
+
+    keys = asyncio.run(lookups())
+    assert registry.calls == 1
+    assert cache.misses == 1
+    assert all(k is keys[0] for k in keys) and keys[0] is not None
+
+
+@pytest.mark.parametrize("response", [
+    lambda r: httpx.Response(200, content=b"not json"),
+    lambda r: httpx.Response(200, json=None),
+    lambda r: httpx.Response(200, json={"message": ["unexpected"]}),
+    lambda r: httpx.Response(200, json=[{"subscriber_id": SUBSCRIBER, "ukId": UK_ID, "signing_public_key": "%%%"}]),
+    lambda r: httpx.Response(200, json=[{"subscriber_id": SUBSCRIBER, "ukId": UK_ID, "signing_public_key": "AAAA"}]),
+    lambda r: httpx.Response(404, json={"error": "no such subscriber"}),
+], ids=["not-json", "null", "wrong-shape", "bad-base64", "short-key", "http-404"])
+def test_unusable_registry_answers_are_auth_errors(response):
+    body = b"{}"
+    with pytest.raises(PermissionError):
+        asyncio.run(StubRegistry(response=response).verifier().verify(_signed(body), body))
+
+
+@pytest.fixture
+def app(monkeypatch):
+    monkeypatch.setattr(settings, "beckn_verify_requests", True)
+    app = FastAPI()
+
+    @app.post("/bpp/search")
+    def search(sender=Depends(auth.verify_beckn_request)):
+        return {"subscriber_id": sender.subscriber_id}
+
+    return app
+
+
+def _client(app, monkeypatch, registry: StubRegistry) -> TestClient:
+    monkeypatch.setattr(auth, "_verifier", registry.verifier())
+    return TestClient(app)
+
+
+def test_dependency_accepts_signed_request(app, monkeypatch):
+    body = b'{"context": {}}'
+    resp = _client(app, monkeypatch, StubRegistry()).post("/bpp/search", content=body, headers={"Authorization": _signed(body)})
+    assert resp.status_code == 200
+    assert resp.json() == {"subscriber_id": SUBSCRIBER}
+
+
+def test_dependency_maps_malformed_registry_record_to_401(app, monkeypatch):
+    registry = StubRegistry(records=[{"subscriber_id": SUBSCRIBER, "ukId": UK_ID, "signing_public_key": "not base64!"}])
+    body = b"{}"
+    resp = _client(app, monkeypatch, registry).post("/bpp/search", content=body, headers={"Authorization": _signed(body)})
+    assert resp.status_code == 401
+    assert "WWW-Authenticate" in resp.headers
+
+
+def test_dependency_maps_registry_outage_to_503(app, monkeypatch):
+    registry = StubRegistry(response=lambda r: httpx.Response(502))
+    body = b"{}"
+    resp = _client(app, monkeypatch, registry).post("/bpp/search", content=body, headers={"Authorization": _signed(body)})
+    assert resp.status_code == 503
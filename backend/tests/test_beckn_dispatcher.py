@@ -0,0 +1,114 @@
+import asyncio
+import json
+
+import httpx
+
+from app.beckn.dispatcher import CallbackDispatcher
+
+
+class StandInBap:
+    """Records callbacks and answers them with `statuses` in turn (200 once they run out)."""
+
+    def __init__(self, statuses=(), delay_s: float = 0.0, fail_transport: int = 0):
+        self.statuses = list(statuses)
+        self.delay_s = delay_s
+        self.fail_transport = fail_transport
+        self.requests: list[httpx.Request] = []
+        self.active: dict[str, int] = {}
+        self.peak: dict[str, int] = {}
+
+    async def __call__(self, request: httpx.Request) -> httpx.Response:
+        host = request.url.host
+        self.requests.append(request)
+        self.active[host] = self.active.get(host, 0) + 1
+        self.peak[host] = max(self.peak.get(host, 0), self.active[host])
+        try:
+            if self.delay_s:
+                await asyncio.sleep(self.delay_s)
+            if self.fail_transport:
+                self.fail_transport -= 1
+                raise httpx.ConnectError("connection refused", request=request)
+            return httpx.Response(self.statuses.pop(0) if self.statuses else 200)
+        finally:
+            self.active[host] -= 1
+
+
+def _dispatcher(bap: StandInBap, **kw) -> CallbackDispatcher:
+    kw.setdefault("backoff_base_s", 0.0)
+    return CallbackDispatcher(client=httpx.AsyncClient(transport=httpx.MockTransport(bap)), **kw)
+
+
+async def _deliver_all(dispatcher: CallbackDispatcher, callbacks):
+    dispatcher.start()
+    for bap_uri, action, payload in callbacks:
+        assert dispatcher.submit(bap_uri, action, payload)
+    await dispatcher.close()
+    return dispatcher.metrics()
+
+
+def test_retryable_statuses_are_retried_with_the_same_signed_body():
+    bap = StandInBap(statuses=[503, 429])
+    signatures = []
+
+    async def sign(body: bytes):
+        signatures.append(body)
+        return {"Authorization": f"sig-{len(signatures)}"}
+
+    async def payload():
+        return {"context": {"action": "on_search"}}
+
+    m = asyncio.run(_deliver_all(_dispatcher(bap, sign=sign), [("http://bap.test/beckn", "on_search", payload)]))
+    assert (m["delivered"], m["retried"], m["failed"]) == (1, 2, 0)
+    assert [str(r.url) for r in bap.requests] == ["http://bap.test/beckn/on_search"] * 3
+    assert {r.content for r in bap.requests} == {json.dumps({"context": {"action": "on_search"}}, separators=(",", ":")).encode()}
+    assert {r.headers["Authorization"] for r in bap.requests} == {"sig-1"}
+    assert len(signatures) == 1
+
+
+def test_transport_errors_are_retried():
+    bap = StandInBap(fail_transport=2)
+    m = asyncio.run(_deliver_all(_dispatcher(bap), [("http://bap.test", "on_status", {})]))
+    assert (m["delivered"], m["retried"], len(bap.requests)) == (1, 2, 3)
+
+
+def test_other_errors_are_not_retried():
+    bap = StandInBap(statuses=[400])
+    m = asyncio.run(_deliver_all(_dispatcher(bap), [("http://bap.test", "on_confirm", {})]))
+    assert (m["delivered"], m["retried"], m["failed"], len(bap.requests)) == (0, 0, 1, 1)
+
+
+def test_gives_up_after_max_retries():
+    bap = StandInBap(statuses=[502] * 10)
+    m = asyncio.run(_deliver_all(_dispatcher(bap, max_retries=2), [("http://bap.test", "on_init", {})]))
+    assert (m["delivered"], m["retried"], m["failed"], len(bap.requests)) == (0, 2, 1, 3)
+    assert m["per_bap"]["bap.test"]["failed"] == 1
+
+
+def test_per_bap_concurrency_is_capped():
+    bap = StandInBap(delay_s=0.02)
+    callbacks = [(f"http://{host}.test", "on_search", {"i": i}) for i in range(8) for host in ("busy", "other")]
+    m = asyncio.run(_deliver_all(_dispatcher(bap, workers=8, per_bap_concurrency=2), callbacks))
+    assert m["delivered"] == 16
+    assert bap.peak["busy.test"] == 2
+    # the limit is per BAP, not shared across them
+    assert bap.peak["other.test"] == 2
+
+
+def test_full_queue_drops_and_counts():
+    bap = StandInBap()
+
+    async def run():
+        dispatcher = _dispatcher(bap, queue_size=2)
+        # not started: nothing drains the queue
+        accepted = [dispatcher.submit("http://bap.test", "on_search", {"i": i}) for i in range(3)]
+        full = dispatcher.metrics()
+        dispatcher.start()
+        await dispatcher.close()
+        return accepted, full, dispatcher.metrics()
+
+    accepted, full, done = asyncio.run(run())
+    assert accepted == [True, True, False]
+    assert (full["queue_depth"], full["enqueued"], full["dropped"]) == (2, 2, 1)
+    assert full["per_bap"]["bap.test"]["dropped"] == 1
+    assert (done["delivered"], done["queue_depth"]) == (2, 0)
+    assert len(bap.requests) == 2
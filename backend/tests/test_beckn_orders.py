@@ -0,0 +1,118 @@
+from sqlalchemy import select
+
+from app import models
+from app.beckn.orders import CANCELLED, CONFIRMED, IN_PROGRESS, PENDING, OrderStore
+
+
+def _row(session_factory, transaction_id):
+    with session_factory() as db:
+        return db.scalar(select(models.BecknOrder).where(models.BecknOrder.transaction_id == transaction_id))
+
+
+def test_flush_upserts_dirty_orders(pg_session_factory):
+    store = OrderStore(session_factory=pg_session_factory)
+    store.transition("t1", PENDING, bap_id="bap", items=[{"id": "i1"}])
+    store.transition("t1", CONFIRMED)
+    store.transition("t2", PENDING)
+    assert store.flush() == 2
+    assert store.flush() == 0  # nothing dirty any more
+    row = _row(pg_session_factory, "t1")
+    assert (row.status, row.version, row.bap_id, row.items) == (CONFIRMED, 2, "bap", [{"id": "i1"}])
+
+
+def test_flush_never_overwrites_a_newer_version(pg_session_factory):
+    ahead = OrderStore(session_factory=pg_session_factory)
+    ahead.transition("t1", PENDING)
+    ahead.transition("t1", CONFIRMED)
+    ahead.flush()
+    order_id = _row(pg_session_factory, "t1").order_id
+
+    # another worker that never saw the order writes an older version of it
+    behind = OrderStore(session_factory=pg_session_factory)
+    behind.transition("t1", PENDING, bap_id="stale")
+    assert behind.flush() == 1
+    row = _row(pg_session_factory, "t1")
+    assert (row.status, row.version, row.order_id, row.bap_id) == (CONFIRMED, 2, order_id, None)
+
+    # a newer version does go through
+    ahead.transition("t1", IN_PROGRESS)
+    ahead.flush()
+    row = _row(pg_session_factory, "t1")
+    assert (row.status, row.version) == (IN_PROGRESS, 3)
+
+
+def test_dirty_orders_are_not_evicted(pg_session_factory):
+    store = OrderStore(session_factory=pg_session_factory, max_cached=2)
+    for t in ("t1", "t2", "t3", "t4"):
+        store.transition(t, PENDING)
+    store._evict()
+    assert store.stats()["orders"] == 4
+
+    def broken():
+        raise RuntimeError("database down")
+
+    # a failed flush keeps every order dirty, so still cached
+    store._session_factory = broken
+    assert store.flush() == 0
+    assert store.stats() == {"orders": 4, "dirty": 4, "flushed": 0, "flush_errors": 1}
+
+    store._session_factory = pg_session_factory
+    assert store.flush() == 4
+    assert store.stats()["orders"] == 2
+
+
+def test_eviction_drops_least_recently_used(pg_session_factory):
+    store = OrderStore(session_factory=pg_session_factory, max_cached=2)
+    for t in ("t1", "t2"):
+        store.transition(t, PENDING)
+    store.flush()
+    store.get("t1")  # t2 is now the least recently used
+    store.transition("t3", PENDING)
+    store.flush()
+    assert [store.is_cached(t) for t in ("t1", "t2", "t3")] == [True, False, True]
+
+
+def test_evicted_order_reloads_and_continues(pg_session_factory):
+    store = OrderStore(session_factory=pg_session_factory, max_cached=1)
+    before = store.transition("t1", PENDING, bap_uri="http://bap.test")
+    store.transition("t1", CONFIRMED)
+    store.transition("t2", PENDING)
+    store.flush()
+    assert not store.is_cached("t1")
+
+    order = store.get("t1")
+    assert order["status"] == CONFIRMED and order["version"] == 2
+    assert (order["order_id"], order["bap_uri"]) == (before["order_id"], "http://bap.test")
+    assert store.is_cached("t1")
+
+    store.transition("t1", CANCELLED)
+    store.flush()
+    row = _row(pg_session_factory, "t1")
+    assert (row.status, row.version, row.order_id) == (CANCELLED, 3, before["order_id"])
+    assert store.get("missing") is None
+
+
+def test_select_on_another_worker_keeps_the_order_id(pg_session_factory, monkeypatch):
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+
+    from app.beckn import routers
+    from app.config import settings
+
+    monkeypatch.setattr(settings, "beckn_async_callbacks", False)
+    monkeypatch.setattr(settings, "beckn_verify_requests", False)
+    app = FastAPI()
+    app.include_router(routers.router)
+    client = TestClient(app)
+
+    def select(worker):
+        monkeypatch.setattr(routers, "get_order_store", lambda: worker)
+        res = client.post("/beckn/bpp/select", json={"context": {"transaction_id": "t1"}, "message": {"order": {}}})
+        assert res.status_code == 200
+        return res.json()["message"]["order"]["id"]
+
+    first = OrderStore(session_factory=pg_session_factory)
+    order_id = select(first)
+    first.flush()
+    # a repeat select lands on a worker that has never seen the transaction
+    assert select(OrderStore(session_factory=pg_session_factory)) == order_id
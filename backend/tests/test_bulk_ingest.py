@@ -0,0 +1,59 @@
+import numpy as np
+import pandas as pd
+import pytest
+from sqlalchemy import select
+
+from app import crud, models
+from app.services import etl
+
+
+def _frame(n: int = 7) -> pd.DataFrame:
+    return pd.DataFrame({
+        "job_id": [f"e{i}" for i in range(n)],
+        "created_at": pd.date_range("2026-10-01", periods=n, freq="h", tz="UTC"),
+        "pickup_lat": np.linspace(12.9, 13.0, n),
+        "pickup_lng": np.linspace(77.5, 77.6, n),
+        "drop_lat": np.linspace(12.95, 13.05, n),
+        "drop_lng": np.linspace(77.55, 77.65, n),
+        "final_payout": [50.0, np.nan] + [60.0] * (n - 2),
+        "base_payout": [40.0, 45.0] + [55.0] * (n - 2),
+        "distance_km": [5.0] * n,
+        "zone_id": pd.array([3, None] + [4] * (n - 2), dtype="Int64"),
+    })
+
+
+@pytest.fixture
+def db(pg_session_factory, monkeypatch):
+    monkeypatch.setattr(etl, "SessionLocal", pg_session_factory)
+    with pg_session_factory() as session:
+        yield session
+
+
+def test_frame_maps_onto_job_columns():
+    df = pd.concat([_frame(), pd.DataFrame({"job_id": [None, "e0"]})], ignore_index=True)
+    out, dropped = etl.jobs_frame_to_records(df)
+    assert dropped == 2  # no job_id, and a repeat of e0
+    first, second = out.iloc[0], out.iloc[1]
+    assert (first["price_usd"], second["price_usd"]) == (50.0, 45.0)  # final, else base payout
+    assert (first["energy_kwh"], first["zone"], second["zone"]) == (1.0, "3", None)
+    assert len(first["pickup_geohash"]) == 9
+
+
+def test_bulk_insert_skips_existing_ids_in_every_batch(db):
+    out, _ = etl.jobs_frame_to_records(_frame())
+    batches = []
+    inserted = crud.bulk_insert_jobs(db, etl._rows(out.iloc[:3]), batch_size=2)
+    assert inserted == ["e0", "e1", "e2"]
+
+    inserted = crud.bulk_insert_jobs(db, etl._rows(out), batch_size=2, on_batch=lambda _, ids: batches.append(ids))
+    assert inserted == ["e3", "e4", "e5", "e6"]
+    # batches that only held existing jobs don't call on_batch
+    assert batches == [["e3"], ["e4", "e5"], ["e6"]]
+    rows = db.scalars(select(models.Job).order_by(models.Job.external_job_id)).all()
+    assert [r.external_job_id for r in rows] == [f"e{i}" for i in range(7)]
+    assert rows[1].zone is None and rows[1].price_usd == 45.0
+
+
+def test_ingest_is_idempotent(db):
+    assert etl.ingest_dataframe(_frame(), batch_size=3) == {"inserted": 7, "skipped": 0, "rezoned": 0}
+    assert etl.ingest_dataframe(_frame(), batch_size=3) == {"inserted": 0, "skipped": 7, "rezoned": 0}
@@ -0,0 +1,89 @@
+import os
+
+import pandas as pd
+import pytest
+
+from app.config import settings
+from app.services import datasets
+from app.services.datasets import DatasetRef, DatasetWriter, iter_dataset, read_dataset, resolve, upsert_dataset, write_dataset
+
+
+def _frame(ids, zone=3):
+    n = len(ids)
+    return pd.DataFrame({
+        "job_id": ids,
+        "created_at": pd.date_range("2026-10-01", periods=n, freq="h", tz="UTC"),
+        "zone_id": pd.array([zone] * n, dtype="Int64"),
+        "base_pay": [10.5] * n,
+        "city": pd.array(["blr"] * n, dtype="string"),
+    })
+
+
+def test_parquet_round_trip_keeps_dtypes(tmp_path):
+    df = _frame(["a", "b", "c"])
+    path = write_dataset(df, tmp_path / "jobs.csv")
+    assert path.endswith(".parquet") and not os.path.exists(tmp_path / "jobs.csv")
+    pd.testing.assert_frame_equal(read_dataset(tmp_path / "jobs.csv"), df)
+    assert list(read_dataset(path, columns=["zone_id", "missing"]).columns) == ["zone_id"]
+
+
+def test_csv_export_alongside(tmp_path):
+    write_dataset(_frame(["a"]), tmp_path / "jobs.parquet", csv=True)
+    assert os.path.exists(tmp_path / "jobs.csv")
+    # the Parquet file is the one read back
+    assert resolve(tmp_path / "jobs.csv") == str(tmp_path / "jobs.parquet")
+    back = read_dataset(tmp_path / "jobs.csv", parse_dates=["created_at"])
+    assert back["created_at"].dt.tz is not None
+
+
+def test_csv_only_format(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "etl_format", "csv")
+    assert write_dataset(_frame(["a", "b"]), tmp_path / "jobs.parquet").endswith(".csv")
+    back = read_dataset(tmp_path / "jobs", parse_dates=["created_at"])
+    assert list(back["job_id"]) == ["a", "b"] and pd.api.types.is_datetime64_any_dtype(back["created_at"])
+
+
+def test_chunks_with_an_all_missing_column_share_a_schema(tmp_path):
+    first = _frame(["a", "b"]).assign(note=None)
+    second = _frame(["c"]).assign(note="late")
+    with DatasetWriter(tmp_path / "jobs") as w:
+        w.write(first)
+        w.write(second)
+    back = read_dataset(tmp_path / "jobs")
+    assert list(back["note"]) == [None, None, "late"]
+
+
+def test_failed_writes_leave_the_previous_dataset(tmp_path):
+    write_dataset(_frame(["a"]), tmp_path / "jobs")
+    with pytest.raises(RuntimeError):
+        with DatasetWriter(tmp_path / "jobs") as w:
+            w.write(_frame(["x", "y"]))
+            raise RuntimeError("stage failed")
+    assert list(read_dataset(tmp_path / "jobs")["job_id"]) == ["a"]
+    assert sorted(os.listdir(tmp_path)) == ["jobs.parquet"]
+
+
+def test_upsert_replaces_rows_by_key(tmp_path, monkeypatch):
+    monkeypatch.setattr(datasets, "UPSERT_BATCH_ROWS", 2)
+    write_dataset(_frame(["a", "b", "c"], zone=1), tmp_path / "jobs")
+    new = _frame(["b", "d"], zone=2).drop(columns="city").assign(extra=1)
+    upsert_dataset(new, tmp_path / "jobs", key="job_id")
+    back = read_dataset(tmp_path / "jobs")
+    # existing columns win: missing ones are filled, unknown ones dropped
+    assert list(back.columns) == list(_frame([]).columns)
+    assert list(zip(back["job_id"], back["zone_id"])) == [("a", 1), ("c", 1), ("b", 2), ("d", 2)]
+    assert back["city"].isna().tolist() == [False, False, True, True]
+
+
+def test_iter_dataset_and_refs(tmp_path):
+    df = _frame([f"j{i}" for i in range(7)])
+    path = write_dataset(df, tmp_path / "jobs")
+    batches = list(iter_dataset(path, 3, columns=["job_id"]))
+    assert [len(b) for b in batches] == [3, 3, 1]
+    assert list(batches[-1].index) == [6]
+    on_disk, in_memory = DatasetRef(path), DatasetRef(path, frame=df)
+    for ref in (on_disk, in_memory):
+        assert [list(b.index) for b in ref.iter(4)] == [[0, 1, 2, 3], [4, 5, 6]]
+        pd.testing.assert_frame_equal(ref.read(columns=["job_id", "zone_id"]), df[["job_id", "zone_id"]])
+    in_memory.read()["job_id"] = "changed"
+    assert df["job_id"].iloc[0] == "j0"
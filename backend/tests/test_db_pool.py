@@ -0,0 +1,82 @@
+import asyncio
+import os
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, exc, text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app import main
+from app.db import Base, PoolStats, TimedAsyncQueuePool, TimedQueuePool, get_async_db
+
+
+@pytest.fixture
+def url(pg_engine):
+    return os.environ["TEST_DATABASE_URL"]
+
+
+def _one_connection_engine(url):
+    engine = create_engine(url, poolclass=TimedQueuePool, pool_size=1, max_overflow=0, pool_timeout=0.1)
+    engine.pool.stats = PoolStats("test")
+    return engine
+
+
+def test_checkouts_and_timeouts_are_counted(url):
+    engine = _one_connection_engine(url)
+    try:
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+            busy = engine.pool.stats.snapshot(engine.pool)
+            with pytest.raises(exc.TimeoutError):
+                engine.connect()
+        stats = engine.pool.stats.snapshot(engine.pool)
+    finally:
+        engine.dispose()
+    assert (busy["checked_out"], busy["saturation"]) == (1, 1.0)
+    assert (stats["checkouts"], stats["timeouts"], stats["peak_checked_out"], stats["checked_out"]) == (1, 1, 1, 0)
+    assert sum(stats["wait_histogram"].values()) == 1
+
+
+def test_stats_survive_dispose(url):
+    engine = _one_connection_engine(url)
+    stats = engine.pool.stats
+    with engine.connect():
+        pass
+    engine.dispose()
+    with engine.connect():
+        pass
+    engine.dispose()
+    assert engine.pool.stats is stats and stats.checkouts == 2
+
+
+def test_async_pool_is_instrumented(url):
+    async def main():
+        engine = create_async_engine(url, poolclass=TimedAsyncQueuePool, pool_size=1, max_overflow=0, pool_timeout=0.1)
+        engine.sync_engine.pool.stats = PoolStats("test-async")
+        try:
+            async with engine.connect() as conn:
+                assert (await conn.execute(text("SELECT 1"))).scalar() == 1
+                with pytest.raises(exc.TimeoutError):
+                    await engine.connect().start()
+            return engine.sync_engine.pool.stats.snapshot(engine.sync_engine.pool)
+        finally:
+            await engine.dispose()
+
+    stats = asyncio.run(main())
+    assert (stats["checkouts"], stats["timeouts"]) == (1, 1)
+
+
+def test_exhausted_pool_is_a_503(monkeypatch):
+    monkeypatch.setattr(Base.metadata, "create_all", lambda **kw: None)
+    app = main.create_app()
+
+    async def exhausted():
+        raise exc.TimeoutError("QueuePool limit reached")
+        yield
+
+    app.dependency_overrides[get_async_db] = exhausted
+    res = TestClient(app).post("/jobs/", json={
+        "external_job_id": "p1", "timestamp": "2026-10-01T08:00:00", "pickup_lat": 12.9, "pickup_lng": 77.5,
+        "dropoff_lat": 12.95, "dropoff_lng": 77.55, "energy_kwh": 1.0,
+    })
+    assert res.status_code == 503 and res.headers["Retry-After"] == "1"
@@ -0,0 +1,68 @@
+import numpy as np
+import pandas as pd
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sklearn.linear_model import LinearRegression
+
+from app.config import settings
+from app.routes import estimate as estimate_routes
+from app.services import payout_model, zone_index
+from app.services.payout_model import PayoutModelService
+from app.services.zone_index import ZoneIndex
+
+rng = np.random.default_rng(11)
+TRIPS = [
+    {"energy_kwh": float(e), "pickup_lat": float(a), "pickup_lng": float(b), "dropoff_lat": float(c), "dropoff_lng": float(d)}
+    for e, a, b, c, d in zip(rng.uniform(0.5, 5, 40), rng.uniform(12.8, 13.2, 40), rng.uniform(77.4, 77.8, 40),
+                             rng.uniform(12.8, 13.2, 40), rng.uniform(77.4, 77.8, 40))
+]
+
+
+def _model(n_features):
+    X = rng.uniform(0, 20, (60, n_features))
+    return LinearRegression().fit(X, 3 + X @ np.arange(1, n_features + 1))
+
+
+@pytest.fixture
+def zones(monkeypatch):
+    index = ZoneIndex(pd.DataFrame({"zone_id": [1, 2, 3], "centroid_lat": [12.85, 13.0, 13.15], "centroid_lng": [77.45, 77.6, 77.75]}))
+    monkeypatch.setattr(zone_index, "get_zone_index", lambda: index)
+    monkeypatch.setattr(payout_model, "get_zone_index", lambda: index)
+    return index
+
+
+def _client(svc):
+    app = FastAPI()
+    app.include_router(estimate_routes.router)
+    app.dependency_overrides[payout_model.get_payout_service] = lambda: svc
+    return TestClient(app)
+
+
+@pytest.mark.parametrize("model", [None, 1, 3])
+def test_batch_prices_match_single_estimates(model, zones):
+    svc = PayoutModelService()
+    if model is not None:
+        svc._model = _model(model)
+    client = _client(svc)
+    res = client.post("/estimate/batch", json=TRIPS)
+    assert res.status_code == 200
+    singles = [client.post("/estimate/", json=t).json()["estimated_price_usd"] for t in TRIPS]
+    assert res.json()["estimated_prices_usd"] == singles
+
+
+def test_batch_without_zones_uses_the_training_placeholder(monkeypatch):
+    monkeypatch.setattr(zone_index, "get_zone_index", lambda: None)
+    monkeypatch.setattr(payout_model, "get_zone_index", lambda: None)
+    svc = PayoutModelService()
+    svc._model = _model(3)
+    prices = svc.estimate_prices(**{f: [t[f] for t in TRIPS[:5]] for f in TRIPS[0]})
+    assert prices.tolist() == [svc.estimate_price(**t) for t in TRIPS[:5]]
+
+
+def test_batch_limits(monkeypatch):
+    client = _client(PayoutModelService())
+    assert client.post("/estimate/batch", json=[]).json() == {"estimated_prices_usd": []}
+    monkeypatch.setattr(settings, "estimate_batch_max_trips", 3)
+    assert client.post("/estimate/batch", json=TRIPS[:4]).status_code == 413
+    assert client.post("/estimate/batch", json=[{"energy_kwh": 1}]).status_code == 422
@@ -0,0 +1,127 @@
+import asyncio
+import threading
+
+import numpy as np
+import pytest
+from sklearn.linear_model import LinearRegression
+
+from app.services import payout_model
+from app.services.payout_model import EstimateBatcher, PayoutModelService
+
+
+class FakeService:
+    """Prices a trip at 10x its energy; the first model call can be held open."""
+
+    def __init__(self, fail=False):
+        self.calls = []
+        self.release = threading.Event()
+        self.release.set()
+        self.fail = fail
+
+    def estimate_price(self, **trip):
+        self.release.wait(5)
+        self.calls.append(1)
+        return 10 * trip["energy_kwh"]
+
+    def estimate_prices(self, **columns):
+        self.release.wait(5)
+        self.calls.append(len(columns["energy_kwh"]))
+        if self.fail:
+            raise RuntimeError("model exploded")
+        return np.asarray(columns["energy_kwh"]) * 10
+
+
+def _trip(energy):
+    return {"energy_kwh": float(energy), "pickup_lat": 12.9, "pickup_lng": 77.5, "dropoff_lat": 12.95, "dropoff_lng": 77.55}
+
+
+async def _busy_then(batcher, svc, energies):
+    """Hold a first (lone) request in the model while `energies` queue up behind it."""
+    svc.release.clear()
+    first = asyncio.ensure_future(batcher.submit(_trip(0)))
+    await asyncio.sleep(0.01)
+    rest = [asyncio.ensure_future(batcher.submit(_trip(e))) for e in energies]
+    await asyncio.sleep(0.01)
+    svc.release.set()
+    return await first, await asyncio.gather(*rest, return_exceptions=True)
+
+
+def test_lone_request_is_priced_at_once():
+    svc = FakeService()
+    batcher = EstimateBatcher(svc, max_batch=8, max_wait_s=10)
+
+    async def main():
+        # a 10 s window would time the test out if a lone request waited for it
+        assert await asyncio.wait_for(batcher.submit(_trip(3)), 1) == 30
+        await batcher.aclose()
+
+    asyncio.run(main())
+    assert svc.calls == [1] and batcher.stats()["batches"] == 1
+
+
+def test_concurrent_requests_share_a_model_call():
+    svc = FakeService()
+    batcher = EstimateBatcher(svc, max_batch=64, max_wait_s=0.001)
+
+    async def main():
+        out = await _busy_then(batcher, svc, range(1, 6))
+        await batcher.aclose()
+        return out
+
+    first, rest = asyncio.run(main())
+    assert first == 0 and rest == [10, 20, 30, 40, 50]
+    assert svc.calls == [1, 5]
+    stats = batcher.stats()
+    assert (stats["requests"], stats["batches"], stats["avg_batch"]) == (6, 2, 3.0)
+    assert stats["batch_size_histogram"]["le_1"] == 1 and stats["batch_size_histogram"]["le_8"] == 1
+
+
+def test_full_batches_go_without_waiting_for_the_window():
+    svc = FakeService()
+    batcher = EstimateBatcher(svc, max_batch=3, max_wait_s=10)
+
+    async def main():
+        out = await asyncio.wait_for(_busy_then(batcher, svc, range(1, 7)), 2)
+        await batcher.aclose()
+        return out
+
+    _, rest = asyncio.run(main())
+    assert rest == [10, 20, 30, 40, 50, 60]
+    assert svc.calls == [1, 3, 3]
+
+
+def test_model_errors_reach_every_caller_in_the_batch():
+    svc = FakeService(fail=True)
+    batcher = EstimateBatcher(svc, max_batch=64, max_wait_s=0.001)
+
+    async def main():
+        out = await _busy_then(batcher, svc, [1, 2])
+        # the batcher keeps serving after a failed batch
+        assert await batcher.submit(_trip(4)) == 40
+        await batcher.aclose()
+        return out
+
+    first, rest = asyncio.run(main())
+    assert first == 0
+    assert [str(e) for e in rest] == ["model exploded", "model exploded"]
+    assert batcher.stats()["errors"] == 1
+
+
+@pytest.mark.parametrize("fitted", [False, True])
+def test_batched_prices_match_single_estimates(fitted, monkeypatch):
+    monkeypatch.setattr(payout_model, "nearest_zone", lambda lat, lng: None)
+    monkeypatch.setattr(payout_model, "get_zone_index", lambda: None)
+    svc = PayoutModelService()
+    if fitted:
+        rng = np.random.default_rng(0)
+        X = np.column_stack([rng.uniform(0, 20, 50), rng.integers(0, 24, 50), np.full(50, -1.0)])
+        svc._model = LinearRegression().fit(X, 5 + 2 * X[:, 0])
+    trips = [_trip(e) | {"dropoff_lat": 12.9 + 0.01 * e} for e in range(1, 9)]
+    svc.batcher = EstimateBatcher(svc, max_batch=64, max_wait_s=0.005)
+
+    async def main():
+        out = await asyncio.gather(*(svc.estimate_price_async(**t) for t in trips))
+        await svc.batcher.aclose()
+        return out
+
+    assert asyncio.run(main()) == [svc.estimate_price(**t) for t in trips]
@@ -0,0 +1,75 @@
+import json
+
+import pytest
+
+from app.services import etl_bench
+
+
+def _run(stage, rows, wall_s, peak_rss_mb, status="ok", repeat=0):
+    return {"stage": stage, "rows": rows, "repeat": repeat, "status": status, "wall_s": wall_s,
+            "rows_per_s": round(rows / wall_s), "peak_rss_mb": peak_rss_mb}
+
+
+BASELINE = {"results": [
+    _run("preprocess", 1000, 2.0, 400.0),
+    _run("zones", 1000, 0.01, 300.0),
+    _run("train", 1000, 1.0, 500.0),
+    _run("ingest", 1000, 1.0, 200.0),
+]}
+
+
+@pytest.mark.parametrize("text, rows", [("10k", 10_000), ("2.5M", 2_500_000), ("10_000", 10_000), (" 1m ", 1_000_000)])
+def test_parse_size(text, rows):
+    assert etl_bench.parse_size(text) == rows
+
+
+def test_compare_flags_slowdowns_and_memory_growth():
+    current = {"results": [
+        _run("preprocess", 1000, 3.0, 400.0),  # 1.5x slower
+        _run("zones", 1000, 0.04, 300.0),  # 4x, but 30 ms is timer noise
+        _run("train", 1000, 1.1, 700.0),  # within the time budget, 1.4x the memory
+        _run("ingest", 1000, 5.0, 200.0, status="failed"),  # failures are reported elsewhere
+        _run("preprocess", 10_000, 9.0, 900.0),  # not in the baseline
+    ]}
+    regressions = etl_bench.compare(current, BASELINE)
+    assert [(r["stage"], r["metric"], r["ratio"]) for r in regressions] == [
+        ("preprocess", "wall_s", 1.5),
+        ("train", "peak_rss_mb", 1.4),
+    ]
+    assert etl_bench.compare(current, BASELINE, max_slowdown=2.0, max_memory_growth=1.5) == []
+    assert [r["stage"] for r in etl_bench.compare(current, BASELINE, min_delta_s=0.0)] == ["preprocess", "train", "zones"]
+
+
+def test_compare_uses_the_best_repeat():
+    current = {"results": [_run("preprocess", 1000, 3.5, 900.0), _run("preprocess", 1000, 2.1, 410.0, repeat=1)]}
+    assert etl_bench.compare(current, BASELINE) == []
+
+
+def test_main_exits_nonzero_on_a_regression(tmp_path, monkeypatch, capsys):
+    baseline = tmp_path / "baseline.json"
+    baseline.write_text(json.dumps(BASELINE))
+    report = {"results": [_run("preprocess", 1000, 2.1, 400.0)]}
+    monkeypatch.setattr(etl_bench, "run_benchmark", lambda *a, **kw: report)
+    out = tmp_path / "out.json"
+    args = ["--sizes", "1k", "--stages", "preprocess", "--out", str(out), "--baseline", str(baseline)]
+    assert etl_bench.main(args) == 0
+    report["results"][0]["wall_s"] = 4.0
+    assert etl_bench.main(args) == 1
+    assert "REGRESSION preprocess @ 1000 rows: wall_s 2.0 -> 4.0 (x2.0)" in capsys.readouterr().out
+    assert json.loads(out.read_text())["regressions"][0]["metric"] == "wall_s"
+
+
+def test_benchmark_times_stages_and_skips_after_a_failure(tmp_path, monkeypatch):
+    # stages run in spawned processes, so break "train" through its input rather than a monkeypatch
+    paths = etl_bench._paths
+    monkeypatch.setattr(etl_bench, "_paths", lambda workdir, rows: {
+        **paths(workdir, rows), "zoned": str(tmp_path / "missing" / "jobs_zoned.parquet"),
+    })
+    report = etl_bench.run_benchmark([500], str(tmp_path / "bench"), stages=["train", "preprocess", "ingest"])
+    status = [(r["stage"], r["status"]) for r in report["results"]]
+    assert status == [("preprocess", "ok"), ("train", "failed"), ("ingest", "skipped")]
+    ok = report["results"][0]
+    assert ok["wall_s"] > 0 and ok["peak_rss_mb"] > 0 and ok["rows_per_s"] > 0
+    assert report["params"]["stages"] == ["preprocess", "train", "ingest"]
+    with pytest.raises(ValueError, match="unknown stages"):
+        etl_bench.run_benchmark([500], str(tmp_path / "bench"), stages=["load"])
@@ -0,0 +1,83 @@
+import threading
+
+import pytest
+
+from app.services.etl_dag import FAILED, SKIPPED, SUCCEEDED, EtlDag, Stage
+
+
+def test_results_flow_along_dependencies():
+    dag = EtlDag([
+        Stage("sum", lambda a, b: a + b, deps=("a", "b")),
+        Stage("a", lambda: 2),
+        Stage("b", lambda: 3),
+        Stage("double", lambda s: 2 * s, deps=("sum",)),
+    ])
+    assert dag.order.index("sum") > max(dag.order.index("a"), dag.order.index("b"))
+    assert dag.run() == {"a": 2, "b": 3, "sum": 5, "double": 10}
+    assert all(r["status"] == SUCCEEDED and r["wall_s"] is not None for r in dag.report)
+
+
+def test_independent_stages_overlap():
+    # each side waits for the other, so this only finishes if both run at once
+    barrier = threading.Barrier(2, timeout=5)
+    dag = EtlDag([Stage("left", barrier.wait), Stage("right", barrier.wait)])
+    dag.run(workers=2)
+    assert {r["status"] for r in dag.report} == {SUCCEEDED}
+
+
+def test_failure_skips_dependents_and_is_raised():
+    sibling_started = threading.Event()
+    events = []
+
+    def boom(_):
+        sibling_started.wait(5)
+        raise RuntimeError("disk full")
+
+    dag = EtlDag([
+        Stage("load", lambda: 1),
+        Stage("zones", boom, deps=("load",)),
+        Stage("train", lambda _: sibling_started.set() or "model", deps=("load",)),
+        Stage("ingest", lambda z: z, deps=("zones",)),
+        Stage("publish", lambda z, m: None, deps=("ingest", "train")),
+    ])
+    with pytest.raises(RuntimeError, match="disk full"):
+        dag.run(workers=2, on_finish=lambda name, status: events.append((name, status)))
+    status = {r["name"]: r["status"] for r in dag.report}
+    # the stage already running alongside the failure is allowed to finish
+    assert status == {"load": SUCCEEDED, "zones": FAILED, "train": SUCCEEDED, "ingest": SKIPPED, "publish": SKIPPED}
+    assert dag.reports["zones"].error == "RuntimeError: disk full"
+    assert ("zones", FAILED) in events and not any(n in ("ingest", "publish") for n, _ in events)
+    assert "skipped" in dag.format_report()
+
+
+@pytest.mark.parametrize("stages, message", [
+    ([Stage("a", lambda: 1), Stage("a", lambda: 2)], "duplicate stage"),
+    ([Stage("a", lambda x: x, deps=("missing",))], "unknown stages"),
+    ([Stage("a", lambda b: b, deps=("b",)), Stage("b", lambda a: a, deps=("a",))], "dependency cycle"),
+])
+def test_invalid_graphs_are_rejected(stages, message):
+    with pytest.raises(ValueError, match=message):
+        EtlDag(stages)
+
+
+def test_failed_stage_fails_the_background_etl_run(tmp_path, monkeypatch):
+    from app.services import etl, etl_jobs
+
+    def stages(*args, **kwargs):
+        return [
+            Stage("preprocess", lambda: 1),
+            Stage("zones", lambda _: 1 / 0, deps=("preprocess",)),
+            Stage("ingest", lambda z: z, deps=("zones",)),
+        ]
+
+    monkeypatch.setattr(etl, "etl_stages", stages)
+    upload = tmp_path / "upload.csv"
+    upload.write_text("job_id\n")
+    registry = etl_jobs.EtlJobRegistry()
+    job = registry.submit(str(upload), "upload.csv", 7)
+    registry._executor.shutdown(wait=True)
+    snap = registry.get(job.id)
+    assert snap["status"] == etl_jobs.FAILED
+    assert snap["error"] == "ZeroDivisionError: division by zero"
+    assert [(s["name"], s["status"]) for s in snap["stages"]] == [("preprocess", SUCCEEDED), ("zones", FAILED)]
+    assert not upload.exists()
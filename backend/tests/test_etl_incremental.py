@@ -0,0 +1,128 @@
+import functools
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.config import settings
+from app.services import etl, preprocess, zones
+from app.services.watermark import Watermark
+
+NOW = pd.Timestamp("2026-10-19 12:00", tz="UTC")
+
+
+def _export(n: int, start: str, first: int = 0, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "order_id": [f"o{i}" for i in range(first, first + n)],
+        "created_at": pd.date_range(start, periods=n, freq="h", tz="UTC").strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "pickup_lat": rng.uniform(12.8, 13.1, n),
+        "pickup_lng": rng.uniform(77.4, 77.8, n),
+        "drop_lat": rng.uniform(12.8, 13.1, n),
+        "drop_lng": rng.uniform(77.4, 77.8, n),
+        "base_payout": rng.uniform(10, 90, n),
+    })
+
+
+@pytest.fixture(autouse=True)
+def fixed_now(monkeypatch):
+    monkeypatch.setattr(preprocess, "_utcnow", lambda: NOW)
+
+
+def test_watermark_advances_only_forward(tmp_path):
+    mark = Watermark()
+    mark.advance(pd.Timestamp("2025-06-01 10:00"), "f1", "a.csv", rows=3)
+    assert mark.created_at == pd.Timestamp("2025-06-01 10:00", tz="UTC")
+    mark.advance(pd.Timestamp("2025-06-01 12:00+02:00"), "f2", "b.csv")  # 10:00 UTC
+    mark.advance(pd.NaT, "f3", "c.csv")
+    mark.advance(None, "f4", "d.csv")
+    assert mark.created_at == pd.Timestamp("2025-06-01 10:00", tz="UTC")
+    mark.advance(pd.Timestamp("2025-06-02", tz="UTC"), "f5", "e.csv")
+    assert mark.created_at == pd.Timestamp("2025-06-02", tz="UTC")
+
+    path = str(tmp_path / "wm.json")
+    mark.save(path)
+    loaded = Watermark.load(path)
+    assert loaded.created_at == mark.created_at
+    assert all(loaded.seen(f) for f in ("f1", "f2", "f3", "f4", "f5"))
+    assert loaded.files["f1"]["rows"] == 3
+    assert Watermark.load(str(tmp_path / "missing.json")).created_at is None
+
+
+def test_created_since_filters_raw_rows_with_ids():
+    df = _export(10, "2025-06-01")
+    df.loc[3, "created_at"] = None
+    since = pd.Timestamp("2025-06-01 05:00", tz="UTC")
+    kept = preprocess._created_since(df, since)
+    # at or after `since`, plus the row it can't tell
+    assert kept["job_id"].tolist() == ["o3", "o5", "o6", "o7", "o8", "o9"]
+
+
+def test_created_since_keeps_everything_when_any_id_is_missing():
+    df = _export(10, "2025-06-01")
+    df.loc[7, "order_id"] = None
+    assert len(preprocess._created_since(df, pd.Timestamp("2025-06-01 05:00", tz="UTC"))) == 10
+
+
+def test_new_rows_get_the_ids_a_full_run_gives(tmp_path):
+    df = _export(10, "2025-06-01")
+    df.loc[[2, 7], "order_id"] = None
+    src = tmp_path / "export.csv"
+    df.to_csv(src, index=False)
+    full = preprocess.clean_dataframe(pd.read_csv(src)).set_index("job_id")["created_at"]
+    new = preprocess.preprocess_new_rows(str(src), str(tmp_path / "clean.parquet"), pd.Timestamp("2025-06-01 05:00", tz="UTC"))
+    assert sorted(new["job_id"]) == ["7", "o5", "o6", "o8", "o9"]
+    assert (new.set_index("job_id")["created_at"] == full.loc[new["job_id"]]).all()
+
+
+def test_source_created_max_ignores_synthesized_values(tmp_path):
+    df = _export(5, "2025-06-01")
+    df.loc[4, "created_at"] = None  # cleaning stamps this one with the run's time
+    src = tmp_path / "export.csv"
+    df.to_csv(src, index=False)
+    assert preprocess.source_created_max(str(src)) == pd.Timestamp("2025-06-01 03:00", tz="UTC")
+    df.drop(columns="created_at").to_csv(src, index=False)
+    assert preprocess.source_created_max(str(src)) is None
+
+
+@pytest.fixture
+def etl_env(tmp_path, pg_session_factory, monkeypatch):
+    """run_etl writing into tmp_path and the test database."""
+    out = {"jobs_zoned_out": str(tmp_path / "jobs_zoned.parquet"), "zones_out": str(tmp_path / "zones.parquet")}
+    monkeypatch.setattr(etl, "cluster_dataset", functools.partial(zones.cluster_dataset, **out))
+    monkeypatch.setattr(etl, "zone_new_jobs", functools.partial(zones.zone_new_jobs, **out))
+    monkeypatch.setattr(etl, "SessionLocal", pg_session_factory)
+    monkeypatch.setattr(settings, "etl_watermark_path", str(tmp_path / "watermark.json"))
+    return functools.partial(
+        etl.run_etl, cleaned_csv_out=str(tmp_path / "jobs_clean.parquet"), k_clusters=3, train_model=False, workers=1,
+    )
+
+
+def test_run_etl_full_then_skipped_then_incremental(tmp_path, etl_env):
+    first = _export(40, "2025-06-01")
+    first.loc[39, "created_at"] = None  # synthesized as NOW, which must not become the watermark
+    src = tmp_path / "export.csv"
+    first.to_csv(src, index=False)
+
+    result = etl_env(str(src))
+    assert result["mode"] == "full"
+    assert result["ingest"]["inserted"] == 40
+    last_real = pd.Timestamp("2025-06-02 14:00", tz="UTC")
+    assert result["watermark"] == last_real
+    assert Watermark.load(settings.etl_watermark_path).created_at == last_real
+
+    assert etl_env(str(src))["mode"] == "skipped"
+
+    # the next export repeats the old rows and adds 10 later ones, still long before NOW
+    pd.concat([first, _export(10, "2025-06-03", first=40, seed=1)], ignore_index=True).to_csv(src, index=False)
+    result = etl_env(str(src))
+    assert result["mode"] == "incremental"
+    # the 10 new rows, the one at the watermark and the undated one
+    assert result["new_rows"] == 12
+    assert result["ingest"]["inserted"] == 10
+    assert result["watermark"] == pd.Timestamp("2025-06-03 09:00", tz="UTC")
+    mark = Watermark.load(settings.etl_watermark_path)
+    assert mark.created_at == result["watermark"]
+    assert [f["mode"] for f in mark.files.values()] == ["full", "incremental"]
+    zoned = pd.read_parquet(tmp_path / "jobs_zoned.parquet")
+    assert len(zoned) == 50 and zoned["job_id"].is_unique
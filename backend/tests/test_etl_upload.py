@@ -0,0 +1,94 @@
+import threading
+import time
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.config import settings
+from app.routes import jobs as jobs_routes
+from app.services import etl_jobs
+
+CSV = b"order_id,created_at\n" + b"".join(b"o%d,2026-10-01T08:00:00Z\n" % i for i in range(2000))
+
+
+@pytest.fixture
+def etl_runs(tmp_path, monkeypatch):
+    """Uploads land in tmp_path; run_etl records what it was given instead of running."""
+    runs = []
+    gate = threading.Event()
+    gate.set()
+
+    def fake_run_etl(path, on_stage, on_stage_done, **params):
+        with open(path, "rb") as f:
+            runs.append((f.read(), params))
+        on_stage("preprocess")
+        gate.wait(5)
+        on_stage_done("preprocess", "succeeded")
+        return {"rows": 2000}
+
+    monkeypatch.setattr(etl_jobs, "run_etl", fake_run_etl)
+    monkeypatch.setattr(settings, "etl_upload_dir", str(tmp_path))
+    monkeypatch.setattr(jobs_routes, "UPLOAD_CHUNK_SIZE", 4096)
+    registry = etl_jobs.EtlJobRegistry()
+    monkeypatch.setattr(jobs_routes, "get_etl_jobs", lambda: registry)
+    app = FastAPI()
+    app.include_router(jobs_routes.router)
+    yield TestClient(app), runs, gate, tmp_path
+    registry.close()
+
+
+def _wait(client, url, status):
+    for _ in range(200):
+        body = client.get(url).json()
+        if body["status"] == status:
+            return body
+        time.sleep(0.01)
+    raise AssertionError(f"{url} never reached {status}: {body}")
+
+
+def test_upload_is_queued_and_reports_progress(etl_runs):
+    client, runs, gate, upload_dir = etl_runs
+    gate.clear()
+    res = client.post("/jobs/admin/upload-and-run-etl", params={"k": 5, "full": "true"}, files={"file": ("export.csv", CSV)})
+    assert res.status_code == 202
+    accepted = res.json()
+    assert accepted["status_url"] == f"/jobs/admin/etl/{accepted['job_id']}"
+    running = _wait(client, accepted["status_url"], "running")
+    assert running["stage"] == "preprocess" and running["size_bytes"] == len(CSV)
+    gate.set()
+    done = _wait(client, accepted["status_url"], "succeeded")
+    assert done["result"] == {"rows": 2000} and done["stages"][0]["status"] == "succeeded"
+    # streamed to disk intact, handed over with the query parameters, then cleaned up
+    content, params = runs[0]
+    assert content == CSV
+    assert (params["k_clusters"], params["full"], params["force"]) == (5, True, False)
+    assert list(upload_dir.iterdir()) == []
+    assert [j["job_id"] for j in client.get("/jobs/admin/etl").json()] == [accepted["job_id"]]
+
+
+def test_oversized_upload_is_rejected_and_removed(etl_runs, monkeypatch):
+    client, runs, _, upload_dir = etl_runs
+    monkeypatch.setattr(settings, "etl_max_upload_mb", 0)
+    res = client.post("/jobs/admin/upload-and-run-etl", files={"file": ("export.csv", CSV)})
+    assert res.status_code == 413
+    assert runs == [] and list(upload_dir.iterdir()) == []
+
+
+def test_unknown_etl_job_is_a_404(etl_runs):
+    client = etl_runs[0]
+    assert client.get("/jobs/admin/etl/nope").status_code == 404
+
+
+def test_registry_forgets_the_oldest_finished_runs(tmp_path, monkeypatch):
+    monkeypatch.setattr(etl_jobs, "run_etl", lambda path, **kw: {})
+    registry = etl_jobs.EtlJobRegistry(keep=2)
+    ids = []
+    for i in range(4):
+        path = tmp_path / f"u{i}.csv"
+        path.write_text("x")
+        ids.append(registry.submit(str(path), path.name, 1).id)
+        # one worker: once this no-op has run, so has the ETL before it
+        registry._executor.submit(lambda: None).result()
+    registry.close()
+    assert [j["job_id"] for j in registry.list()] == ids[:1:-1]
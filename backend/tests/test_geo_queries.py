@@ -0,0 +1,87 @@
+import numpy as np
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import update
+
+from app import crud, models, schemas
+from app.db import get_async_read_db
+from app.routes import jobs as jobs_routes
+from app.services.geo import cells_for_bbox, cells_for_radius, geohash_encode, geohash_encode_many, haversine_np
+
+# Bengaluru-sized spread, so radii from metres to kilometres all catch something
+rng = np.random.default_rng(7)
+LATS = rng.uniform(12.90, 13.00, 400)
+LNGS = rng.uniform(77.55, 77.65, 400)
+
+
+def test_geohash_matches_the_reference_encoding():
+    assert geohash_encode(57.64911, 10.40744) == "u4pruydqq"
+    assert geohash_encode(57.64911, 10.40744, precision=5) == "u4pru"
+    assert list(geohash_encode_many([57.64911, np.nan], [10.40744, 1.0])) == ["u4pruydqq", None]
+
+
+@pytest.mark.parametrize("lat, lng, radius_km", [(12.95, 77.60, 0.5), (12.95, 77.60, 3.0), (12.901, 77.649, 1.5)])
+def test_radius_cells_cover_the_circle(lat, lng, radius_km):
+    cells = cells_for_radius(lat, lng, radius_km)
+    inside = haversine_np(lat, lng, LATS, LNGS) <= radius_km
+    hashes = geohash_encode_many(LATS[inside], LNGS[inside])
+    assert all(any(h.startswith(c) for c in cells) for h in hashes)
+
+
+def test_bbox_cells_cover_the_box():
+    cells = cells_for_bbox(12.92, 77.57, 12.97, 77.61)
+    assert len(cells) <= 32
+    inside = (LATS >= 12.92) & (LATS <= 12.97) & (LNGS >= 77.57) & (LNGS <= 77.61)
+    assert all(any(h.startswith(c) for c in cells) for h in geohash_encode_many(LATS[inside], LNGS[inside]))
+
+
+@pytest.fixture
+def jobs_db(pg_session_factory):
+    with pg_session_factory() as db:
+        crud.bulk_insert_jobs(db, (crud.job_row(schemas.JobCreate(
+            external_job_id=f"g{i}", timestamp="2026-10-01T08:00:00", pickup_lat=float(lat), pickup_lng=float(lng),
+            dropoff_lat=12.95, dropoff_lng=77.6, energy_kwh=1.0,
+        )) for i, (lat, lng) in enumerate(zip(LATS, LNGS))))
+        yield db
+
+
+@pytest.mark.parametrize("lat, lng, radius_km", [(12.95, 77.60, 0.5), (12.95, 77.60, 3.0), (12.901, 77.649, 1.5)])
+def test_jobs_near_matches_a_full_scan(jobs_db, lat, lng, radius_km):
+    dist = haversine_np(lat, lng, LATS, LNGS)
+    expected = [f"g{i}" for i in np.argsort(dist, kind="stable") if dist[i] <= radius_km]
+    found = crud.jobs_near(jobs_db, lat, lng, radius_km, limit=1000)
+    assert expected and [j.external_job_id for j, _ in found] == expected
+    assert [d for _, d in found] == pytest.approx(sorted(dist[dist <= radius_km]), abs=1e-9)
+    assert [j.external_job_id for j, _ in crud.jobs_near(jobs_db, lat, lng, radius_km, limit=3)] == expected[:3]
+
+
+def test_jobs_in_bbox_matches_a_full_scan(jobs_db):
+    inside = (LATS >= 12.92) & (LATS <= 12.97) & (LNGS >= 77.57) & (LNGS <= 77.61)
+    found = crud.jobs_in_bbox(jobs_db, 12.92, 77.57, 12.97, 77.61)
+    assert sorted(j.external_job_id for j in found) == sorted(f"g{i}" for i in np.flatnonzero(inside))
+
+
+def test_backfill_fills_missing_geohashes(jobs_db):
+    jobs_db.execute(update(models.Job).where(models.Job.external_job_id.in_(["g1", "g2", "g3"])).values(pickup_geohash=None))
+    jobs_db.commit()
+    assert crud.backfill_pickup_geohash(jobs_db, batch_size=2) == 3
+    job = crud.get_job_by_external_id(jobs_db, "g2")
+    assert job.pickup_geohash == geohash_encode(LATS[2], LNGS[2])
+
+
+def test_near_route(jobs_db, pg_async_session_factory):
+    async def read_db():
+        async with pg_async_session_factory() as db:
+            yield db
+
+    app = FastAPI()
+    app.include_router(jobs_routes.router)
+    app.dependency_overrides[get_async_read_db] = read_db
+    client = TestClient(app)
+    res = client.get("/jobs/near", params={"lat": 12.95, "lng": 77.60, "radius_km": 1, "limit": 5})
+    assert res.status_code == 200
+    body = res.json()
+    assert len(body) == 5 and body == sorted(body, key=lambda j: j["distance_km"])
+    assert all(j["distance_km"] <= 1 for j in body)
+    assert client.get("/jobs/near", params={"lat": 95, "lng": 77.6}).status_code == 422
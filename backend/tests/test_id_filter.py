@@ -0,0 +1,59 @@
+import pytest
+
+from app import crud, schemas
+from app.services.id_filter import BloomFilter, JobIdFilter
+
+
+def test_bloom_filter_has_no_false_negatives_and_keeps_its_fpr():
+    bloom = BloomFilter(20_000, fpr=0.01)
+    bloom.add_many(f"in-{i}" for i in range(20_000))
+    assert bloom.count == 20_000
+    assert all(f"in-{i}" in bloom for i in range(20_000))
+    fp = sum(f"out-{i}" in bloom for i in range(50_000)) / 50_000
+    assert 0 < fp < 0.02
+    assert bloom.expected_fpr() == pytest.approx(0.01, rel=0.2)
+
+
+def test_bloom_filter_empty_batch_is_a_noop():
+    bloom = BloomFilter(10)
+    bloom.add_many([])
+    assert bloom.count == 0 and "anything" not in bloom
+
+
+def _load(id_filter):
+    id_filter.start()
+    id_filter._thread.join(10)
+    assert id_filter.ready
+
+
+def _insert(db, ids):
+    crud.bulk_insert_jobs(db, (crud.job_row(schemas.JobCreate(
+        external_job_id=i, timestamp="2026-10-01T08:00:00", pickup_lat=12.9, pickup_lng=77.5,
+        dropoff_lat=12.95, dropoff_lng=77.55, energy_kwh=1.0,
+    )) for i in ids))
+
+
+def test_job_id_filter_loads_the_jobs_table(pg_engine, pg_session_factory):
+    with pg_session_factory() as db:
+        _insert(db, [f"j{i}" for i in range(50)])
+    id_filter = JobIdFilter(capacity=1000, bind=pg_engine)
+    # not loaded yet: every id is a maybe
+    assert id_filter.might_contain("never-seen")
+    _load(id_filter)
+    assert all(id_filter.might_contain(f"j{i}") for i in range(50))
+    assert id_filter.stats()["ids"] == 50
+    id_filter.add_many(["late"])
+    assert id_filter.might_contain("late")
+    absent = sum(not id_filter.might_contain(f"new-{i}") for i in range(200))
+    assert absent > 190 and id_filter.skipped_queries == absent
+
+
+def test_job_id_filter_grows_past_its_capacity(pg_engine, pg_session_factory):
+    id_filter = JobIdFilter(capacity=64, bind=pg_engine)
+    _load(id_filter)
+    with pg_session_factory() as db:
+        _insert(db, [f"g{i}" for i in range(100)])
+    id_filter.add_many(f"g{i}" for i in range(100))
+    id_filter._thread.join(10)
+    assert id_filter.stats()["capacity"] >= 128
+    assert all(id_filter.might_contain(f"g{i}") for i in range(100))
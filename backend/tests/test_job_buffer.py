@@ -0,0 +1,106 @@
+import asyncio
+import logging
+import os
+import stat
+from datetime import datetime
+
+import pytest
+from sqlalchemy import func, select
+
+from app import crud, models, schemas
+from app.services.job_buffer import JobWriteBuffer
+
+
+def _job(i) -> schemas.JobCreate:
+    return schemas.JobCreate(
+        external_job_id=f"wb-{i}", timestamp=datetime(2026, 10, 1, 9, i % 60), pickup_lat=12.9, pickup_lng=77.5,
+        dropoff_lat=12.95, dropoff_lng=77.55, energy_kwh=1.0, price_usd=20.0, zone="1",
+    )
+
+
+def _append_all(buffer, jobs):
+    async def run():
+        return await asyncio.gather(*(buffer.append(j) for j in jobs))
+    return asyncio.run(run())
+
+
+def _count(session_factory) -> int:
+    with session_factory() as db:
+        return db.scalar(select(func.count()).select_from(models.Job))
+
+
+def _segments(buffer_dir) -> list[str]:
+    return sorted(n for n in os.listdir(buffer_dir) if n.endswith(".jsonl"))
+
+
+@pytest.fixture
+def fsyncs(monkeypatch):
+    """Records ("file" | "dir") for every os.fsync."""
+    calls = []
+    real = os.fsync
+
+    def fsync(fd):
+        calls.append("dir" if stat.S_ISDIR(os.fstat(fd).st_mode) else "file")
+        real(fd)
+
+    monkeypatch.setattr(os, "fsync", fsync)
+    return calls
+
+
+def test_group_commit_then_flush(tmp_path, pg_session_factory, fsyncs):
+    buffer = JobWriteBuffer(str(tmp_path), batch_size=1000, flush_interval_s=0.05, session_factory=pg_session_factory)
+    buffer.start()
+    # the new segment's directory entry is durable before anything is acknowledged
+    assert fsyncs and fsyncs[-1] == "dir"
+    jobs = [_job(i) for i in range(50)]
+    assert _append_all(buffer, jobs) == [True] * 50
+    # one fsync acknowledges every job waiting at the time
+    assert 1 <= fsyncs.count("file") < len(jobs)
+    # still waiting to be flushed: a second POST of the same id is refused
+    assert _append_all(buffer, [_job(0)]) == [False]
+    buffer.close()
+
+    assert _count(pg_session_factory) == 50
+    stats = buffer.stats()
+    assert (stats["accepted"], stats["flushed"], stats["pending"]) == (50, 50, 0)
+    assert _segments(buffer.dir) == []
+
+
+def test_replay_after_crash(tmp_path, pg_session_factory):
+    def down():
+        raise ConnectionError("database is down")
+
+    crashed = JobWriteBuffer(str(tmp_path), flush_interval_s=0.01, session_factory=down)
+    crashed.start()
+    assert all(_append_all(crashed, [_job(i) for i in range(20)]))
+    crashed.close(timeout_s=5)
+    # acknowledged but never flushed; a crash mid-append leaves a torn last line
+    left = _segments(crashed.dir)
+    assert left
+    with open(os.path.join(crashed.dir, left[-1]), "ab") as f:
+        f.write(b'{"external_job_id": "wb-torn", "timest')
+
+    restarted = JobWriteBuffer(str(tmp_path), flush_interval_s=0.01, session_factory=pg_session_factory)
+    restarted.start()
+    assert restarted.dir == crashed.dir
+    restarted.close()
+
+    assert restarted.stats()["replayed"] == 20
+    assert _count(pg_session_factory) == 20
+    assert _segments(restarted.dir) == []
+
+
+def test_jobs_already_in_postgres_are_counted_and_logged(tmp_path, pg_session_factory, caplog):
+    with pg_session_factory() as db:
+        crud.create_job(db, _job(1))
+    buffer = JobWriteBuffer(str(tmp_path), flush_interval_s=0.01, session_factory=pg_session_factory)
+    buffer.start()
+    # acknowledged: the buffer does not look the id up in Postgres
+    assert _append_all(buffer, [_job(1), _job(2)]) == [True, True]
+    with caplog.at_level(logging.WARNING, logger="job_buffer"):
+        buffer.close()
+
+    stats = buffer.stats()
+    assert (stats["flushed"], stats["skipped_existing"]) == (1, 1)
+    assert "wb-1" in caplog.text
+    assert _count(pg_session_factory) == 2
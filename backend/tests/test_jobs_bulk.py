@@ -0,0 +1,82 @@
+import json
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import func, select
+
+from app import models
+from app.db import get_db
+from app.routes import jobs as jobs_routes
+
+NDJSON = {"content-type": "application/x-ndjson"}
+
+
+def _job(i, **overrides):
+    return {
+        "external_job_id": f"b{i:03d}", "timestamp": "2026-10-01T08:00:00", "pickup_lat": 12.9, "pickup_lng": 77.5,
+        "dropoff_lat": 12.95, "dropoff_lng": 77.55, "energy_kwh": 1.5, "zone": "z1", **overrides,
+    }
+
+
+@pytest.fixture
+def client(pg_session_factory, monkeypatch):
+    db = pg_session_factory()
+    app = FastAPI()
+    app.include_router(jobs_routes.router)
+    app.dependency_overrides[get_db] = lambda: db
+    # several COPY batches per request
+    monkeypatch.setattr(jobs_routes, "BULK_BATCH_SIZE", 4)
+    yield TestClient(app)
+    db.close()
+
+
+def _stored(pg_session_factory):
+    with pg_session_factory() as db:
+        return db.scalar(select(func.count()).select_from(models.Job))
+
+
+def test_ndjson_body_reports_each_line(client, pg_session_factory):
+    lines = [json.dumps(_job(i)) for i in range(10)]
+    lines[3] = "{not json"
+    lines[5] = json.dumps(_job(5, pickup_lat="north"))
+    lines.insert(7, "")  # blank lines are skipped, not counted
+    lines.append(json.dumps(_job(1)))  # repeated within the body
+    res = client.post("/jobs/bulk", content="\n".join(lines).encode(), headers=NDJSON)
+    assert res.status_code == 200
+    body = res.json()
+    assert (body["total"], body["created"], body["duplicate"], body["invalid"]) == (11, 8, 1, 2)
+    assert [r["index"] for r in body["results"]] == list(range(11))
+    assert "line 4: invalid JSON" in body["results"][3]["error"]
+    assert body["results"][5]["external_job_id"] == "b005" and "pickup_lat" in body["results"][5]["error"]
+    assert body["results"][10] == {"index": 10, "external_job_id": "b001", "status": "duplicate", "error": None}
+    assert _stored(pg_session_factory) == 8
+
+
+def test_ndjson_chunked_upload_and_repeat_is_all_duplicates(client, pg_session_factory):
+    payload = b"".join(json.dumps(_job(i)).encode() + b"\n" for i in range(9))
+
+    def chunks():
+        # split mid-line so the route has to carry partial lines between chunks
+        for start in range(0, len(payload), 37):
+            yield payload[start:start + 37]
+
+    assert client.post("/jobs/bulk", content=chunks(), headers=NDJSON).json()["created"] == 9
+    again = client.post("/jobs/bulk", content=payload, headers=NDJSON).json()
+    assert (again["created"], again["duplicate"]) == (0, 9)
+    assert _stored(pg_session_factory) == 9
+
+
+def test_bad_utf8_line_is_invalid(client):
+    body = json.dumps(_job(0)).encode() + b"\n{\"external_job_id\": \"\xc3\x28\"}\n" + json.dumps(_job(1)).encode()
+    res = client.post("/jobs/bulk", content=body, headers=NDJSON).json()
+    assert [r["status"] for r in res["results"]] == ["created", "invalid", "created"]
+    assert "line 2: invalid UTF-8" in res["results"][1]["error"]
+
+
+def test_json_array_body(client, pg_session_factory):
+    res = client.post("/jobs/bulk", json=[_job(i) for i in range(6)] + [{"external_job_id": "x"}])
+    assert (res.json()["created"], res.json()["invalid"]) == (6, 1)
+    assert _stored(pg_session_factory) == 6
+    assert client.post("/jobs/bulk", json=_job(0)).status_code == 422
+    assert client.post("/jobs/bulk", content=b"[{", headers={"content-type": "application/json"}).status_code == 400
@@ -0,0 +1,96 @@
+import os
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, inspect, text
+
+from app import crud, schemas
+from app.config import settings
+from app.db import Base, get_async_read_db
+from app.routes import jobs as jobs_routes
+
+T0 = datetime(2026, 10, 1, 8, 0)
+
+
+@pytest.fixture
+def jobs_db(pg_session_factory):
+    with pg_session_factory() as db:
+        crud.bulk_insert_jobs(db, (crud.job_row(schemas.JobCreate(
+            external_job_id=f"f{i:02d}", timestamp=T0 + timedelta(hours=i), pickup_lat=12.9, pickup_lng=77.5,
+            dropoff_lat=12.95, dropoff_lng=77.55, energy_kwh=1.0, zone=("z1", "z2", None)[i % 3],
+        )) for i in range(12)))
+        yield db
+
+
+def _ids(jobs):
+    return [j.external_job_id for j in jobs]
+
+
+def test_time_range_is_half_open(jobs_db):
+    assert _ids(crud.list_jobs(jobs_db, since=T0 + timedelta(hours=2), until=T0 + timedelta(hours=5))) == ["f02", "f03", "f04"]
+    assert _ids(crud.list_jobs(jobs_db, since=T0 + timedelta(hours=10, minutes=1))) == ["f11"]
+    assert _ids(crud.list_jobs(jobs_db, until=T0 + timedelta(hours=1))) == ["f00"]
+
+
+def test_zone_filter_combines_with_time_and_keyset(jobs_db):
+    z1 = crud.list_jobs(jobs_db, zone="z1", since=T0 + timedelta(hours=1))
+    assert _ids(z1) == ["f03", "f06", "f09"]
+    after = (z1[0].timestamp, z1[0].id)
+    assert _ids(crud.list_jobs(jobs_db, zone="z1", since=T0 + timedelta(hours=1), after=after)) == ["f06", "f09"]
+    exported = [row["external_job_id"] for row in crud.iter_jobs(jobs_db, zone="z1", since=T0 + timedelta(hours=1))]
+    assert exported == _ids(z1)
+
+
+def test_route_normalises_aware_timestamps(jobs_db, pg_async_session_factory):
+    async def read_db():
+        async with pg_async_session_factory() as db:
+            yield db
+
+    app = FastAPI()
+    app.include_router(jobs_routes.router)
+    app.dependency_overrides[get_async_read_db] = read_db
+    # 10:00+02:00 is 08:00 UTC, the first job's (naive UTC) timestamp
+    res = TestClient(app).get("/jobs", params={"since": "2026-10-01T10:00:00+02:00", "until": "2026-10-01T10:00:00Z"})
+    assert res.status_code == 200
+    assert [j["external_job_id"] for j in res.json()] == ["f00", "f01"]
+
+
+def test_filtered_listing_uses_the_composite_index(jobs_db):
+    jobs_db.execute(text("SET LOCAL enable_seqscan = off"))
+    plan = "\n".join(jobs_db.execute(text(
+        "EXPLAIN SELECT * FROM jobs WHERE zone = 'z1' AND timestamp >= :since ORDER BY timestamp, id LIMIT 10"
+    ), {"since": T0}).scalars())
+    assert "ix_jobs_zone_timestamp_id" in plan
+
+
+def test_migrations_build_the_models_schema(pg_engine, monkeypatch):
+    from alembic import command
+    from alembic.config import Config
+
+    schema = f"mig_{uuid.uuid4().hex[:8]}"
+    admin = create_engine(os.environ["TEST_DATABASE_URL"])
+    with admin.begin() as conn:
+        conn.execute(text(f'CREATE SCHEMA "{schema}"'))
+    # the migrations connect through settings.database_url
+    url = pg_engine.url.update_query_dict({"options": f"-csearch_path={schema}"})
+    monkeypatch.setattr(settings, "database_url", url.render_as_string(hide_password=False))
+    cfg = Config()
+    cfg.set_main_option("script_location", os.path.join(os.path.dirname(__file__), "..", "alembic"))
+    engine = create_engine(settings.database_url)
+    try:
+        command.upgrade(cfg, "head")
+        insp = inspect(engine)
+        assert set(insp.get_table_names()) - {"alembic_version"} == set(Base.metadata.tables)
+        for name, table in Base.metadata.tables.items():
+            assert {c["name"] for c in insp.get_columns(name)} == set(table.columns.keys()), name
+            assert {i["name"] for i in insp.get_indexes(name)} >= {i.name for i in table.indexes}, name
+        command.downgrade(cfg, "base")
+        assert inspect(engine).get_table_names() == ["alembic_version"]
+    finally:
+        engine.dispose()
+        with admin.begin() as conn:
+            conn.execute(text(f'DROP SCHEMA "{schema}" CASCADE'))
+        admin.dispose()
@@ -0,0 +1,75 @@
+import json
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app import crud, schemas
+from app.db import get_async_read_db
+from app.routes import jobs as jobs_routes
+
+T0 = datetime(2026, 10, 1, 8, 0)
+
+
+@pytest.fixture
+def client(pg_session_factory, pg_async_session_factory, monkeypatch):
+    with pg_session_factory() as db:
+        rows = []
+        for i in range(12):
+            # pairs share a timestamp, so the id has to break the tie
+            rows.append(crud.job_row(schemas.JobCreate(
+                external_job_id=f"k{i:02d}", timestamp=T0 + timedelta(minutes=10 * (i // 2)), pickup_lat=12.9,
+                pickup_lng=77.5, dropoff_lat=12.95, dropoff_lng=77.55, energy_kwh=1.0, zone="z1" if i % 3 else "z2",
+            )))
+        crud.bulk_insert_jobs(db, reversed(rows))
+
+    async def read_db():
+        async with pg_async_session_factory() as db:
+            yield db
+
+    app = FastAPI()
+    app.include_router(jobs_routes.router)
+    app.dependency_overrides[get_async_read_db] = read_db
+    monkeypatch.setattr(jobs_routes, "read_async_sessionmaker", lambda: pg_async_session_factory)
+    return TestClient(app)
+
+
+def _pages(client, **params):
+    seen, cursor, pages = [], None, 0
+    while True:
+        res = client.get("/jobs/", params={**params, **({"cursor": cursor} if cursor else {})})
+        assert res.status_code == 200
+        seen += [j["external_job_id"] for j in res.json()]
+        pages += 1
+        cursor = res.headers.get("X-Next-Cursor")
+        if cursor is None:
+            return seen, pages
+
+
+def test_cursor_walks_every_job_once_in_timestamp_id_order(client):
+    seen, pages = _pages(client, limit=5)
+    # inserted newest first: within a timestamp the higher id is the earlier job
+    assert seen == [f"k{i:02d}" for pair in range(6) for i in (2 * pair + 1, 2 * pair)]
+    assert len(set(seen)) == 12 and pages == 3
+
+
+def test_cursor_with_filters(client):
+    since, until = (T0 + timedelta(minutes=10)).isoformat(), (T0 + timedelta(minutes=50)).isoformat()
+    seen, _ = _pages(client, limit=2, since=since, until=until, zone="z1")
+    listed = client.get("/jobs/", params={"limit": 100, "since": since, "until": until, "zone": "z1"}).json()
+    assert seen == [j["external_job_id"] for j in listed]
+    assert seen and all(j["zone"] == "z1" and since <= j["timestamp"] < until for j in listed)
+
+
+def test_bad_cursor_is_a_400(client):
+    assert client.get("/jobs/", params={"cursor": "not-a-cursor"}).status_code == 400
+
+
+def test_streamed_export_resumes_after_a_cursor(client):
+    first = client.get("/jobs/", params={"limit": 4})
+    lines = client.get("/jobs/", params={"format": "ndjson", "cursor": first.headers["X-Next-Cursor"]}).text.splitlines()
+    rest = [json.loads(line)["external_job_id"] for line in lines]
+    assert [j["external_job_id"] for j in first.json()] + rest == _pages(client, limit=100)[0]
+    csv_lines = client.get("/jobs/", params={"format": "csv"}).text.splitlines()
+    assert csv_lines[0].startswith("external_job_id,") and len(csv_lines) == 13
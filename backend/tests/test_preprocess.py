@@ -0,0 +1,86 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.services import preprocess
+
+NOW = pd.Timestamp("2026-10-19 12:00", tz="UTC")
+
+
+@pytest.fixture(autouse=True)
+def fixed_now(monkeypatch):
+    # rows without created_at or year/month fall back to the run's "now"
+    monkeypatch.setattr(preprocess, "_utcnow", lambda: NOW)
+
+
+def _export(n: int = 1000, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        "order_id": [f"o{i}" for i in range(n)],
+        "cee_id": rng.integers(1, 50, n).astype(float),
+        "year": 2025,
+        "month": rng.integers(1, 13, n).astype(float),
+        "week": rng.integers(1, 53, n),
+        "created_at": pd.Timestamp("2025-06-01", tz="UTC") + pd.to_timedelta(rng.integers(0, 10**6, n), unit="s"),
+        "pickup_lat": rng.uniform(12.8, 13.1, n),
+        "pickup_lng": rng.uniform(77.4, 77.8, n),
+        "drop_lat": rng.uniform(12.8, 13.1, n),
+        "drop_lng": rng.uniform(77.4, 77.8, n),
+        "base_pay": rng.uniform(10, 90, n),
+    })
+    df.loc[rng.choice(n, 40, replace=False), "cee_id"] = np.nan
+    # whole chunks and scattered rows without ids / timestamps, some without year/month too
+    df.loc[200:399, "order_id"] = None
+    df.loc[rng.choice(n, 25, replace=False), "order_id"] = None
+    df.loc[500:699, "created_at"] = None
+    df.loc[650:749, "month"] = np.nan
+    # a re-sent job: the later row wins in both paths
+    df.loc[900, "order_id"] = "o10"
+    return df
+
+
+def _by_id(df: pd.DataFrame) -> pd.DataFrame:
+    return df.sort_values("job_id").reset_index(drop=True)
+
+
+@pytest.mark.parametrize("columns", ["all", "no_ids", "no_created_at"])
+def test_chunked_matches_unchunked(tmp_path, columns):
+    df = _export()
+    if columns == "no_ids":
+        df = df.drop(columns="order_id")
+    elif columns == "no_created_at":
+        df = df.drop(columns="created_at")
+    src = tmp_path / "export.csv"
+    df.to_csv(src, index=False)
+
+    whole = preprocess.preprocess_dataset(str(src), str(tmp_path / "whole.parquet"), chunk_rows=0).read()
+    chunked = pd.read_parquet(preprocess.run_preprocess(str(src), str(tmp_path / "chunked.parquet"), chunk_rows=128))
+
+    assert whole["job_id"].notna().all()
+    assert whole["created_at"].notna().all()
+    pd.testing.assert_frame_equal(_by_id(whole), _by_id(chunked))
+
+
+def test_synthesized_values_follow_row_positions():
+    df = _export(50).drop(columns="order_id")
+    df.loc[10:19, ["created_at", "month"]] = np.nan
+    whole = preprocess.clean_dataframe(df)
+    parts = pd.concat([preprocess.clean_dataframe(df.iloc[i:i + 7], row_offset=i) for i in range(0, len(df), 7)])
+    pd.testing.assert_frame_equal(_by_id(whole), _by_id(parts))
+    row15 = whole[whole["job_id"].str.endswith("-15")]
+    assert len(row15) == 1 and row15["created_at"].iloc[0] == NOW
+
+
+def test_distance_matches_the_row_wise_haversine():
+    df = _export(200).head(200).assign(order_id=[f"o{i}" for i in range(200)])
+    df["pickup_lat"] = df["pickup_lat"].astype(object)
+    df.loc[5, "pickup_lat"] = "n/a"
+    df.loc[6, "drop_lng"] = np.nan
+    clean = preprocess.clean_dataframe(df).set_index("job_id")
+    rows = df.set_index("order_id").loc[clean.index]
+    expected = [
+        preprocess.haversine(*(pd.to_numeric(v, errors="coerce") for v in r))
+        for r in rows[["pickup_lat", "pickup_lng", "drop_lat", "drop_lng"]].itertuples(index=False)
+    ]
+    np.testing.assert_allclose(clean["distance_km"].to_numpy(), expected, rtol=1e-12)
+    assert clean["distance_km"].isna().sum() == 2
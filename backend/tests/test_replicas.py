@@ -0,0 +1,87 @@
+import asyncio
+import os
+
+import pytest
+from sqlalchemy import text
+
+from app import db as db_module
+from app.db import ReplicaSet
+
+DOWN_URL = "postgresql+psycopg://postgres@/postgres?host=/tmp/no-such-replica&connect_timeout=1"
+
+
+@pytest.fixture
+def replicas(pg_engine, monkeypatch):
+    """replica0 is the test database, replica1 never answers."""
+    rs = ReplicaSet([os.environ["TEST_DATABASE_URL"], DOWN_URL], check_interval_s=3600)
+    monkeypatch.setattr(db_module, "_replicas", rs)
+    yield rs
+    asyncio.run(db_module.shutdown_replicas())
+
+
+def test_probe_takes_failing_replicas_out_of_rotation(replicas):
+    up, down = replicas.replicas
+    assert [r.name for r in replicas.in_turn()] == ["replica0", "replica1"]
+    replicas.check()
+    assert up.healthy and up.lag_s == 0.0
+    assert not down.healthy and down.last_error
+    assert [r.name for r in replicas.in_turn()] == ["replica0"]
+    status = db_module.pool_stats()
+    assert status["replica1"]["healthy"] is False and status["replica0"]["healthy"] is True
+
+
+def test_lagging_replica_is_dropped_until_it_catches_up(replicas, monkeypatch):
+    up = replicas.replicas[0]
+    replicas.max_lag_s = 30
+    monkeypatch.setattr(db_module, "_LAG_SQL", text("SELECT 45.0"))
+    replicas.check()
+    assert not up.healthy and "lag 45.0s" in up.last_error
+    monkeypatch.setattr(db_module, "_LAG_SQL", text("SELECT 2.0"))
+    replicas.check()
+    assert up.healthy and up.last_error is None
+
+
+def test_round_robin_over_healthy_replicas(replicas):
+    replicas.replicas[1].healthy = True
+    firsts = [replicas.in_turn()[0].name for _ in range(4)]
+    assert firsts == ["replica0", "replica1", "replica0", "replica1"]
+
+
+def test_reads_skip_an_unreachable_replica(replicas, pg_session_factory, monkeypatch):
+    primary = []
+
+    def get_db():
+        primary.append(1)
+        with pg_session_factory() as s:
+            yield s
+
+    monkeypatch.setattr(db_module, "get_db", get_db)
+    # replica1 is picked first and fails on connect: marked down, replica0 serves the read
+    next(replicas._next)
+    gen = db_module.get_read_db()
+    session = next(gen)
+    assert session.get_bind() is replicas.replicas[0].engine and session.execute(text("SELECT 1")).scalar() == 1
+    gen.close()
+    assert not replicas.replicas[1].healthy and primary == []
+    # nothing healthy left: the primary
+    replicas.replicas[0].healthy = False
+    gen = db_module.get_read_db()
+    next(gen)
+    gen.close()
+    assert primary == [1]
+
+
+def test_async_reads_fall_back_to_the_primary(replicas, pg_async_session_factory, monkeypatch):
+    monkeypatch.setattr(db_module, "AsyncSessionLocal", pg_async_session_factory)
+    replicas.replicas[0].healthy = False
+
+    async def main():
+        gen = db_module.get_async_read_db()
+        session = await gen.__anext__()
+        value = (await session.execute(text("SELECT 1"))).scalar()
+        await gen.aclose()
+        return session, value
+
+    session, value = asyncio.run(main())
+    assert value == 1 and not replicas.replicas[1].healthy
+    assert db_module.read_async_sessionmaker() is pg_async_session_factory
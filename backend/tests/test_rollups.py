@@ -0,0 +1,85 @@
+from datetime import datetime
+
+import pandas as pd
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app import crud, schemas
+from app.db import get_read_db
+from app.routes import stores, zones
+from app.services import etl, rollups
+
+
+def _frame():
+    return pd.DataFrame({
+        "job_id": ["e1", "e2", "e3"],
+        "created_at": pd.to_datetime(["2026-10-01 09:10", "2026-10-01 09:40", "2026-10-01 11:05"]),
+        "pickup_lat": [12.97, 12.98, 12.99],
+        "pickup_lng": [77.59, 77.60, 77.61],
+        "zone_id": [3, 3, 5],
+        "store": ["S1", "S1", "S2"],
+        "base_payout": [40.0, 50.0, 60.0],
+        "final_payout": [45.0, 55.0, 70.0],
+        "energy_kwh": [1.0, 2.0, 3.0],
+    })
+
+
+@pytest.fixture
+def db(pg_session_factory, monkeypatch):
+    monkeypatch.setattr(etl, "SessionLocal", pg_session_factory)
+    with pg_session_factory() as session:
+        yield session
+
+
+def _api_job(db, external_job_id="api-1", zone="3"):
+    crud.create_job(db, schemas.JobCreate(
+        external_job_id=external_job_id, timestamp=datetime(2026, 10, 1, 9, 30), pickup_lat=12.9, pickup_lng=77.5,
+        dropoff_lat=12.95, dropoff_lng=77.55, energy_kwh=4.0, price_usd=30.0, zone=zone,
+    ))
+
+
+def test_first_ingest_seeds_despite_earlier_api_jobs(db):
+    # jobs loaded before the rollups existed, then one created through the API
+    loaded, _ = etl.jobs_frame_to_records(_frame().iloc[:2])
+    crud.bulk_insert_jobs(db, etl._rows(loaded))
+    _api_job(db)
+    # API jobs alone are not a seed
+    assert rollups.summarize(db, rollups.ZONE, "3") is None
+
+    assert etl.ingest_dataframe(_frame())["inserted"] == 1
+    zone = rollups.summarize(db, rollups.ZONE, "3")
+    assert zone["demand_jobs"] == 3
+    assert zone["total_final_payout"] == 45.0 + 55.0 + 30.0
+    assert zone["total_base_payout"] == 90.0
+    assert zone["total_energy_kwh"] == 7.0
+    assert rollups.summarize(db, rollups.ZONE, "5")["demand_jobs"] == 1
+    assert rollups.summarize(db, rollups.STORE, "S1")["total_base_payout"] == 90.0
+
+
+def test_ingest_after_seed_only_adds_new_jobs(db):
+    etl.ingest_dataframe(_frame())
+    _api_job(db)
+    more = pd.concat([_frame(), _frame().iloc[[2]].assign(job_id="e4")], ignore_index=True)
+    assert etl.ingest_dataframe(more)["inserted"] == 1
+    assert rollups.summarize(db, rollups.ZONE, "3")["demand_jobs"] == 3
+    assert rollups.summarize(db, rollups.ZONE, "5")["demand_jobs"] == 2
+    assert rollups.summarize(db, rollups.STORE, "S2")["total_final_payout"] == 140.0
+
+
+def test_summary_routes(db, pg_session_factory):
+    etl.ingest_dataframe(_frame())
+    app = FastAPI()
+    app.include_router(zones.router)
+    app.include_router(stores.router)
+    app.dependency_overrides[get_read_db] = lambda: db
+    client = TestClient(app)
+
+    res = client.get("/zones/3/summary")
+    assert res.status_code == 200
+    assert (res.json()["demand_jobs"], res.json()["total_final_payout"]) == (2, 100.0)
+    assert client.get("/stores/S2/summary").json()["demand_jobs"] == 1
+    for path in ("/zones/99/summary", "/stores/nowhere/summary"):
+        res = client.get(path)
+        assert res.status_code == 200
+        assert res.json()["demand_jobs"] == 0
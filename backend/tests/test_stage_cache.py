@@ -0,0 +1,101 @@
+import os
+
+import pandas as pd
+import pytest
+
+from app.services import preprocess, stage_cache
+from app.services.stage_cache import StageCache
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return StageCache(str(tmp_path / "cache"), max_bytes=1 << 20)
+
+
+def _write(path, text):
+    path.write_text(text)
+    return str(path)
+
+
+def test_key_follows_code_inputs_and_params(tmp_path, cache, monkeypatch):
+    code = _write(tmp_path / "stage.py", "v1")
+    data = _write(tmp_path / "in.csv", "a\n1\n")
+    key = cache.key("s", code=[code], inputs=[data], params={"k": 8})
+    assert cache.key("s", code=[code], inputs=[data], params={"k": 8}) == key
+    assert cache.key("s", code=[code], inputs=[data], params={"k": 9}) != key
+    assert cache.key("other", code=[code], inputs=[data], params={"k": 8}) != key
+    _write(tmp_path / "stage.py", "v2")
+    assert cache.key("s", code=[code], inputs=[data], params={"k": 8}) != key
+    _write(tmp_path / "in.csv", "a\n2\n")
+    changed = cache.key("s", code=[code], inputs=[data], params={"k": 8})
+    assert changed != key
+    # unchanged files are recognised by size and mtime, not re-read
+    monkeypatch.setattr(stage_cache, "_hash_file", lambda path: pytest.fail(f"re-hashed {path}"))
+    assert StageCache(cache.root, cache.max_bytes).key("s", code=[code], inputs=[data], params={"k": 8}) == changed
+    assert cache.digest(str(tmp_path / "missing")) == "absent"
+
+
+def test_store_then_restore(tmp_path, cache):
+    out = tmp_path / "out.csv"
+    assert not cache.restore("s", ["k1"], [str(out)])
+    _write(out, "result")
+    cache.store("s", "k1", [str(out)], aliases=["a1"])
+    out.unlink()
+    assert cache.restore("s", ["k1"], [str(out)]) and out.read_text() == "result"
+    # found through an alias, and a later key in the list
+    other = tmp_path / "other.csv"
+    assert cache.restore("s", ["nope", "a1"], [str(other)]) and other.read_text() == "result"
+    assert cache.stats()["hits"] == 2 and cache.stats()["misses"] == 1
+
+
+def test_unusable_entries_are_misses(tmp_path, cache):
+    out = _write(tmp_path / "out.csv", "result")
+    cache.store("s", "k1", [out])
+    assert not cache.restore("s", ["k1"], [out, str(tmp_path / "second.csv")])
+    with open(os.path.join(cache.root, "k1", "meta.json"), "w") as f:
+        f.write("{truncated")
+    assert not cache.restore("s", ["k1"], [out])
+    assert cache.misses == 2 and cache.hits == 0
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = StageCache(str(tmp_path / "cache"), max_bytes=250)
+    out = tmp_path / "out.bin"
+    for i, key in enumerate(["old", "used", "new"]):
+        out.write_bytes(b"x" * 100)
+        cache.store("s", key, [str(out)], aliases=[f"alias-{key}"])
+        # mtimes are the LRU clock; spread them out so the order doesn't hinge on timer resolution
+        os.utime(os.path.join(cache.root, key, "meta.json"), (1000 + i, 1000 + i))
+        if key == "used":
+            assert cache.restore("s", ["old"], [str(out)])
+    # "old" was restored after "used" was stored, then "new" pushed the total over 250 bytes
+    assert not os.path.exists(os.path.join(cache.root, "used"))
+    assert cache.restore("s", ["old"], [str(out)]) and cache.restore("s", ["new"], [str(out)])
+    assert not os.path.exists(os.path.join(cache.root, "aliases", "alias-used"))
+
+
+def test_disabled_cache_stores_nothing(tmp_path):
+    cache = StageCache(str(tmp_path / "cache"), max_bytes=0)
+    cache.store("s", "k1", [_write(tmp_path / "out.csv", "result")])
+    assert not os.path.exists(os.path.join(cache.root, "k1"))
+
+
+def test_preprocess_reuses_its_output(tmp_path, cache, monkeypatch):
+    monkeypatch.setattr(preprocess, "get_stage_cache", lambda: cache)
+    src = tmp_path / "export.csv"
+    pd.DataFrame({
+        "order_id": ["o1", "o2"], "created_at": ["2026-01-01T08:00:00Z", "2026-01-02T08:00:00Z"],
+        "pickup_lat": [12.9, 12.95], "pickup_lng": [77.5, 77.6], "drop_lat": [13.0, 12.9], "drop_lng": [77.6, 77.5],
+    }).to_csv(src, index=False)
+    out = str(tmp_path / "clean.parquet")
+
+    first = preprocess.preprocess_dataset(str(src), out).read()
+    os.remove(out)
+    monkeypatch.setattr(preprocess, "_preprocess_dataset", lambda *a: pytest.fail("recomputed"))
+    pd.testing.assert_frame_equal(preprocess.preprocess_dataset(str(src), out).read(), first)
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    monkeypatch.undo()
+    monkeypatch.setattr(preprocess, "get_stage_cache", lambda: cache)
+    preprocess.preprocess_dataset(str(src), out, force=True)
+    assert cache.hits == 1
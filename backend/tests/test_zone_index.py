@@ -0,0 +1,89 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app import schemas
+from app.services import zone_index
+from app.services.datasets import write_dataset
+from app.services.geo import haversine_np
+from app.services.zone_index import ZoneIndex, ZoneIndexHolder, fill_zones
+
+rng = np.random.default_rng(3)
+
+
+def _zones(n, seed=0):
+    r = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "zone_id": np.arange(100, 100 + n),
+        "centroid_lat": r.uniform(12.8, 13.2, n),
+        "centroid_lng": r.uniform(77.4, 77.8, n),
+    })
+
+
+def _brute_force(zones, lats, lngs):
+    d = haversine_np(lats[:, None], lngs[:, None], zones["centroid_lat"].to_numpy(), zones["centroid_lng"].to_numpy())
+    return zones["zone_id"].to_numpy()[d.argmin(axis=1)]
+
+
+# few zones take the plain loop, many go through the BallTree
+@pytest.mark.parametrize("n_zones", [5, 200])
+@pytest.mark.parametrize("n_points", [3, 500])
+def test_nearest_matches_a_brute_force_search(n_zones, n_points):
+    zones = _zones(n_zones)
+    index = ZoneIndex(zones)
+    lats, lngs = rng.uniform(12.7, 13.3, n_points), rng.uniform(77.3, 77.9, n_points)
+    expected = _brute_force(zones, lats, lngs)
+    assert index.nearest_many(lats, lngs).tolist() == expected.tolist()
+    assert [index.nearest(a, b) for a, b in zip(lats, lngs)] == expected.tolist()
+
+
+def test_missing_coordinates_and_zones():
+    index = ZoneIndex(pd.concat([_zones(3), pd.DataFrame({"zone_id": [None], "centroid_lat": [13.0], "centroid_lng": [77.5]})]))
+    assert len(index) == 3
+    assert index.nearest(float("nan"), 77.5) is None
+    out = index.nearest_many([12.9, np.nan, 13.0], [77.5, 77.5, np.inf])
+    assert str(out.dtype) == "Int64" and out.isna().tolist() == [False, True, True]
+    empty = ZoneIndex(_zones(0))
+    assert empty.nearest(12.9, 77.5) is None
+    assert empty.nearest_many([12.9], [77.5]).isna().all()
+
+
+def test_holder_picks_up_a_new_zones_file(tmp_path):
+    path = tmp_path / "zones.csv"
+    holder = ZoneIndexHolder(path, check_interval_s=0)
+    assert holder.get() is None
+    write_dataset(_zones(3), path)
+    first = holder.get()
+    assert len(first) == 3 and holder.get() is first
+    write_dataset(_zones(7, seed=1), path)
+    # same size and mtime would look unchanged; make sure this one doesn't
+    st = os.stat(tmp_path / "zones.parquet")
+    os.utime(tmp_path / "zones.parquet", ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    assert len(holder.get()) == 7
+    assert holder.stats()["builds"] == 2 and holder.stats()["zones"] == 7
+
+
+def test_holder_checks_the_file_at_most_once_per_interval(tmp_path):
+    path = tmp_path / "zones.csv"
+    write_dataset(_zones(3), path)
+    holder = ZoneIndexHolder(path, check_interval_s=3600)
+    index = holder.get()
+    os.remove(tmp_path / "zones.parquet")
+    assert holder.get() is index
+
+
+def test_fill_zones_only_fills_missing_ones(monkeypatch):
+    zones = _zones(4)
+    monkeypatch.setattr(zone_index, "get_zone_index", lambda: ZoneIndex(zones))
+    jobs = [schemas.JobCreate(
+        external_job_id=f"z{i}", timestamp="2026-10-01T08:00:00", pickup_lat=lat, pickup_lng=lng,
+        dropoff_lat=12.95, dropoff_lng=77.55, energy_kwh=1.0, zone=zone,
+    ) for i, (lat, lng, zone) in enumerate([(12.9, 77.5, None), (13.1, 77.7, "custom"), (13.0, 77.45, None)])]
+    filled = fill_zones(jobs)
+    expected = _brute_force(zones, np.array([12.9, 13.0]), np.array([77.5, 77.45]))
+    assert [j.zone for j in filled] == [str(expected[0]), "custom", str(expected[1])]
+    assert jobs[0].zone is None
+    # a single missing zone takes the scalar path
+    assert fill_zones(jobs[:1])[0].zone == str(expected[0])
@@ -0,0 +1,43 @@
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.metrics import pairwise_distances_argmin
+
+from app.services import zones
+from app.services.zone_index import ZoneIndex
+
+
+def _jobs(n: int, seed: int = 0, first: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "job_id": [f"j{i}" for i in range(first, first + n)],
+        "pickup_lat": rng.uniform(59.5, 61.5, n),
+        "pickup_lng": rng.uniform(9.5, 11.5, n),
+    })
+
+
+def test_label_uses_great_circle_distance():
+    centroids, ids = np.array([[60.0, 10.0], [61.0, 11.0]]), np.array([7, 9])
+    # a degree of longitude is half a degree of latitude up here: nearer 7, though not in (lat, lng) degrees
+    point = pd.DataFrame({"pickup_lat": [60.4, np.nan], "pickup_lng": [10.9, 10.0]})
+    assert ids[pairwise_distances_argmin(point.iloc[:1].to_numpy(), centroids)[0]] == 9
+
+    labeled = zones._label(point, zones._zone_index(centroids, ids))
+    assert labeled["zone_id"].iloc[0] == 7
+    assert pd.isna(labeled["zone_id"].iloc[1])
+    assert zones._label(point.copy(), None)["zone_id"].isna().all()
+
+
+@pytest.mark.parametrize("mode", ["full", "incremental"])
+def test_etl_labels_match_live_assignment(tmp_path, mode):
+    clean, zoned, zones_out = (str(tmp_path / f) for f in ("clean.parquet", "jobs_zoned.parquet", "zones.parquet"))
+    _jobs(500).to_parquet(clean)
+    zones.cluster_jobs(clean, k=6, jobs_zoned_out=zoned, zones_out=zones_out, mode=mode)
+    index = ZoneIndex.load(zones_out)
+    labeled = pd.read_parquet(zoned)
+    live = index.nearest_many(labeled["pickup_lat"], labeled["pickup_lng"])
+    assert (labeled["zone_id"].to_numpy() == live.to_numpy()).all()
+
+    new = _jobs(200, seed=1, first=500)
+    zones.zone_new_jobs(new, jobs_zoned_out=zoned, zones_out=zones_out)
+    assert (new["zone_id"].to_numpy() == index.nearest_many(new["pickup_lat"], new["pickup_lng"]).to_numpy()).all()